@@ -0,0 +1,2 @@
+# Бенчмарки горячих путей MarketDataService и сканера.
+# Запуск из корня репозитория, например: python -m benchmarks.ingest
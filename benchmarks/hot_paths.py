@@ -0,0 +1,206 @@
+"""
+Бенчмарки горячих функций сканера по сетке масштабирования на синтетических книгах.
+
+Функции:
+  - volume_and_profit: find_executable_arbitrage_volume_and_profit (float и fixed-point) на паре книг,
+    пересеченных на всю глубину (проходятся все уровни);
+  - scan: find_arbitrage_opportunities_with_order_book по всем парам и биржам;
+  - opportunity_model: OpportunityRecord.to_model().model_dump() (граница API);
+  - json_encode: json.dumps списка возможностей (сообщение WS).
+
+Сетка: по каждой оси меняется один параметр, остальные - базовые (глубина 50, 3 биржи, 6 пар):
+глубина 20..500, биржи 2..30, пары 6..2000, возможности 10..1000. Книги строит
+SyntheticBookGenerator с фиксированным seed, поэтому прогоны сравнимы между коммитами.
+Время вызова - минимум и медиана из --repeats повторов (timeit, число вызовов на повтор
+подбирается автоматически, GC выключен на время замера).
+
+Запуск:
+  python -m benchmarks.hot_paths run [--output results.json] [--only scan] [--compare baseline.json]
+  python -m benchmarks.hot_paths compare baseline.json results.json [--threshold 0.1]
+compare (и run --compare) завершается с кодом 1, если хотя бы один случай медленнее базы больше чем на threshold.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from typing import Any, Callable, Dict, List, NamedTuple
+
+from benchmarks.synthetic import SyntheticBookGenerator
+from src.arbitrage_scanner import find_arbitrage_opportunities_with_order_book
+from src.utils import find_executable_arbitrage_volume_and_profit, find_executable_arbitrage_volume_and_profit_fixed
+
+DEPTHS = (20, 50, 100, 200, 500)
+VENUES = (2, 3, 5, 10, 20, 30)
+SYMBOLS = (6, 50, 200, 1000, 2000)
+OPPORTUNITIES = (10, 100, 1000)
+BASE_GRID = {'depth': 50, 'venues': 3, 'symbols': 6}
+# Версия формата файла результатов
+RESULTS_FORMAT = 1
+
+
+class Case(NamedTuple):
+    benchmark: str
+    params: Dict[str, Any]
+    setup: Callable[[], Callable[[], Any]] # Готовит данные и возвращает замеряемую функцию без аргументов
+
+    @property
+    def case_id(self) -> str:
+        return f"{self.benchmark}[{','.join(f'{key}={value}' for key, value in self.params.items())}]"
+
+
+def _volume_case(seed: int, depth: int, book: str) -> Case:
+    def setup():
+        generator = SyntheticBookGenerator(seed=seed, depth=depth)
+        generator.register_config()
+        fixed_point = book == 'fixed'
+        buy_ob, sell_ob = generator.full_depth_pair(fixed_point=fixed_point)
+        function = find_executable_arbitrage_volume_and_profit_fixed if fixed_point else find_executable_arbitrage_volume_and_profit
+        buy_id, sell_id = generator.venue_ids[0], generator.venue_ids[1]
+        return lambda: function(buy_ob, sell_ob, buy_id, sell_id, 0.0001, 1e9)
+    return Case('volume_and_profit', {'depth': depth, 'book': book}, setup)
+
+
+def _scan_case(seed: int, depth: int, venues: int, symbols: int) -> Case:
+    def setup():
+        generator = SyntheticBookGenerator(seed=seed, depth=depth, venues=venues, symbols=symbols)
+        generator.register_config()
+        books = generator.books_by_symbol()
+        return lambda: find_arbitrage_opportunities_with_order_book(books)
+    return Case('scan', {'depth': depth, 'venues': venues, 'symbols': symbols}, setup)
+
+
+def _model_case(seed: int, count: int) -> Case:
+    def setup():
+        opportunities = SyntheticBookGenerator(seed=seed).opportunities(count)
+        return lambda: [opp.to_model().model_dump() for opp in opportunities]
+    return Case('opportunity_model', {'opportunities': count}, setup)
+
+
+def _json_case(seed: int, count: int) -> Case:
+    def setup():
+        payload = [opp.to_model().model_dump() for opp in SyntheticBookGenerator(seed=seed).opportunities(count)]
+        return lambda: json.dumps(payload)
+    return Case('json_encode', {'opportunities': count}, setup)
+
+
+def build_cases(seed: int) -> List[Case]:
+    cases = [_volume_case(seed, depth, book) for book in ('float', 'fixed') for depth in DEPTHS]
+    scan_grid = [dict(BASE_GRID, depth=depth) for depth in DEPTHS]
+    scan_grid += [dict(BASE_GRID, venues=venues) for venues in VENUES]
+    scan_grid += [dict(BASE_GRID, symbols=symbols) for symbols in SYMBOLS]
+    seen = set()
+    for params in scan_grid:
+        key = tuple(params.values())
+        if key not in seen: # Базовая точка входит во все три оси
+            seen.add(key)
+            cases.append(_scan_case(seed, **params))
+    cases += [_model_case(seed, count) for count in OPPORTUNITIES]
+    cases += [_json_case(seed, count) for count in OPPORTUNITIES]
+    return cases
+
+
+def measure(function: Callable[[], Any], repeats: int, min_time: float) -> Dict[str, float]:
+    """Время одного вызова (мкс): минимум и медиана по повторам по min_time секунд и больше."""
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    per_call = sorted(total / number * 1e6 for total in timer.repeat(repeats, number))
+    return {'number': number, 'min_us': per_call[0], 'median_us': per_call[len(per_call) // 2]}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict[str, Any]:
+    cases = [case for case in build_cases(args.seed) if not args.only or any(part in case.case_id for part in args.only)]
+    results: Dict[str, Any] = {}
+    for case in cases:
+        stats = measure(case.setup(), args.repeats, args.min_time)
+        results[case.case_id] = {'benchmark': case.benchmark, 'params': case.params, **stats}
+        print(f"  {case.case_id:<58} {stats['min_us']:12.1f} us  (median {stats['median_us']:.1f}, x{stats['number']})")
+    return {
+        'format': RESULTS_FORMAT,
+        'created_at': int(time.time() * 1000),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeats': args.repeats,
+        'results': results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    """Печатает изменения по общим случаям (по min_us); возвращает True, если есть регрессии."""
+    if baseline.get('seed') != current.get('seed'):
+        print(f"Внимание: seed отличается (база {baseline.get('seed')}, текущий {current.get('seed')}) - книги не совпадают")
+    base_results, current_results = baseline['results'], current['results']
+    regressions = 0
+    print(f"Сравнение с базой {baseline.get('git_commit') or '?'} -> {current.get('git_commit') or '?'} (порог {threshold:.0%}):")
+    for case_id, result in current_results.items():
+        base = base_results.get(case_id)
+        if base is None:
+            print(f"  {case_id:<58} новый случай")
+            continue
+        ratio = result['min_us'] / base['min_us']
+        if ratio > 1 + threshold:
+            verdict = 'РЕГРЕССИЯ'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            verdict = 'ускорение'
+        else:
+            verdict = ''
+        print(f"  {case_id:<58} {base['min_us']:12.1f} -> {result['min_us']:12.1f} us  {ratio:6.2f}x  {verdict}")
+    missing = len(base_results.keys() - current_results.keys())
+    if missing:
+        print(f"  Случаев базы нет в текущем прогоне: {missing}")
+    print(f"Регрессий: {regressions}")
+    return regressions > 0
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Выполнить бенчмарки')
+    run_parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    run_parser.add_argument('--only', action='append', help='Только случаи, id которых содержит строку (можно повторять)')
+    run_parser.add_argument('--repeats', type=int, default=5, help='Повторов на случай')
+    run_parser.add_argument('--min-time', type=float, default=0.1, help='Минимальная длительность одного повтора, сек')
+    run_parser.add_argument('--seed', type=int, default=42, help='Seed генератора книг')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='Сравнить с сохраненными результатами')
+    run_parser.add_argument('--threshold', type=float, default=0.10, help='Допустимое замедление (доля)')
+    compare_parser = commands.add_parser('compare', help='Сравнить два файла результатов')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Допустимое замедление (доля)')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        sys.exit(1 if compare(_load(args.baseline), _load(args.current), args.threshold) else 0)
+
+    print(f"Hot paths: seed={args.seed}, repeats={args.repeats}, min_time={args.min_time}s")
+    current = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(current, output_file, indent=2, ensure_ascii=False)
+        print(f"Результаты сохранены: {args.output}")
+    if args.compare and compare(_load(args.compare), current, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
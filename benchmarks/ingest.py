@@ -0,0 +1,81 @@
+"""
+Бенчмарк стоимости приема одного WS обновления (нормализация книги ордеров и тикера).
+
+Сравнивает:
+  - before: создание Pydantic моделей с полной валидацией на каждое обновление;
+  - after:  slotted записи (OrderBookRecord/TickerRecord) с выборочной валидацией 1 из N.
+
+Запуск: python -m benchmarks.ingest [--depth 500] [--updates 2000] [--sample-rate 100]
+"""
+import argparse
+import random
+import time
+from typing import Callable, Dict, Any
+
+from src.data_models import NormalizedOrderBook, NormalizedTicker
+from src.utils import normalize_ccxt_order_book, normalize_ccxt_ticker
+
+
+def make_raw_order_book(depth: int, mid: float = 100.0, seed: int = 42) -> Dict[str, Any]:
+    """Синтетическая книга в формате ccxt.pro: списки [price, amount]."""
+    rng = random.Random(seed)
+    return {
+        'symbol': 'BTC/USDT',
+        'bids': [[mid - 0.01 * (i + 1), rng.uniform(0.01, 5.0)] for i in range(depth)],
+        'asks': [[mid + 0.01 * (i + 1), rng.uniform(0.01, 5.0)] for i in range(depth)],
+        'timestamp': int(time.time() * 1000),
+        'datetime': None,
+    }
+
+
+def make_raw_ticker(mid: float = 100.0) -> Dict[str, Any]:
+    return {'symbol': 'BTC/USDT', 'bid': mid - 0.01, 'ask': mid + 0.01, 'last': mid,
+            'timestamp': int(time.time() * 1000), 'datetime': None}
+
+
+def per_update_us(fn: Callable[[int], Any], updates: int) -> float:
+    """Среднее время одного вызова fn(i) в микросекундах."""
+    started = time.perf_counter()
+    for i in range(updates):
+        fn(i)
+    return (time.perf_counter() - started) / updates * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--depth', type=int, default=500, help='Количество уровней на каждой стороне книги')
+    parser.add_argument('--updates', type=int, default=2000, help='Количество обновлений в замере')
+    parser.add_argument('--sample-rate', type=int, default=100, help='Валидировать 1 из N обновлений (0 - без валидации)')
+    args = parser.parse_args()
+
+    raw_ob = make_raw_order_book(args.depth)
+    raw_ticker = make_raw_ticker()
+    rate = args.sample_rate
+
+    def ob_before(_):
+        NormalizedOrderBook(exchange='binance', symbol=raw_ob['symbol'], bids=raw_ob['bids'], asks=raw_ob['asks'],
+                            timestamp=raw_ob['timestamp'], datetime=raw_ob['datetime'])
+
+    def ob_after(i):
+        record = normalize_ccxt_order_book('binance', 'BTC/USDT', raw_ob)
+        if rate and i % rate == 0:
+            record.to_model()
+
+    def ticker_before(_):
+        NormalizedTicker(exchange='binance', symbol=raw_ticker['symbol'], bid=raw_ticker['bid'], ask=raw_ticker['ask'],
+                         last=raw_ticker['last'], timestamp=raw_ticker['timestamp'], datetime=raw_ticker['datetime'])
+
+    def ticker_after(i):
+        record = normalize_ccxt_ticker('binance', 'BTC/USDT', raw_ticker)
+        if rate and i % rate == 0:
+            record.to_model()
+
+    print(f"Ingest: depth={args.depth}, updates={args.updates}, sample_rate=1/{rate if rate else 'off'}")
+    for name, before, after in (('order_book', ob_before, ob_after), ('ticker', ticker_before, ticker_after)):
+        before_us = per_update_us(before, args.updates)
+        after_us = per_update_us(after, args.updates)
+        print(f"  {name:<11} before: {before_us:9.2f} us/update   after: {after_us:9.2f} us/update   speedup: {before_us / after_us:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
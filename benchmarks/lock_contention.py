@@ -0,0 +1,177 @@
+"""
+Бенчмарк ожидания лока при записи WS обновлений и чтении состояния.
+
+Моделирует работу сервиса в одном event loop:
+  - писатели: по задаче на (биржа, пара), публикуют книгу каждые --write-interval-ms;
+  - читатели: сканер (группировка книг) и REST запросы (/status, /api/v1/tickers);
+  - структурные операции (admin API, переподключение биржи) раз в --admin-interval-ms
+    удерживают лок на --admin-hold-ms, включая await внутри критической секции.
+
+Сравнивает:
+  - before: один asyncio.Lock вокруг каждой записи и чтения (прежний _data_lock);
+  - after:  copy-on-write MarketStore и статусы; лок берут только структурные операции.
+
+Для каждой роли в обоих сценариях измеряется одна и та же величина: время от запланированного
+пробуждения задачи до завершения ее доступа к состоянию (ожидание лока, задержка event loop и сама
+операция, в том числе копирование при copy-on-write), p50/p99/max. Для структурных операций -
+до захвата лока (удержание задано --admin-hold-ms).
+
+Запуск: python -m benchmarks.lock_contention [--exchanges 4] [--symbols 10] [--duration 5]
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+from src.data_models import OrderBookRecord
+from src.market_store import MarketStore
+
+
+def make_book(exchange_id: str, symbol: str, depth: int) -> OrderBookRecord:
+    return OrderBookRecord(
+        exchange=exchange_id,
+        symbol=symbol,
+        bids=[(100.0 - 0.01 * (i + 1), 1.0) for i in range(depth)],
+        asks=[(100.0 + 0.01 * (i + 1), 1.0) for i in range(depth)],
+        timestamp=int(time.time() * 1000),
+    )
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Scenario:
+    """Общий каркас: запускает писателей, читателей и структурные операции, собирает ожидания (мс)."""
+
+    def __init__(self, args):
+        self.args = args
+        self.exchanges = [f"ex{i}" for i in range(args.exchanges)]
+        self.symbols = [f"S{i}/USDT" for i in range(args.symbols)]
+        self.books = {(e, s): make_book(e, s, args.depth) for e in self.exchanges for s in self.symbols}
+        self.lock = asyncio.Lock()
+        self.waits: Dict[str, List[float]] = {'write': [], 'scanner': [], 'rest': [], 'admin': []}
+        self.running = True
+
+    @staticmethod
+    async def _sleep_until_due(interval_ms: float) -> float:
+        """Спит interval_ms и возвращает запланированный момент пробуждения (perf_counter)."""
+        due = time.perf_counter() + interval_ms / 1000
+        await asyncio.sleep(interval_ms / 1000)
+        return due
+
+    def _record(self, role: str, due: float):
+        self.waits[role].append((time.perf_counter() - due) * 1000)
+
+    async def admin(self):
+        while self.running:
+            due = await self._sleep_until_due(self.args.admin_interval_ms)
+            async with self.lock:
+                self._record('admin', due)
+                await asyncio.sleep(self.args.admin_hold_ms / 1000)
+
+    async def run(self) -> Dict[str, List[float]]:
+        tasks = [asyncio.create_task(self.writer(e, s)) for e in self.exchanges for s in self.symbols]
+        tasks.append(asyncio.create_task(self.scanner()))
+        tasks.append(asyncio.create_task(self.rest()))
+        tasks.append(asyncio.create_task(self.admin()))
+        await asyncio.sleep(self.args.duration)
+        self.running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.waits
+
+
+class LockedScenario(Scenario):
+    """Прежняя схема: словарь данных и статусов под одним asyncio.Lock."""
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.data: Dict[str, Dict[str, OrderBookRecord]] = {e: {} for e in self.exchanges}
+        self.statuses = {e: 'connected' for e in self.exchanges}
+
+    async def writer(self, exchange_id: str, symbol: str):
+        book = self.books[(exchange_id, symbol)]
+        while self.running:
+            due = await self._sleep_until_due(self.args.write_interval_ms)
+            async with self.lock:
+                self.data[exchange_id][f"{symbol}_ob"] = book
+            self._record('write', due)
+
+    async def scanner(self):
+        while self.running:
+            due = await self._sleep_until_due(self.args.scan_interval_ms)
+            async with self.lock:
+                {e: dict(data) for e, data in self.data.items() if self.statuses.get(e) == 'connected'}
+            self._record('scanner', due)
+
+    async def rest(self):
+        while self.running:
+            due = await self._sleep_until_due(self.args.rest_interval_ms)
+            async with self.lock:
+                self.statuses.copy()
+            self._record('rest', due)
+
+
+class CopyOnWriteScenario(Scenario):
+    """Новая схема: MarketStore и статусы copy-on-write, лок только у структурных операций."""
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.store = MarketStore()
+        for exchange_id in self.exchanges:
+            self.store.open_exchange(exchange_id)
+        self.statuses = {e: 'connected' for e in self.exchanges}
+
+    async def writer(self, exchange_id: str, symbol: str):
+        book = self.books[(exchange_id, symbol)]
+        exchange_idx = self.store.exchange_index(exchange_id)
+        symbol_idx = self.store.symbol_index(symbol)
+        while self.running:
+            due = await self._sleep_until_due(self.args.write_interval_ms)
+            self.store.set_order_book(exchange_idx, symbol_idx, book)
+            self._record('write', due)
+
+    async def scanner(self):
+        while self.running:
+            due = await self._sleep_until_due(self.args.scan_interval_ms)
+            statuses = self.statuses
+            self.store.snapshot().books_by_symbol([e for e, status in statuses.items() if status == 'connected'])
+            self._record('scanner', due)
+
+    async def rest(self):
+        while self.running:
+            due = await self._sleep_until_due(self.args.rest_interval_ms)
+            dict(self.statuses)
+            self._record('rest', due)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exchanges', type=int, default=4)
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=50, help='Количество уровней на каждой стороне книги')
+    parser.add_argument('--duration', type=float, default=5.0, help='Длительность каждого замера, секунд')
+    parser.add_argument('--write-interval-ms', type=float, default=10.0)
+    parser.add_argument('--scan-interval-ms', type=float, default=500.0)
+    parser.add_argument('--rest-interval-ms', type=float, default=50.0)
+    parser.add_argument('--admin-interval-ms', type=float, default=1000.0)
+    parser.add_argument('--admin-hold-ms', type=float, default=20.0, help='Время удержания лока структурной операцией (с await внутри)')
+    args = parser.parse_args()
+
+    print(f"Lock contention: exchanges={args.exchanges}, symbols={args.symbols}, duration={args.duration}s, "
+          f"write every {args.write_interval_ms}ms, admin hold {args.admin_hold_ms}ms every {args.admin_interval_ms}ms")
+    for name, scenario_class in (('before (asyncio.Lock)', LockedScenario), ('after (copy-on-write)', CopyOnWriteScenario)):
+        waits = asyncio.run(scenario_class(args).run())
+        print(f"  {name}")
+        for role, samples in waits.items():
+            print(f"    {role:<8} n={len(samples):>7}  delay p50={percentile(samples, 50):8.3f}ms  "
+                  f"p99={percentile(samples, 99):8.3f}ms  max={max(samples, default=0.0):8.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Холодный старт процесса API: время до первого ответа /status и до первого прохода сканера.
+
+Каждый прогон запускает `python -m uvicorn src.main:app` в новом процессе и отдельном временном
+каталоге (без warm-start кэша и БД прошлых прогонов; --keep-cache оставляет один каталог на все
+прогоны, и начиная со второго старт идет с warm-start снапшотом). Снаружи измеряются:
+  - status_ms: от запуска процесса до первого успешного ответа /status;
+  - first_scan_ms: до появления события first_scan в /status (первый проход сканера с данными).
+Из /status берутся этапы запуска, события и отложенные импорты, которые пишет сам сервер
+(см. src/startup.py). По умолчанию биржи - локальный симулятор (EXCHANGE_FACTORY=simulator):
+замер не зависит от сети, а модули ccxt загружаются так же, как с реальными биржами.
+
+--importtime N дополнительно выводит N пакетов с наибольшим собственным временем импорта
+src.main (python -X importtime, сумма по пакету верхнего уровня).
+
+Запуск: python -m benchmarks.startup [--runs 5] [--factory ccxtpro] [--importtime 15] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Корень репозитория: процесс сервера работает во временном каталоге и импортирует src отсюда
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLL_INTERVAL_SECONDS = 0.01
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_env(factory: str) -> Dict[str, str]:
+    pythonpath = os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))
+    # Логи на уровне WARNING: сводку запуска бенчмарк берет из /status
+    return {**os.environ, 'PYTHONPATH': pythonpath, 'EXCHANGE_FACTORY': factory, 'LOG_LEVEL': 'WARNING'}
+
+
+def _get_status(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def _stop(process: subprocess.Popen):
+    # SIGINT - штатная остановка uvicorn: сервис сохраняет warm-start снапшот (нужно для --keep-cache)
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_once(factory: str, cwd: str, timeout: float) -> Dict[str, Any]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/status"
+    command = [sys.executable, '-m', 'uvicorn', 'src.main:app', '--host', '127.0.0.1', '--port', str(port),
+               '--log-level', 'warning']
+    started = time.monotonic()
+    process = subprocess.Popen(command, cwd=cwd, env=_server_env(factory), stdout=subprocess.DEVNULL)
+    result: Dict[str, Any] = {'status_ms': None, 'first_scan_ms': None}
+    try:
+        deadline = started + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+            status = _get_status(url)
+            now_ms = (time.monotonic() - started) * 1000
+            if status is not None:
+                if result['status_ms'] is None:
+                    result['status_ms'] = now_ms
+                startup = status.get('startup', {})
+                if 'first_scan' in startup.get('events_ms', {}):
+                    result['first_scan_ms'] = now_ms
+                    result['server'] = startup
+                    break
+            time.sleep(POLL_INTERVAL_SECONDS)
+        else:
+            raise RuntimeError(f"Нет первого прохода сканера за {timeout:.0f} с")
+    finally:
+        _stop(process)
+    return result
+
+
+def import_breakdown(top: int) -> List[Dict[str, Any]]:
+    """Собственное время импорта src.main по пакетам верхнего уровня (мс), по убыванию."""
+    with tempfile.TemporaryDirectory() as cwd:
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src.main'], cwd=cwd,
+                                   env=_server_env('ccxtpro'), capture_output=True, text=True, check=True)
+    self_us: Dict[str, int] = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _cumulative, name = line[len('import time:'):].split('|')
+        self_us[name.strip().split('.')[0]] += int(own)
+    ranked = sorted(self_us.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{'package': package, 'self_ms': us / 1000} for package, us in ranked]
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def _summary(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Минимум и медиана внешних замеров, медианы этапов и событий сервера."""
+    summary: Dict[str, Any] = {}
+    for key in ('status_ms', 'first_scan_ms'):
+        values = [run[key] for run in runs]
+        summary[key] = {'min': min(values), 'median': _median(values)}
+    for section in ('phases_ms', 'events_ms', 'lazy_imports_ms'):
+        collected: Dict[str, List[float]] = defaultdict(list)
+        for run in runs:
+            for name, value in run['server'].get(section, {}).items():
+                collected[name].append(value)
+        summary[section] = {name: _median(values) for name, values in collected.items()}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Число запусков процесса')
+    parser.add_argument('--factory', choices=('simulator', 'ccxtpro'), default='simulator',
+                        help='Источник бирж (EXCHANGE_FACTORY); ccxtpro требует сети')
+    parser.add_argument('--keep-cache', action='store_true', help='Один рабочий каталог на все прогоны (warm start со второго)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Предельное время до первого прохода сканера, сек')
+    parser.add_argument('--importtime', type=int, metavar='N', help='Вывести N пакетов с наибольшим временем импорта src.main')
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    print(f"Startup: runs={args.runs}, factory={args.factory}, keep_cache={args.keep_cache}")
+    runs = []
+    with tempfile.TemporaryDirectory() as shared_cwd:
+        for index in range(args.runs):
+            if args.keep_cache:
+                run = run_once(args.factory, shared_cwd, args.timeout)
+            else:
+                with tempfile.TemporaryDirectory() as cwd:
+                    run = run_once(args.factory, cwd, args.timeout)
+            runs.append(run)
+            print(f"  run {index + 1}: /status {run['status_ms']:7.0f} ms, first scan {run['first_scan_ms']:7.0f} ms")
+
+    summary = _summary(runs)
+    print(f"/status:    min {summary['status_ms']['min']:.0f} ms, median {summary['status_ms']['median']:.0f} ms")
+    print(f"first scan: min {summary['first_scan_ms']['min']:.0f} ms, median {summary['first_scan_ms']['median']:.0f} ms")
+    print("Этапы сервера (медиана, мс): " + ', '.join(f"{name} {value:.0f}" for name, value in summary['phases_ms'].items()))
+    print("События от запуска (медиана, мс): " + ', '.join(f"{name} {value:.0f}" for name, value in summary['events_ms'].items()))
+    print("Отложенные импорты (медиана, мс): " + (', '.join(f"{name} {value:.0f}" for name, value in summary['lazy_imports_ms'].items()) or '-'))
+
+    result: Dict[str, Any] = {'factory': args.factory, 'keep_cache': args.keep_cache, 'runs': runs, 'summary': summary}
+    if args.importtime:
+        result['imports'] = import_breakdown(args.importtime)
+        print("Импорт src.main по пакетам (собственное время):")
+        for item in result['imports']:
+            print(f"  {item['package']:<24} {item['self_ms']:8.1f} ms")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(result, output_file, indent=2, ensure_ascii=False)
+        print(f"Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Детерминированный генератор синтетических книг ордеров для бенчмарков.
+
+Один seed дает одни и те же книги: цены кратны шагу цены, объемы - лоту, поэтому книги
+одинаково представимы во float (OrderBookRecord) и в fixed-point (FixedPointOrderBook).
+Параметры: глубина, спред, вероятность пересечения книг (арбитража) и его величина,
+количество бирж и пар.
+
+Пересечение по паре: книга одной биржи сдвигается вверх так, что ее лучший bid выше лучшего
+ask другой биржи на cross_bps. Без пересечения середины бирж отличаются меньше, чем на
+половину спреда, и возможностей нет. full_depth_pair() строит пару книг, пересеченных на всю
+глубину: расчет объема тогда проходит все уровни, и его стоимость растет с глубиной.
+"""
+import random
+from fractions import Fraction
+from typing import Dict, List, Tuple
+
+from src.config import DESIRED_TRADE_VOLUME_BASE, EXCHANGE_TAKER_FEES_PCT
+from src.data_models import OpportunityRecord
+from src.fixed_point import to_fixed_point_order_book
+from src.latency import STAGES
+from src.market_store import OrderBook
+from src.spread_stats import SpreadStats
+from src.utils import normalize_ccxt_order_book
+
+# Шаг цены и лот синтетических рынков
+PRICE_TICK = Fraction(1, 100)
+AMOUNT_LOT = Fraction(1, 10_000)
+# Комиссия синтетических бирж (%), как у binance в EXCHANGE_TAKER_FEES_PCT
+SYNTHETIC_FEE_PCT = 0.10
+
+
+class SyntheticBookGenerator:
+    def __init__(self, seed: int = 42, depth: int = 50, venues: int = 3, symbols: int = 6,
+                 spread_bps: float = 5.0, crossing_probability: float = 0.1, cross_bps: float = 40.0,
+                 max_level_gap_ticks: int = 3, max_level_lots: int = 5_000):
+        if venues < 2:
+            raise ValueError("Для арбитража нужно минимум 2 биржи")
+        self.seed = seed
+        self.depth = depth
+        self.spread_bps = spread_bps
+        self.crossing_probability = crossing_probability
+        self.cross_bps = cross_bps
+        self.max_level_gap_ticks = max_level_gap_ticks
+        self.max_level_lots = max_level_lots
+        self.venue_ids: List[str] = [f"venue{i:02d}" for i in range(venues)]
+        self.symbols: List[str] = [f"SYN{i:04d}/USDT" for i in range(symbols)]
+
+    def params(self) -> Dict[str, object]:
+        """Параметры генератора для записи рядом с результатами."""
+        return {
+            'seed': self.seed, 'depth': self.depth, 'venues': len(self.venue_ids), 'symbols': len(self.symbols),
+            'spread_bps': self.spread_bps, 'crossing_probability': self.crossing_probability, 'cross_bps': self.cross_bps,
+        }
+
+    def register_config(self, volume_limit: float = 1e9):
+        """
+        Добавляет синтетические биржи и пары в EXCHANGE_TAKER_FEES_PCT и DESIRED_TRADE_VOLUME_BASE
+        (словари config изменяются на месте, только в процессе бенчмарка): без комиссии и лимита
+        объема сканер пропускает пару.
+        """
+        for venue_id in self.venue_ids:
+            EXCHANGE_TAKER_FEES_PCT.setdefault(venue_id, SYNTHETIC_FEE_PCT)
+        for symbol in self.symbols:
+            DESIRED_TRADE_VOLUME_BASE.setdefault(symbol, volume_limit)
+
+    def raw_order_book(self, rng: random.Random, symbol: str, bid_top_ticks: int, ask_top_ticks: int) -> Dict[str, object]:
+        """Книга в формате ccxt.pro: depth уровней на сторону от лучших цен (в шагах цены)."""
+        tick, lot = float(PRICE_TICK), float(AMOUNT_LOT)
+        bids, asks = [], []
+        bid_ticks, ask_ticks = bid_top_ticks, ask_top_ticks
+        for _ in range(self.depth):
+            bids.append([bid_ticks * tick, rng.randint(1, self.max_level_lots) * lot])
+            asks.append([ask_ticks * tick, rng.randint(1, self.max_level_lots) * lot])
+            bid_ticks -= rng.randint(1, self.max_level_gap_ticks)
+            ask_ticks += rng.randint(1, self.max_level_gap_ticks)
+        return {'symbol': symbol, 'bids': bids, 'asks': asks, 'timestamp': 1_700_000_000_000, 'datetime': None}
+
+    def raw_books_by_symbol(self) -> Dict[str, Dict[str, Dict[str, object]]]:
+        """{ symbol: { venue: книга ccxt.pro } } с пересечениями по crossing_probability."""
+        rng = random.Random(self.seed)
+        result = {}
+        for symbol in self.symbols:
+            mid_ticks = rng.randint(1_000, 10_000_000) # середина 10 .. 100 000 в единицах цены
+            half_spread = max(1, round(mid_ticks * self.spread_bps / 20_000))
+            # Середины бирж расходятся меньше, чем на половину спреда: без сдвига пересечений нет
+            jitter = max(0, half_spread // 3)
+            shifts = {venue_id: rng.randint(-jitter, jitter) for venue_id in self.venue_ids}
+            if rng.random() < self.crossing_probability:
+                buy_venue, sell_venue = rng.sample(self.venue_ids, 2)
+                cross = max(1, round(mid_ticks * self.cross_bps / 10_000))
+                # Лучший bid биржи продажи выше лучшего ask биржи покупки на cross шагов
+                shifts[sell_venue] = shifts[buy_venue] + 2 * half_spread + cross
+            result[symbol] = {
+                venue_id: self.raw_order_book(rng, symbol, mid_ticks + shift - half_spread, mid_ticks + shift + half_spread)
+                for venue_id, shift in shifts.items()
+            }
+        return result
+
+    def books_by_symbol(self, fixed_point: bool = False) -> Dict[str, Dict[str, OrderBook]]:
+        """Нормализованные книги в группировке сканера (см. MarketStore.books_by_symbol)."""
+        return {
+            symbol: {venue_id: self._normalize(venue_id, symbol, raw, fixed_point) for venue_id, raw in books.items()}
+            for symbol, books in self.raw_books_by_symbol().items()
+        }
+
+    def full_depth_pair(self, fixed_point: bool = False) -> Tuple[OrderBook, OrderBook]:
+        """(книга покупки, книга продажи), пересеченные на всю глубину: худший bid продажи выше худшего ask покупки."""
+        rng = random.Random(self.seed)
+        symbol = self.symbols[0]
+        mid_ticks = 1_000_000
+        span = self.depth * self.max_level_gap_ticks
+        buy = self.raw_order_book(rng, symbol, mid_ticks - 1, mid_ticks + 1)
+        # Худший bid продажи выше худшего ask покупки на 0.4% середины - больше комиссий обеих сторон
+        sell_bid_top = mid_ticks + 2 * span + round(mid_ticks * (4 * SYNTHETIC_FEE_PCT) / 100)
+        sell = self.raw_order_book(rng, symbol, sell_bid_top, sell_bid_top + 2)
+        return (self._normalize(self.venue_ids[0], symbol, buy, fixed_point),
+                self._normalize(self.venue_ids[1], symbol, sell, fixed_point))
+
+    def opportunities(self, count: int) -> List[OpportunityRecord]:
+        """count возможностей с заполненными spread_stats и stage_latencies_ms, как в сообщении WS."""
+        rng = random.Random(self.seed)
+        labels = SpreadStats().window_labels
+        result = []
+        for i in range(count):
+            symbol = self.symbols[i % len(self.symbols)]
+            buy_venue, sell_venue = rng.sample(self.venue_ids, 2)
+            buy_price = rng.uniform(10, 100_000)
+            sell_price = buy_price * (1 + rng.uniform(0.001, 0.01))
+            volume = rng.uniform(0.001, 10)
+            result.append(OpportunityRecord(
+                id=f"{symbol.replace('/', '')}-{buy_venue}-{sell_venue}",
+                symbol=symbol,
+                buy_exchange=buy_venue,
+                sell_exchange=sell_venue,
+                executable_volume_base=volume,
+                buy_price=buy_price,
+                sell_price=sell_price,
+                potential_profit_pct=(sell_price / buy_price - 1) * 100,
+                fees_paid_quote=volume * (buy_price + sell_price) * SYNTHETIC_FEE_PCT / 100,
+                net_profit_pct=(sell_price / buy_price - 1) * 100 - 2 * SYNTHETIC_FEE_PCT,
+                net_profit_quote=volume * (sell_price - buy_price),
+                buy_network=None,
+                sell_network=None,
+                timestamp=1_700_000_000_000 + i,
+                spread_stats={label: {'mean': rng.random(), 'std': rng.random(), 'zscore': rng.gauss(0, 1),
+                                      'percentile_rank': rng.uniform(0, 100)} for label in labels},
+                stage_latencies_ms={stage: rng.uniform(0, 50) for stage in STAGES},
+            ))
+        return result
+
+    @staticmethod
+    def _normalize(venue_id: str, symbol: str, raw: Dict[str, object], fixed_point: bool) -> OrderBook:
+        if fixed_point:
+            return to_fixed_point_order_book(venue_id, symbol, raw, PRICE_TICK, AMOUNT_LOT)
+        return normalize_ccxt_order_book(venue_id, symbol, raw)
@@ -0,0 +1,342 @@
+"""
+Нагрузочный тест рассылки возможностей по WebSocket (/ws_final).
+
+Запускает приложение (src.main) в отдельном процессе на локальном порту без подключения к биржам:
+книги подает синтетический поток (SyntheticBookGenerator, --update-rate обновлений в секунду),
+обычная задача сканера находит по ним возможности и рассылает их подписчикам.
+Затем клиенты подключаются ступенями (--stages): часть из них (--slow-fraction) - медленные,
+читают одно сообщение раз в --slow-delay секунд, их очереди на сервере переполняются.
+
+На каждой ступени после прогрева (--warmup) в течение --stage-seconds измеряются:
+  - задержка доставки у быстрых клиентов: от начала прохода сканера (timestamp возможности)
+    до получения сообщения клиентом, p50/p95/p99/max;
+  - сообщения в секунду на быстрого клиента, вытесненные из очередей сообщения (метрика сервера);
+  - частота проходов сканера относительно SCANNER_INTERVAL_SECONDS и p99 задержки event loop сервера;
+  - RSS процесса сервера.
+Клиенты по умолчанию согласуют permessage-deflate, как браузеры: сервер тогда сжимает сообщение
+для каждого клиента отдельно. --no-compression показывает рассылку без сжатия.
+Ступень, на которой частота сканирования падает ниже --cadence-threshold от номинальной,
+считается точкой срыва; следующие ступени не запускаются (если не задан --keep-going).
+
+Клиенты работают в процессе теста: на машине с одним ядром они конкурируют с сервером за CPU,
+поэтому абсолютные цифры имеют смысл только при сравнении прогонов на одной машине.
+
+Запуск: python -m benchmarks.ws_load [--stages 100,500,1000,2000,5000] [--slow-fraction 0.1] [--output load.json]
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from benchmarks.synthetic import SyntheticBookGenerator
+from src.config import SCANNER_INTERVAL_SECONDS
+
+# Одновременных попыток подключения при наборе ступени
+CONNECT_CONCURRENCY = 200
+# Варианты книг (разные seed), которые поток перебирает, чтобы книги и возможности менялись
+FEED_VARIANTS = 4
+FEED_TICK_SECONDS = 0.01
+
+
+# --- Сервер (дочерний процесс) ---
+
+async def _feed(service, generators: List[SyntheticBookGenerator], update_rate: float):
+    """Публикует синтетические книги через replay_order_book с частотой update_rate в секунду."""
+    books = [
+        book
+        for generator in generators
+        for by_exchange in generator.books_by_symbol().values()
+        for book in by_exchange.values()
+    ]
+    per_tick = update_rate * FEED_TICK_SECONDS
+    budget = 0.0
+    position = 0
+    while True:
+        await asyncio.sleep(FEED_TICK_SECONDS)
+        budget += per_tick
+        now_ms = int(time.time() * 1000)
+        while budget >= 1:
+            book = books[position % len(books)]
+            position += 1
+            budget -= 1
+            service.replay_order_book(dataclasses.replace(book, timestamp=now_ms), now_ms)
+
+
+async def _serve(args):
+    import uvicorn
+    from src.main import app, market_data_service
+
+    generators = [
+        SyntheticBookGenerator(seed=seed, depth=args.depth, venues=args.venues, symbols=args.symbols,
+                               crossing_probability=args.crossing_probability)
+        for seed in range(args.seed, args.seed + FEED_VARIANTS)
+    ]
+    generators[0].register_config()
+    # Сервис запускается до uvicorn без подключения к биржам; startup событие приложения его уже не перезапустит
+    await market_data_service.start(connect_exchanges=False)
+    feed = asyncio.create_task(_feed(market_data_service, generators, args.update_rate))
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=args.port, log_level='warning',
+                                           backlog=4096, timeout_graceful_shutdown=5))
+    try:
+        await server.serve()
+    finally:
+        feed.cancel()
+
+
+# --- Клиенты и замеры ---
+
+@dataclasses.dataclass
+class StageStats:
+    latencies_ms: List[float] = dataclasses.field(default_factory=list)
+    fast_messages: int = 0
+    measuring: bool = False
+
+
+async def _client(url: str, slow_delay: Optional[float], compression: Optional[str], stats: StageStats,
+                  connected: asyncio.Event, failures: List[str]):
+    try:
+        async with websockets.connect(url, max_size=None, ping_interval=None, open_timeout=60,
+                                      compression=compression) as ws:
+            connected.set()
+            while True:
+                message = await ws.recv()
+                if slow_delay is not None:
+                    await asyncio.sleep(slow_delay)
+                    continue
+                received_ms = time.time() * 1000
+                if not stats.measuring:
+                    continue
+                stats.fast_messages += 1
+                # Разбор всего JSON на тысячах клиентов занял бы CPU теста: берем timestamp первой возможности
+                start = message.find('"timestamp": ')
+                if start >= 0:
+                    end = message.find(',', start)
+                    stats.latencies_ms.append(received_ms - int(message[start + 13:end]))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        failures.append(f"{type(e).__name__}: {e}")
+    finally:
+        connected.set()
+
+
+def _http_get(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read().decode('utf-8')
+
+
+def _metric_value(text: str, name: str, suffix: str = '') -> float:
+    """
+    Сумма значений сэмплов name + suffix (_total, _count) по всем меткам в текстовом формате Prometheus.
+    Метрика без сэмплов (счетчик еще не увеличивался) - 0. Если метрика не зарегистрирована,
+    поднимает RuntimeError: молча вернуть 0 значит исказить результат теста.
+    """
+    if f"# TYPE {name} " not in text:
+        raise RuntimeError(f"Метрика {name} не найдена в /metrics")
+    sample = name + suffix
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(sample) and line[len(sample):len(sample) + 1] in ('{', ' '):
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def _server_sample(base_url: str) -> Dict[str, float]:
+    metrics = await asyncio.to_thread(_http_get, f"{base_url}/metrics")
+    return {
+        'scans': _metric_value(metrics, 'arbitrage_scan_duration_seconds', '_count'),
+        'dropped': _metric_value(metrics, 'arbitrage_ws_dropped_messages', '_total'),
+    }
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            await asyncio.to_thread(_http_get, f"{base_url}/status")
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Сервер не ответил на /status")
+
+
+async def _run(args) -> Dict[str, Any]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws_final"
+    command = [sys.executable, '-m', 'benchmarks.ws_load', '--serve', '--port', str(args.port),
+               '--seed', str(args.seed), '--depth', str(args.depth), '--venues', str(args.venues),
+               '--symbols', str(args.symbols), '--crossing-probability', str(args.crossing_probability),
+               '--update-rate', str(args.update_rate)]
+    # Логи сервера на уровне WARNING: INFO строки о каждом подключении исказили бы замер
+    server = subprocess.Popen(command, env={**os.environ, 'LOG_LEVEL': 'WARNING'}, stdout=subprocess.DEVNULL)
+    tasks: List[asyncio.Task] = []
+    failures: List[str] = []
+    stats = StageStats()
+    stages: List[Dict[str, Any]] = []
+    broke_at: Optional[int] = None
+    try:
+        await _wait_ready(base_url, server)
+        slow_clients = 0
+        connect_limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+        compression = None if args.no_compression else 'deflate'
+
+        async def open_client(slow: bool):
+            async with connect_limit:
+                connected = asyncio.Event()
+                tasks.append(asyncio.create_task(
+                    _client(ws_url, args.slow_delay if slow else None, compression, stats, connected, failures)))
+                await connected.wait()
+
+        for target in args.stages:
+            # Медленные клиенты - доля от общего числа, распределяются по ступеням равномерно
+            new_clients = max(0, target - len(tasks))
+            new_slow = max(0, round(target * args.slow_fraction) - slow_clients)
+            slow_clients += new_slow
+            await asyncio.gather(*(open_client(i < new_slow) for i in range(new_clients)))
+            await asyncio.sleep(args.warmup)
+
+            stats.latencies_ms, stats.fast_messages = [], 0
+            before = await _server_sample(base_url)
+            started = time.perf_counter()
+            stats.measuring = True
+            await asyncio.sleep(args.stage_seconds)
+            stats.measuring = False
+            elapsed = time.perf_counter() - started
+            after = await _server_sample(base_url)
+            status = json.loads(await asyncio.to_thread(_http_get, f"{base_url}/status"))
+
+            fast_clients = max(1, len(tasks) - slow_clients)
+            scans_per_second = (after['scans'] - before['scans']) / elapsed
+            cadence = scans_per_second * SCANNER_INTERVAL_SECONDS
+            stage = {
+                'clients': len(tasks),
+                'slow_clients': slow_clients,
+                'connect_failures': len(failures),
+                'messages_per_fast_client_per_second': stats.fast_messages / fast_clients / elapsed,
+                'delivery_p50_ms': _percentile(stats.latencies_ms, 50),
+                'delivery_p95_ms': _percentile(stats.latencies_ms, 95),
+                'delivery_p99_ms': _percentile(stats.latencies_ms, 99),
+                'delivery_max_ms': max(stats.latencies_ms, default=None),
+                'dropped_messages': after['dropped'] - before['dropped'],
+                'scans_per_second': scans_per_second,
+                'scan_cadence': cadence,
+                'loop_lag_p99_ms': status.get('event_loop', {}).get('p99_lag_ms'),
+                'server_rss_bytes': _rss_bytes(server.pid),
+            }
+            stages.append(stage)
+            print(_format_stage(stage))
+            if cadence < args.cadence_threshold and broke_at is None:
+                broke_at = stage['clients']
+                print(f"Частота сканирования упала до {cadence:.0%} от номинальной при {broke_at} клиентах")
+                if not args.keep_going:
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.terminate()
+        try:
+            await asyncio.to_thread(server.wait, 30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if failures:
+        print(f"Ошибки клиентов: {len(failures)}, первая: {failures[0]}")
+    return {
+        'created_at': int(time.time() * 1000),
+        'params': {key: value for key, value in vars(args).items() if key not in ('serve', 'output')},
+        'scanner_interval_seconds': SCANNER_INTERVAL_SECONDS,
+        'cadence_broke_at_clients': broke_at,
+        'stages': stages,
+    }
+
+
+def _format_stage(stage: Dict[str, Any]) -> str:
+    def ms(value):
+        return f"{value:8.1f}" if value is not None else '       -'
+    rss = stage['server_rss_bytes']
+    rss_display = f"{rss / 2**20:.0f}MB" if rss is not None else '?'
+    return (f"  clients={stage['clients']:<6} slow={stage['slow_clients']:<5} "
+            f"delivery p50/p95/p99/max ms:{ms(stage['delivery_p50_ms'])}{ms(stage['delivery_p95_ms'])}"
+            f"{ms(stage['delivery_p99_ms'])}{ms(stage['delivery_max_ms'])}  "
+            f"msg/s/client={stage['messages_per_fast_client_per_second']:5.2f} dropped={stage['dropped_messages']:<7.0f} "
+            f"cadence={stage['scan_cadence']:4.0%} lag p99 ms:{ms(stage['loop_lag_p99_ms'])}  "
+            f"rss={rss_display}")
+
+
+def _raise_open_files_limit():
+    # Тысячи клиентов и столько же сокетов на сервере: поднимаем мягкий лимит дескрипторов до жесткого
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stages', type=lambda value: [int(part) for part in value.split(',')],
+                        default=[100, 500, 1000, 2000, 5000], help='Число клиентов на ступенях, через запятую')
+    parser.add_argument('--slow-fraction', type=float, default=0.1, help='Доля медленных клиентов')
+    parser.add_argument('--slow-delay', type=float, default=2.0, help='Пауза медленного клиента после каждого сообщения, сек')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Прогрев после набора ступени, сек')
+    parser.add_argument('--stage-seconds', type=float, default=10.0, help='Длительность замера ступени, сек')
+    parser.add_argument('--no-compression', action='store_true',
+                        help='Клиенты без permessage-deflate (по умолчанию его согласуют, как браузеры)')
+    parser.add_argument('--cadence-threshold', type=float, default=0.9, help='Доля номинальной частоты сканирования, ниже которой ступень считается срывом')
+    parser.add_argument('--keep-going', action='store_true', help='Продолжать ступени после срыва частоты сканирования')
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    generator = parser.add_argument_group('синтетический поток')
+    generator.add_argument('--seed', type=int, default=42)
+    generator.add_argument('--depth', type=int, default=50)
+    generator.add_argument('--venues', type=int, default=3)
+    generator.add_argument('--symbols', type=int, default=20)
+    generator.add_argument('--crossing-probability', type=float, default=0.5, help='Доля пар с пересечением (возможностью)')
+    generator.add_argument('--update-rate', type=float, default=200.0, help='Обновлений книг в секунду')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS) # Режим дочернего процесса сервера
+    args = parser.parse_args()
+
+    _raise_open_files_limit()
+    if args.serve:
+        asyncio.run(_serve(args))
+        return
+
+    print(f"WS load: stages={args.stages}, slow={args.slow_fraction:.0%} (delay {args.slow_delay}s), "
+          f"symbols={args.symbols}x{args.venues} venues, {args.update_rate:.0f} updates/s")
+    result = asyncio.run(_run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(result, output_file, indent=2, ensure_ascii=False)
+        print(f"Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
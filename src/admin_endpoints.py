@@ -0,0 +1,93 @@
+import asyncio
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Any
+
+# Импортируем КЛАСС MarketDataService (для типизации)
+# Экземпляр сервиса получаем из app.state в хэндлере
+from src.market_data_service import MarketDataService
+from src.data_models import SubscriptionUpdate
+from src.profiler import SamplingProfiler, ProfilerBusyError
+from src.config import ADMIN_API_TOKEN, DESIRED_TRADE_VOLUME_BASE, PROFILER_DEFAULT_INTERVAL_MS, PROFILER_MAX_SECONDS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin_token(x_admin_token: str | None = Header(None)):
+    """Доступ к /admin только с токеном ADMIN_API_TOKEN в заголовке X-Admin-Token."""
+    if ADMIN_API_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Административный API отключен: ADMIN_API_TOKEN не задан")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Неверный или отсутствующий X-Admin-Token")
+
+
+# --- Создаем APIRouter для административных эндпоинтов ---
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin_token)])
+
+
+@admin_router.get("/subscriptions")
+async def get_subscriptions(request: Request) -> Dict[str, Any]:
+    """
+    Возвращает текущие отслеживаемые биржи и пары, а также реально работающие подписки по биржам.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    return service.get_subscriptions()
+
+
+@admin_router.post("/subscriptions")
+async def update_subscriptions(update: SubscriptionUpdate, request: Request) -> Dict[str, Any]:
+    """
+    Изменяет набор подписок работающего MarketDataService без перезапуска процесса.
+    Применяется только разница: подключенные биржи и их остальные подписки не переподключаются.
+    Сначала проверяется весь запрос (биржи, лимиты объема новых пар), и только затем применяются
+    лимиты, удаления и добавления: запрос с ошибкой ничего не меняет.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+
+    invalid_limits = {symbol: limit for symbol, limit in update.trade_volume_limits.items() if limit <= 0}
+    if invalid_limits:
+        raise HTTPException(status_code=400, detail=f"Лимиты объема должны быть положительными: {invalid_limits}")
+    unknown = await service.unsupported_exchanges(update.add_exchanges)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Биржи не поддерживаются ccxt.pro: {', '.join(unknown)}")
+    # Без лимита объема сканер пропускает пару (с предупреждением на каждом проходе)
+    missing_limits = [symbol for symbol in update.add_symbols
+                      if symbol not in DESIRED_TRADE_VOLUME_BASE and symbol not in update.trade_volume_limits]
+    if missing_limits:
+        raise HTTPException(status_code=400, detail=f"Нет лимита объема (trade_volume_limits) для новых пар: {missing_limits}")
+
+    # Лимиты обновляем на месте: сканер читает тот же словарь из config.py
+    DESIRED_TRADE_VOLUME_BASE.update(update.trade_volume_limits)
+    removed = await service.remove_subscriptions(update.remove_exchanges, update.remove_symbols)
+    added = await service.add_subscriptions(update.add_exchanges, update.add_symbols)
+
+    logger.info(f"Admin: Подписки изменены. Добавлено: {added}, удалено: {removed}.")
+    return {
+        "added": added,
+        "removed": removed,
+        "subscriptions": service.get_subscriptions(),
+    }
+
+
+@admin_router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=PROFILER_MAX_SECONDS),
+    mode: str = Query('wall', pattern='^(wall|cpu)$'),
+    interval_ms: float = Query(PROFILER_DEFAULT_INTERVAL_MS, ge=1, le=1000),
+) -> PlainTextResponse:
+    """
+    Снимает выборочный профиль всего процесса (все потоки) за seconds секунд.
+    mode=wall - время по стенным часам (видно ожидание), mode=cpu - процессорное время (мкс).
+    Ответ - collapsed stacks: flamegraph.pl, speedscope, inferno-flamegraph.
+    """
+    profiler = SamplingProfiler(mode, interval_ms)
+    try:
+        # Выборка идет в отдельном потоке: event loop продолжает работать и попадает в профиль
+        collapsed = await asyncio.to_thread(profiler.run, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Admin: Профиль ({mode}, {seconds} с) снят: {profiler.samples} выборок, {len(profiler.stacks)} стеков.")
+    return PlainTextResponse(collapsed, headers={'Content-Disposition': f'attachment; filename="profile-{mode}.collapsed"'})
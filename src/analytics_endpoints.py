@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Request
+from typing import Any, Dict, List, Optional
+
+# Импортируем КЛАСС MarketDataService (для типизации)
+# Экземпляр сервиса получаем из app.state в хэндлере
+from src.market_data_service import MarketDataService
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# --- Создаем APIRouter для аналитических эндпоинтов ---
+analytics_router = APIRouter(prefix="/api/v1/analytics")
+
+
+@analytics_router.get("/spreads")
+async def get_spread_stats(
+    request: Request,
+    symbol: Optional[str] = None,
+    buy_exchange: Optional[str] = None,
+    sell_exchange: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Возвращает онлайн статистики спреда лучших цен по направлениям (symbol, buy_exchange, sell_exchange):
+    текущий спред (%) и по каждому окну - среднее, стандартное отклонение, z-score текущего спреда,
+    его перцентиль и перцентили p5/p50/p95 распределения.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    return service.spread_stats.query(symbol=symbol, buy_exchange=buy_exchange, sell_exchange=sell_exchange)
+
+
+@analytics_router.get("/leadlag")
+async def get_lead_lag(request: Request, symbol: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Возвращает оценку опережения бирж по каждой паре: matrix[a][b] - на сколько мс биржа a
+    опережает биржу b (лаг максимальной корреляции доходностей mid цены; отрицательное - отстает),
+    и для каждой пары бирж - лидера, корреляцию на этом лаге и корреляции по всем лагам.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    return service.lead_lag.matrix(symbol)
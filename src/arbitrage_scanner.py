@@ -4,9 +4,11 @@ import logging
 from typing import Dict, Any, List, Tuple, Optional
 
 
-from src.data_models import NormalizedTicker, NormalizedOrderBook, ArbitrageOpportunity
+from src.data_models import OrderBookRecord, OpportunityRecord
 
-from src.utils import find_executable_arbitrage_volume_and_profit
+from src.utils import find_executable_arbitrage_volume_and_profit, find_executable_arbitrage_volume_and_profit_fixed
+from src.fixed_point import FixedPointOrderBook
+from src.market_store import OrderBook
 
 
 from src.config import DESIRED_TRADE_VOLUME_BASE, MIN_PROFIT_PCT
@@ -15,26 +17,39 @@ from src.config import DESIRED_TRADE_VOLUME_BASE, MIN_PROFIT_PCT
 logger = logging.getLogger(__name__)
 
 
-def find_arbitrage_opportunities_with_order_book(
-    market_data: Dict[str, Dict[str, Any]],
-    ) -> List[ArbitrageOpportunity]:
-
-    opportunities: List[ArbitrageOpportunity] = []
-
-    current_timestamp_ms = int(time.time() * 1000)
-
+def _find_executable_volume_and_profit(buy_ob, sell_ob, **kwargs) -> Tuple[float, float, float, float, float, float, float, float]:
+    """
+    Выбирает реализацию расчета объема и прибыли по типу книг:
+    целочисленную для пары FixedPointOrderBook, иначе float (fixed-point книга при этом
+    берется в float представлении, например, если для одной из бирж fixed-point недоступен;
+    копия создается один раз на книгу, см. FixedPointOrderBook.float_view).
+    """
+    if isinstance(buy_ob, FixedPointOrderBook) and isinstance(sell_ob, FixedPointOrderBook):
+        return find_executable_arbitrage_volume_and_profit_fixed(buy_ob=buy_ob, sell_ob=sell_ob, **kwargs)
+    if isinstance(buy_ob, FixedPointOrderBook):
+        buy_ob = buy_ob.float_view()
+    if isinstance(sell_ob, FixedPointOrderBook):
+        sell_ob = sell_ob.float_view()
+    return find_executable_arbitrage_volume_and_profit(buy_ob=buy_ob, sell_ob=sell_ob, **kwargs)
 
-    orderbooks_by_symbol: Dict[str, Dict[str, NormalizedOrderBook]] = {}
-    for exchange_id, data_by_symbol in market_data.items():
-        if isinstance(data_by_symbol, dict):
-            for symbol_key, data_item in data_by_symbol.items():
-                if isinstance(symbol_key, str) and symbol_key.endswith('_ob') and isinstance(data_item, NormalizedOrderBook):
-                     symbol = symbol_key[:-3]
-                     if symbol not in orderbooks_by_symbol:
-                         orderbooks_by_symbol[symbol] = {}
-                     orderbooks_by_symbol[symbol][exchange_id] = data_item
 
+def find_arbitrage_opportunities_with_order_book(
+    orderbooks_by_symbol: Dict[str, Dict[str, OrderBook]],
+    book_timestamps: Optional[Dict[str, Dict[str, int]]] = None,
+    max_skew_ms: Optional[float] = None,
+    ) -> List[OpportunityRecord]:
+    """
+    Ищет арбитражные возможности по книгам ордеров, сгруппированным по парам:
+    { symbol: { exchange_id: book } } (см. MarketStore.books_by_symbol).
+    Если переданы book_timestamps (та же группировка, время данных книги в мс, см. FreshnessIndex)
+    и max_skew_ms, пара бирж сравнивается, только если timestamps обеих книг известны
+    и расходятся не более чем на max_skew_ms.
+    Возвращает возможности с Net прибылью >= MIN_PROFIT_PCT, отсортированные по Net прибыли.
+    """
+
+    opportunities: List[OpportunityRecord] = []
 
+    current_timestamp_ms = int(time.time() * 1000)
 
     for symbol, exchanges_with_ob in orderbooks_by_symbol.items():
          available_exchanges = list(exchanges_with_ob.keys())
@@ -42,6 +57,8 @@ def find_arbitrage_opportunities_with_order_book(
          if len(available_exchanges) < 2:
              continue
 
+         timestamps_by_exchange = book_timestamps.get(symbol, {}) if book_timestamps is not None else None
+
          max_volume_to_consider = DESIRED_TRADE_VOLUME_BASE.get(symbol)
          if max_volume_to_consider is None or max_volume_to_consider <= 1e-9:
              logger.warning(f"DESIRED_TRADE_VOLUME_BASE not configured or zero for {symbol}. Skipping scanning for this pair.")
@@ -54,6 +71,14 @@ def find_arbitrage_opportunities_with_order_book(
                 if i == j: # Не ищем арбитраж на одной бирже
                     continue
 
+                # Пропускаем пару книг, данные которых разнесены во времени больше допустимого
+                if timestamps_by_exchange is not None and max_skew_ms is not None:
+                    timestamp_i = timestamps_by_exchange.get(available_exchanges[i])
+                    timestamp_j = timestamps_by_exchange.get(available_exchanges[j])
+                    if timestamp_i is None or timestamp_j is None or abs(timestamp_i - timestamp_j) > max_skew_ms:
+                        logger.debug(f"Skipping {symbol} {available_exchanges[i]}/{available_exchanges[j]}: order book timestamps skew exceeds {max_skew_ms} ms.")
+                        continue
+
                 # --- Направление 1: Купить на available_exchanges[i], Продать на available_exchanges[j] ---
                 buy_exchange_id = available_exchanges[i]
                 sell_exchange_id = available_exchanges[j]
@@ -74,7 +99,7 @@ def find_arbitrage_opportunities_with_order_book(
                     fees_paid_quote,
                     cost_total_quote,
                     revenue_total_quote
-                ) = find_executable_arbitrage_volume_and_profit(
+                ) = _find_executable_volume_and_profit(
                     buy_ob=buy_ob,
                     sell_ob=sell_ob,
                     buy_exchange_id=buy_exchange_id,
@@ -88,7 +113,7 @@ def find_arbitrage_opportunities_with_order_book(
                      opportunity_id = f"{symbol.replace('/', '')}-{buy_exchange_id.lower()}-{sell_exchange_id.lower()}"
                      calculated_net_profit_quote = (net_profit_pct / 100.0) * cost_total_quote if cost_total_quote > 1e-9 else 0.0
 
-                     opportunities.append(ArbitrageOpportunity(
+                     opportunities.append(OpportunityRecord(
                          id=opportunity_id,
                          symbol=symbol,
                          buy_exchange=buy_exchange_id,
@@ -103,6 +128,7 @@ def find_arbitrage_opportunities_with_order_book(
                          buy_network=None, # TODO
                          sell_network=None, # TODO
                          timestamp=current_timestamp_ms,
+                         stale=buy_ob.stale or sell_ob.stale,
                      ))
 
                 # --- Направление 2: Купить на available_exchanges[j], Продать на available_exchanges[i] ---
@@ -127,7 +153,7 @@ def find_arbitrage_opportunities_with_order_book(
                      fees_paid_quote_rev,
                      cost_total_quote_rev,
                      revenue_total_quote_rev
-                ) = find_executable_arbitrage_volume_and_profit(
+                ) = _find_executable_volume_and_profit(
                      buy_ob=buy_ob_rev, # Передаем OB для покупки в этом направлении
                      sell_ob=sell_ob_rev, # Передаем OB для продажи в этом направлении
                      buy_exchange_id=buy_exchange_id_rev,
@@ -141,7 +167,7 @@ def find_arbitrage_opportunities_with_order_book(
                      opportunity_id_rev = f"{symbol.replace('/', '')}-{buy_exchange_id_rev.lower()}-{sell_exchange_id_rev.lower()}"
                      calculated_net_profit_quote_rev = (net_profit_pct_rev / 100.0) * cost_total_quote_rev if cost_total_quote_rev > 1e-9 else 0.0
 
-                     opportunities.append(ArbitrageOpportunity(
+                     opportunities.append(OpportunityRecord(
                          id=opportunity_id_rev,
                          symbol=symbol,
                          buy_exchange=buy_exchange_id_rev, # Биржа покупки для этого направления
@@ -156,6 +182,7 @@ def find_arbitrage_opportunities_with_order_book(
                          buy_network=None, # TODO
                          sell_network=None, # TODO
                          timestamp=current_timestamp_ms,
+                         stale=buy_ob_rev.stale or sell_ob_rev.stale,
                      ))
 
     # Сортируем возможности по Net прибыли по убыванию перед возвратом
@@ -0,0 +1,394 @@
+"""
+Бэктест параметров сканера по записанному потоку книг ордеров (см. feed_recorder.py).
+
+Для каждой комбинации параметров из сетки (MIN_PROFIT_PCT, множитель DESIRED_TRADE_VOLUME_BASE,
+множитель комиссий EXCHANGE_TAKER_FEES_PCT, задержка исполнения) считает, что сканер нашел бы
+и что из этого удалось бы забрать: найденная возможность исполняется через latency мс
+по книгам, актуальным на момент исполнения, объемом, найденным сканером.
+
+Поток проходится один раз на пару для всей сетки:
+  - сканирование - на границах SCANNER_INTERVAL_SECONDS по времени записи, с теми же фильтрами,
+    что у сервиса (MAX_BOOK_AGE_SECONDS, MAX_BOOK_SKEW_MS);
+  - для каждого направления строится профиль уровней (шаги совместного прохода по asks и bids,
+    общие с find_executable_arbitrage_volume_and_profit(_fixed) функции из utils; для книг, записанных
+    как fixed-point (поля "pt"/"al"), - целочисленный проход, как у сканера) - он не зависит от параметров
+    сетки и пересчитывается, только если изменилась одна из двух книг;
+  - каждая комбинация параметров оценивается коротким проходом по профилю.
+Пары (и части сетки, если ядер больше, чем пар) считаются в отдельных процессах.
+
+Запуск: python -m src.backtest PATH [PATH ...] [--symbols BTC/USDT,ETH/USDT]
+        [--min-profit 0.0001,0.05] [--volume-mult 0.5,1,2] [--fee-mult 1,0.5] [--latency-ms 0,100,500]
+        [--workers N] [--json results.json]
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from fractions import Fraction
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from src.feed_recorder import list_segments, read_segment
+from src.fixed_point import FixedPointOrderBook, to_fixed_point_order_book
+from src.utils import (
+    iter_level_steps, clip_level_steps, best_net_profit_point, float_opportunity_metrics,
+    FixedPairUnits, fixed_pair_units, fixed_volume_units, fixed_fee_terms, iter_fixed_level_steps,
+    clip_fixed_level_steps, best_fixed_net_profit_point, fixed_opportunity_metrics,
+)
+from src.freshness import ClockOffsets
+from src.config import (
+    PAIRS_TO_TRACK_WS, EXCHANGE_TAKER_FEES_PCT, DESIRED_TRADE_VOLUME_BASE, MIN_PROFIT_PCT,
+    SCANNER_INTERVAL_SECONDS, MAX_BOOK_AGE_SECONDS, MAX_BOOK_SKEW_MS,
+)
+
+# Шаг профиля: (объем шага, цена покупки, цена продажи)
+ProfileStep = Tuple[float, float, float]
+
+
+class FixedLevelProfile(NamedTuple):
+    """Профиль пары fixed-point книг: общие единицы пары и целочисленные шаги (объем, цена покупки, цена продажи)."""
+    units: FixedPairUnits
+    steps: List[Tuple[int, int, int]]
+
+
+@dataclass(frozen=True)
+class BacktestParams:
+    min_profit_pct: float = MIN_PROFIT_PCT
+    volume_multiplier: float = 1.0 # Множитель лимита объема DESIRED_TRADE_VOLUME_BASE
+    fee_multiplier: float = 1.0    # Множитель тейкерских комиссий EXCHANGE_TAKER_FEES_PCT
+    latency_ms: int = 0            # Задержка между обнаружением и исполнением
+
+    @property
+    def detection_key(self) -> Tuple[float, float, float]:
+        """Параметры, от которых зависит результат сканирования (задержка влияет только на исполнение)."""
+        return self.min_profit_pct, self.volume_multiplier, self.fee_multiplier
+
+
+@dataclass
+class BacktestResult:
+    params: BacktestParams
+    scans: int = 0
+    detections: int = 0               # Возможностей, найденных сканером (по всем проходам)
+    detected_net_quote: float = 0.0   # Сумма Net прибыли найденных возможностей
+    executions: int = 0               # Попыток исполнения (одна на эпизод возможности)
+    missed_executions: int = 0        # Книга одной из бирж недоступна на момент исполнения
+    expected_net_quote: float = 0.0   # Net прибыль исполненных возможностей в момент обнаружения
+    captured_net_quote: float = 0.0   # Net прибыль по книгам на момент исполнения
+    profitable_executions: int = 0
+    filled_volume_base: float = 0.0
+
+    def merge(self, other: 'BacktestResult'):
+        for f in fields(self):
+            if f.name != 'params':
+                setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result.update(result.pop('params'))
+        result['capture_ratio'] = self.captured_net_quote / self.expected_net_quote if self.expected_net_quote > 0 else 0.0
+        result['win_rate'] = self.profitable_executions / self.executions if self.executions else 0.0
+        return result
+
+
+def build_level_profile(asks: Sequence[Tuple[float, float]], bids: Sequence[Tuple[float, float]],
+                        max_volume: float, min_gross_pct: float) -> List[ProfileStep]:
+    """
+    Шаги совместного прохода по asks биржи покупки и bids биржи продажи при лимите max_volume -
+    общие со сканером (utils.iter_level_steps, utils.clip_level_steps).
+    Проход останавливается, когда накопленная Gross прибыль опускается ниже min_gross_pct:
+    Net прибыль не больше Gross, поэтому дальше этого шага ни одна комбинация сетки не пройдет.
+    """
+    steps: List[ProfileStep] = []
+    cost = revenue = 0.0
+    gross_floor = 1 + min_gross_pct / 100.0
+    for step, buy_price, sell_price in clip_level_steps(iter_level_steps(asks, bids), max_volume):
+        steps.append((step, buy_price, sell_price))
+        cost += step * buy_price
+        revenue += step * sell_price
+        if revenue < cost * gross_floor:
+            break
+    return steps
+
+
+def build_fixed_level_profile(buy_ob: FixedPointOrderBook, sell_ob: FixedPointOrderBook,
+                              max_volume: float, min_gross_pct: float) -> Optional[FixedLevelProfile]:
+    """То же, что build_level_profile, для пары fixed-point книг (utils.iter_fixed_level_steps). None - шагов нет."""
+    units = fixed_pair_units(buy_ob.price_tick, buy_ob.amount_lot, sell_ob.price_tick, sell_ob.amount_lot)
+    max_volume_units = fixed_volume_units(max_volume, units)
+    if max_volume_units <= 0:
+        return None
+    steps: List[Tuple[int, int, int]] = []
+    cost = revenue = 0
+    gross_floor = 1 + Fraction(str(min_gross_pct)) / 100
+    for step, buy_price, sell_price in clip_fixed_level_steps(iter_fixed_level_steps(buy_ob, sell_ob, units), max_volume_units):
+        steps.append((step, buy_price, sell_price))
+        cost += step * buy_price
+        revenue += step * sell_price
+        if revenue * gross_floor.denominator < cost * gross_floor.numerator:
+            break
+    return FixedLevelProfile(units, steps) if steps else None
+
+
+def evaluate_profile(profile: Union[List[ProfileStep], FixedLevelProfile], buy_fee_pct: float, sell_fee_pct: float,
+                     min_profit_pct: float, volume_limit: float) -> Optional[Tuple[float, float]]:
+    """
+    Лучший объем по профилю для одной комбинации параметров: выбор объема и метрики - те же функции,
+    что в find_executable_arbitrage_volume_and_profit(_fixed). Net прибыль в quote - как в arbitrage_scanner.
+    Возвращает (объем, Net прибыль в quote) или None, если сканер не нашел бы возможность.
+    """
+    if isinstance(profile, FixedLevelProfile):
+        max_volume_units = fixed_volume_units(volume_limit, profile.units)
+        if max_volume_units <= 0:
+            return None
+        terms = fixed_fee_terms(buy_fee_pct, sell_fee_pct, min_profit_pct)
+        best = best_fixed_net_profit_point(clip_fixed_level_steps(profile.steps, max_volume_units), terms)
+        metrics = fixed_opportunity_metrics(best, profile.units, terms) if best is not None else None
+    else:
+        best = best_net_profit_point(clip_level_steps(profile, volume_limit), buy_fee_pct, sell_fee_pct, min_profit_pct)
+        metrics = float_opportunity_metrics(best) if best is not None else None
+    if metrics is None or metrics[0] <= 1e-9:
+        return None
+    volume, net_profit_pct, cost_total_quote = metrics[0], metrics[4], metrics[6]
+    return volume, (net_profit_pct / 100.0) * cost_total_quote if cost_total_quote > 1e-9 else 0.0
+
+
+def execute_volume(asks: Sequence[Tuple[float, float]], bids: Sequence[Tuple[float, float]], volume: float,
+                   buy_fee_pct: float, sell_fee_pct: float) -> Tuple[float, float]:
+    """Исполняет объем рыночными ордерами по книгам. Возвращает (исполненный объем, Net прибыль в quote)."""
+    filled_buy, cost = _sweep(asks, volume)
+    filled_sell, revenue = _sweep(bids, volume)
+    filled = min(filled_buy, filled_sell)
+    # Неполное исполнение: лишний объем одной стороны не учитываем (по средней цене стороны)
+    if filled_buy > filled:
+        cost *= filled / filled_buy
+    if filled_sell > filled:
+        revenue *= filled / filled_sell
+    return filled, revenue - cost * buy_fee_pct / 100.0 - revenue * sell_fee_pct / 100.0 - cost
+
+
+def _sweep(levels: Sequence[Tuple[float, float]], volume: float) -> Tuple[float, float]:
+    filled = notional = 0.0
+    for price, level_volume in levels:
+        take = min(level_volume, volume - filled)
+        filled += take
+        notional += take * price
+        if volume - filled <= 1e-12:
+            break
+    return filled, notional
+
+
+class _Book:
+    __slots__ = ('bids', 'asks', 'exchange_ts', 'received_ms', 'fixed')
+
+    def __init__(self, record: Dict[str, Any]):
+        self.bids = record['b']
+        self.asks = record['a']
+        self.received_ms = record['r']
+        self.exchange_ts = record['ts']
+        # Книга записана как fixed-point: восстанавливаем ее по шагу цены и лоту рынка
+        self.fixed: Optional[FixedPointOrderBook] = None
+        if 'pt' in record:
+            self.fixed = to_fixed_point_order_book(record['e'], record['s'], {'bids': self.bids, 'asks': self.asks},
+                                                   Fraction(record['pt']), Fraction(record['al']))
+
+    def data_ts(self, exchange_id: str, clock_offsets: ClockOffsets) -> int:
+        """Время данных по локальным часам, как FreshnessIndex.timestamp."""
+        if self.exchange_ts is None:
+            return self.received_ms
+        return clock_offsets.to_local(exchange_id, self.exchange_ts)
+
+
+def backtest_symbol(paths: List[str], symbol: str, grid: List[BacktestParams],
+                    scan_interval_ms: int = int(SCANNER_INTERVAL_SECONDS * 1000),
+                    max_age_ms: float = MAX_BOOK_AGE_SECONDS * 1000,
+                    max_skew_ms: float = MAX_BOOK_SKEW_MS,
+                    fees: Optional[Dict[str, float]] = None,
+                    base_volume: Optional[float] = None) -> List[BacktestResult]:
+    """Прогон сетки параметров по записанным книгам одной пары (один проход по данным)."""
+    fees = EXCHANGE_TAKER_FEES_PCT if fees is None else fees
+    base_volume = DESIRED_TRADE_VOLUME_BASE.get(symbol) if base_volume is None else base_volume
+    results = [BacktestResult(params) for params in grid]
+    if not base_volume or base_volume <= 1e-9:
+        return results
+
+    # Комбинации, которые сканируются одинаково, делят результат обнаружения
+    by_detection: Dict[Tuple[float, float, float], List[int]] = {}
+    for i, params in enumerate(grid):
+        by_detection.setdefault(params.detection_key, []).append(i)
+    max_volume = base_volume * max(params.volume_multiplier for params in grid)
+    min_gross_pct = min(params.min_profit_pct for params in grid)
+
+    books: Dict[str, _Book] = {}
+    clock_offsets = ClockOffsets() # Смещение часов бирж, как в FreshnessIndex сервиса
+    profiles: Dict[Tuple[str, str], Tuple[_Book, _Book, Union[List[ProfileStep], FixedLevelProfile, None]]] = {}
+    # Эпизод возможности на направлении: (время исполнения, книги при обнаружении) по индексу комбинации
+    episodes: Dict[Tuple[int, str, str], Tuple[int, _Book, _Book]] = {}
+    pending: List[Tuple[int, int, int, str, str, float, float]] = [] # heap: (время, seq, комбинация, buy, sell, объем, net)
+    sequence = itertools.count()
+
+    def scan(now_ms: int):
+        fresh = [exchange_id for exchange_id, book in books.items() if now_ms - book.received_ms <= max_age_ms]
+        for result in results:
+            result.scans += 1
+        for buy_exchange, sell_exchange in itertools.permutations(fresh, 2):
+            buy_book, sell_book = books[buy_exchange], books[sell_exchange]
+            if abs(buy_book.data_ts(buy_exchange, clock_offsets) - sell_book.data_ts(sell_exchange, clock_offsets)) > max_skew_ms:
+                continue
+            buy_fee, sell_fee = fees.get(buy_exchange), fees.get(sell_exchange)
+            if buy_fee is None or sell_fee is None:
+                continue
+            cached = profiles.get((buy_exchange, sell_exchange))
+            if cached is None or cached[0] is not buy_book or cached[1] is not sell_book:
+                # Как в сканере: целочисленный проход для пары fixed-point книг, иначе float
+                if buy_book.fixed is not None and sell_book.fixed is not None:
+                    profile = build_fixed_level_profile(buy_book.fixed, sell_book.fixed, max_volume, min_gross_pct)
+                else:
+                    profile = build_level_profile(buy_book.asks, sell_book.bids, max_volume, min_gross_pct)
+                cached = (buy_book, sell_book, profile)
+                profiles[(buy_exchange, sell_exchange)] = cached
+            profile = cached[2]
+            if not profile:
+                continue
+            for (min_profit_pct, volume_multiplier, fee_multiplier), indexes in by_detection.items():
+                found = evaluate_profile(profile, buy_fee * fee_multiplier, sell_fee * fee_multiplier,
+                                         min_profit_pct, base_volume * volume_multiplier)
+                if found is None:
+                    continue
+                volume, net_quote = found
+                for i in indexes:
+                    result = results[i]
+                    result.detections += 1
+                    result.detected_net_quote += net_quote
+                    # Новый эпизод: прошлое исполнение завершено и хотя бы одна книга обновилась
+                    episode = episodes.get((i, buy_exchange, sell_exchange))
+                    if episode is not None and (now_ms < episode[0] or (episode[1] is buy_book and episode[2] is sell_book)):
+                        continue
+                    execute_at = now_ms + grid[i].latency_ms
+                    episodes[(i, buy_exchange, sell_exchange)] = (execute_at, buy_book, sell_book)
+                    heapq.heappush(pending, (execute_at, next(sequence), i, buy_exchange, sell_exchange, volume, net_quote))
+
+    def execute(now_ms: int, i: int, buy_exchange: str, sell_exchange: str, volume: float, expected_net_quote: float):
+        result, params = results[i], grid[i]
+        result.executions += 1
+        buy_book, sell_book = books.get(buy_exchange), books.get(sell_exchange)
+        if buy_book is None or sell_book is None or now_ms - buy_book.received_ms > max_age_ms or now_ms - sell_book.received_ms > max_age_ms:
+            result.missed_executions += 1
+            return
+        filled, net_quote = execute_volume(buy_book.asks, sell_book.bids, volume,
+                                           fees[buy_exchange] * params.fee_multiplier, fees[sell_exchange] * params.fee_multiplier)
+        result.expected_net_quote += expected_net_quote
+        result.captured_net_quote += net_quote
+        result.filled_volume_base += filled
+        if net_quote > 0:
+            result.profitable_executions += 1
+
+    next_scan_ms: Optional[int] = None
+    for record in _iter_order_books(paths, symbol):
+        recorded_ms = record['r']
+        if next_scan_ms is None:
+            next_scan_ms = recorded_ms + scan_interval_ms
+        # События до этого обновления: исполнения и сканирования по порядку времени
+        while True:
+            if pending and pending[0][0] <= recorded_ms and pending[0][0] <= next_scan_ms:
+                execute_at, _, *order = heapq.heappop(pending)
+                execute(execute_at, *order)
+            elif next_scan_ms <= recorded_ms:
+                scan(next_scan_ms)
+                next_scan_ms += scan_interval_ms
+            else:
+                break
+        books[record['e']] = _Book(record)
+        if record['ts'] is not None:
+            clock_offsets.observe(record['e'], record['ts'], recorded_ms)
+
+    if next_scan_ms is not None:
+        scan(next_scan_ms)
+    while pending:
+        execute_at, _, *order = heapq.heappop(pending)
+        execute(execute_at, *order)
+    return results
+
+
+def _iter_order_books(paths: List[str], symbol: str) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        for segment in list_segments(path):
+            for record in read_segment(segment, symbol=symbol):
+                if record['k'] == 'ob':
+                    yield record
+
+
+def _backtest_task(args) -> List[BacktestResult]:
+    return backtest_symbol(*args)
+
+
+def run_backtest(paths: List[str], symbols: List[str], grid: List[BacktestParams],
+                 workers: Optional[int] = None) -> List[BacktestResult]:
+    """
+    Прогон сетки по всем парам в пуле процессов. Каждая задача - одна пара и часть сетки;
+    сетка делится на части, только если процессов больше, чем пар.
+    Результаты по парам суммируются для каждой комбинации параметров.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = max(1, min(len(grid), workers // max(1, len(symbols))))
+    # Части сетки группируются по detection_key, чтобы одинаковые сканирования не считались дважды
+    ordered = sorted(grid, key=lambda params: params.detection_key)
+    chunk_size = math.ceil(len(ordered) / chunks)
+    tasks = [(paths, symbol, ordered[start:start + chunk_size])
+             for symbol in symbols for start in range(0, len(ordered), chunk_size)]
+
+    if workers == 1:
+        task_results = [_backtest_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            task_results = list(executor.map(_backtest_task, tasks))
+
+    totals = {params: BacktestResult(params) for params in grid}
+    for results in task_results:
+        for result in results:
+            totals[result.params].merge(result)
+    return [totals[params] for params in grid]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='Каталоги сегментов или отдельные файлы feed-*.jsonl.gz')
+    parser.add_argument('--symbols', default=','.join(PAIRS_TO_TRACK_WS))
+    parser.add_argument('--min-profit', type=_float_list, default=[MIN_PROFIT_PCT], help='Значения MIN_PROFIT_PCT через запятую')
+    parser.add_argument('--volume-mult', type=_float_list, default=[1.0], help='Множители DESIRED_TRADE_VOLUME_BASE')
+    parser.add_argument('--fee-mult', type=_float_list, default=[1.0], help='Множители EXCHANGE_TAKER_FEES_PCT')
+    parser.add_argument('--latency-ms', type=_float_list, default=[0.0], help='Задержки исполнения, мс')
+    parser.add_argument('--workers', type=int, default=None, help='Количество процессов (по умолчанию - число ядер)')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    symbols = [symbol for symbol in args.symbols.split(',') if symbol]
+    grid = [BacktestParams(min_profit_pct=min_profit, volume_multiplier=volume_mult, fee_multiplier=fee_mult, latency_ms=int(latency))
+            for min_profit, volume_mult, fee_mult, latency in itertools.product(args.min_profit, args.volume_mult, args.fee_mult, args.latency_ms)]
+
+    started = time.perf_counter()
+    results = run_backtest(args.paths, symbols, grid, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    rows = [result.to_dict() for result in results]
+    print(f"Backtest: {len(symbols)} pairs x {len(grid)} configurations in {elapsed:.1f}s")
+    print(f"{'min%':>8} {'vol x':>6} {'fee x':>6} {'lat ms':>7} {'detect':>8} {'exec':>6} {'miss':>5} "
+          f"{'expected':>12} {'captured':>12} {'capture':>8} {'win':>6}")
+    for row in sorted(rows, key=lambda row: row['captured_net_quote'], reverse=True):
+        print(f"{row['min_profit_pct']:>8.4f} {row['volume_multiplier']:>6.2f} {row['fee_multiplier']:>6.2f} {row['latency_ms']:>7} "
+              f"{row['detections']:>8} {row['executions']:>6} {row['missed_executions']:>5} "
+              f"{row['expected_net_quote']:>12.4f} {row['captured_net_quote']:>12.4f} {row['capture_ratio']:>8.2%} {row['win_rate']:>6.1%}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'symbols': symbols, 'elapsed_seconds': elapsed, 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
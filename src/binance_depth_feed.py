@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import websockets
+
+from src.config import (
+    BINANCE_DEPTH_WS_URL, BINANCE_DEPTH_UPDATE_SPEED_MS, BINANCE_DEPTH_SNAPSHOT_LIMIT,
+    BINANCE_DEPTH_MAX_RESYNCS,
+)
+from src.startup import LazyModule
+
+logger = logging.getLogger(__name__)
+
+# Ошибки ccxt без импорта ccxt при загрузке модуля (см. startup.LazyModule)
+ccxt_errors = LazyModule('ccxt.base.errors')
+
+# Уровни книги: [(price, volume)], лучшая цена первая
+Levels = List[Tuple[float, float]]
+
+
+class SequenceGapError(Exception):
+    """Пропуск в последовательности diff-depth событий: локальная книга больше не согласована с биржей."""
+
+
+class _BookSide:
+    """
+    Одна сторона локальной книги: объемы по ценам в dict и отсортированный список ключей.
+    Ключ - цена для asks и минус цена для bids, поэтому у обеих сторон лучшая цена в начале списка.
+    Вставка/удаление уровня - bisect по списку ключей, выдача верхних уровней - срез без сортировки.
+
+    Если снапшот обрезан по limit, книга точна только до худшей цены снапшота (граница): уровни
+    дальше нее, которые не менялись после снапшота, неизвестны. Такие уровни не хранятся, а когда
+    уровней в пределах границы становится меньше нужной глубины, книгу надо загрузить заново (см. covers).
+    """
+    __slots__ = ('_sign', '_volumes', '_keys', '_boundary')
+
+    def __init__(self, descending: bool):
+        self._sign = -1.0 if descending else 1.0
+        self._volumes: Dict[float, float] = {}
+        self._keys: List[float] = []
+        self._boundary: Optional[float] = None # Ключ худшего уровня обрезанного снапшота; None - книга полная
+
+    def reset(self, levels: List[List[str]], limit: int):
+        self._volumes = {}
+        for price_str, volume_str in levels:
+            volume = float(volume_str)
+            if volume > 0:
+                self._volumes[self._sign * float(price_str)] = volume
+        self._keys = sorted(self._volumes)
+        self._boundary = self._keys[-1] if len(levels) >= limit and self._keys else None
+
+    def apply(self, levels: List[List[str]]):
+        """Применяет изменения уровней из diff события (нулевой объем удаляет уровень)."""
+        volumes, keys, boundary = self._volumes, self._keys, self._boundary
+        for price_str, volume_str in levels:
+            key = self._sign * float(price_str)
+            if boundary is not None and key > boundary:
+                continue # За границей снапшота
+            volume = float(volume_str)
+            if volume > 0:
+                if key not in volumes:
+                    keys.insert(bisect_left(keys, key), key)
+                volumes[key] = volume
+            elif key in volumes:
+                del volumes[key]
+                del keys[bisect_left(keys, key)]
+
+    def top(self, depth: int) -> Levels:
+        sign, volumes = self._sign, self._volumes
+        return [(sign * key, volumes[key]) for key in self._keys[:depth]]
+
+    def covers(self, depth: int) -> bool:
+        """True, если верхние depth уровней известны точно (книга полная или уровней до границы достаточно)."""
+        return self._boundary is None or len(self._keys) >= depth
+
+
+class BinanceDepthBook:
+    """
+    Локальная книга ордеров Binance по REST снапшоту и diff-depth событиям.
+
+    Правила синхронизации (документация Binance "How to manage a local order book correctly"):
+      - события с u <= lastUpdateId снапшота отбрасываются;
+      - первое применяемое событие должно покрывать lastUpdateId + 1 (U <= lastUpdateId + 1 <= u);
+      - каждое следующее событие должно начинаться с U == u предыдущего + 1.
+    Нарушение - SequenceGapError, книгу нужно загрузить заново.
+    """
+
+    def __init__(self, snapshot_limit: int):
+        self.snapshot_limit = snapshot_limit
+        self.bids = _BookSide(descending=True)
+        self.asks = _BookSide(descending=False)
+        self.last_update_id: Optional[int] = None
+        self._synced = False
+
+    def load_snapshot(self, snapshot: Dict[str, Any]):
+        self.bids.reset(snapshot.get('bids', []), self.snapshot_limit)
+        self.asks.reset(snapshot.get('asks', []), self.snapshot_limit)
+        self.last_update_id = int(snapshot['lastUpdateId'])
+        self._synced = False
+
+    def apply_event(self, event: Dict[str, Any]) -> bool:
+        """Применяет diff событие. Возвращает False, если событие старее снапшота и пропущено."""
+        if self.last_update_id is None:
+            raise SequenceGapError("Нет снапшота книги")
+        first_id, final_id = event['U'], event['u']
+        if final_id <= self.last_update_id:
+            return False
+        expected_id = self.last_update_id + 1
+        # До первого применения событие может начинаться раньше снапшота, дальше - строго подряд
+        gap = first_id != expected_id if self._synced else first_id > expected_id
+        if gap:
+            raise SequenceGapError(f"Ожидался U={expected_id}, получено U={first_id} (u={final_id})")
+        self.bids.apply(event.get('b', []))
+        self.asks.apply(event.get('a', []))
+        self.last_update_id = final_id
+        self._synced = True
+        return True
+
+    def covers(self, depth: int) -> bool:
+        return self.bids.covers(depth) and self.asks.covers(depth)
+
+
+class BinanceDepthFeed:
+    """
+    Специализированный обработчик diff-depth потока Binance для одной пары.
+
+    В отличие от ccxt.pro watch_order_book, не разбирает, не сортирует и не копирует всю книгу
+    на каждое сообщение: изменения применяются к локальной книге по уровням, а наружу через
+    on_book(bids, asks, timestamp) отдаются только верхние depth уровней.
+
+    Ошибки соединения обрабатываются переподключением внутри run(); пропуски последовательности
+    и сокращение точно известной глубины ниже depth - повторной загрузкой снапшота. Если книга не восстанавливается за BINANCE_DEPTH_MAX_RESYNCS
+    попыток подряд, исключение пробрасывается выше (как ошибки ccxt.pro watch_order_book),
+    и _watch_exchange переподключает биржу.
+    """
+
+    def __init__(self, exchange, symbol: str, depth: int,
+                 on_book: Callable[[Levels, Levels, Optional[int]], None],
+                 ws_url: str = BINANCE_DEPTH_WS_URL,
+                 update_speed_ms: int = BINANCE_DEPTH_UPDATE_SPEED_MS,
+                 snapshot_limit: int = BINANCE_DEPTH_SNAPSHOT_LIMIT,
+                 max_resyncs: int = BINANCE_DEPTH_MAX_RESYNCS):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.market_id = exchange.market(symbol)['id'] # Например, 'BTCUSDT'
+        self.depth = depth
+        self.on_book = on_book
+        self.stream_url = f"{ws_url}/{self.market_id.lower()}@depth@{update_speed_ms}ms"
+        self.snapshot_limit = snapshot_limit
+        self.max_resyncs = max_resyncs
+        self.book = BinanceDepthBook(snapshot_limit)
+        # Сколько верхних уровней должно быть известно точно (больше, чем дает снапшот, не бывает)
+        self.required_depth = min(depth, snapshot_limit)
+        # Счетчики для логов и диагностики
+        self.resync_count = 0
+        self.events_applied = 0
+
+    async def run(self):
+        """Поддерживает соединение и локальную книгу, пока задачу не отменят."""
+        failures = 0
+        while True:
+            try:
+                async with websockets.connect(self.stream_url, max_queue=None) as ws:
+                    logger.info(f"Binance depth: подключено к {self.stream_url}")
+                    failures = 0
+                    await self._consume(ws)
+            except (websockets.ConnectionClosed, OSError, asyncio.TimeoutError) as e:
+                failures += 1
+                if failures > self.max_resyncs:
+                    raise ccxt_errors.NetworkError(f"Binance depth {self.symbol}: не удалось восстановить соединение: {e}") from e
+                delay = min(2 ** failures, 30)
+                logger.warning(f"Binance depth {self.symbol}: соединение потеряно ({e}). Переподключение через {delay}с.")
+                await asyncio.sleep(delay)
+
+    async def _consume(self, ws):
+        """Загружает снапшот и применяет события потока; при пропуске перезагружает снапшот."""
+        consecutive_resyncs = 0
+        # События, пришедшие во время REST запроса, буферизует websockets (max_queue=None),
+        # поэтому снапшот загружается после подключения к потоку - как требует Binance.
+        await self._load_snapshot()
+        async for message in ws:
+            event = json.loads(message)
+            try:
+                if not self.book.apply_event(event):
+                    continue
+            except SequenceGapError as e:
+                consecutive_resyncs += 1
+                self.resync_count += 1
+                if consecutive_resyncs > self.max_resyncs:
+                    raise ccxt_errors.ExchangeError(f"Binance depth {self.symbol}: книга не синхронизируется после {self.max_resyncs} попыток: {e}") from e
+                logger.warning(f"Binance depth {self.symbol}: {e}. Повторная загрузка снапшота ({consecutive_resyncs}/{self.max_resyncs}).")
+                await self._load_snapshot()
+                continue
+            consecutive_resyncs = 0
+            self.events_applied += 1
+            if not self.book.covers(self.required_depth):
+                # Уровни съедены до границы снапшота: дальше нее книга неизвестна
+                self.resync_count += 1
+                logger.info(f"Binance depth {self.symbol}: известно меньше {self.required_depth} уровней. Повторная загрузка снапшота.")
+                await self._load_snapshot()
+                continue
+            self.on_book(self.book.bids.top(self.depth), self.book.asks.top(self.depth), event.get('E'))
+
+    async def _load_snapshot(self):
+        # Неявный REST метод ccxt: GET /api/v3/depth (учитывает rate limit биржи)
+        started = time.time()
+        snapshot = await self.exchange.public_get_depth({'symbol': self.market_id, 'limit': self.snapshot_limit})
+        self.book.load_snapshot(snapshot)
+        logger.info(f"Binance depth {self.symbol}: загружен снапшот lastUpdateId={self.book.last_update_id} "
+                    f"за {time.time() - started:.3f}с.")
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from dataclasses import dataclass, fields
 from typing import List, Tuple, Dict
 
 # Модель для нормализованных данных тикера
@@ -21,14 +22,99 @@ class NormalizedOrderBook(BaseModel):
     timestamp: int | None = None
     datetime: str | None = None
     # nonce: int | None = None # Можно добавить, если нужно отслеживать версии книги
+    stale: bool = False # True для книги из warm-start снапшота, пока ее не заменят живые данные
 
-# Модель для найденной арбитражной возможности (пока простая, расширим позже)
+# Модель для найденной арбитражной возможности (с учетом объема и тейкерских комиссий)
 class ArbitrageOpportunity(BaseModel):
+    id: str                # Стабильный ID возможности: '<BASEQUOTE>-<buy_exchange>-<sell_exchange>'
     symbol: str            # Стандартизированный символ пары
     buy_exchange: str      # Биржа для покупки
     sell_exchange: str     # Биржа для продажи
-    buy_price: float       # Цена покупки (Lowest Ask на бирже продажи!)
-    sell_price: float      # Цена продажи (Highest Bid на бирже покупки!)
+    executable_volume_base: float # Объем в базовой валюте, который можно прогнать с прибылью
+    buy_price: float       # Средняя цена покупки для этого объема (по asks биржи покупки)
+    sell_price: float      # Средняя цена продажи для этого объема (по bids биржи продажи)
     potential_profit_pct: float # Потенциальная прибыль в процентах (до комиссий)
+    fees_paid_quote: float # Тейкерские комиссии обеих сторон в цитируемой валюте
+    net_profit_pct: float  # Чистая прибыль в процентах (после тейкерских комиссий)
+    net_profit_quote: float # Чистая прибыль в цитируемой валюте
+    buy_network: str | None = None  # Сеть вывода на бирже покупки (пока не рассчитывается)
+    sell_network: str | None = None # Сеть депозита на бирже продажи (пока не рассчитывается)
     timestamp: int         # Время, когда возможность была найдена (Unix timestamp ms)
-    # Добавить: volume_available (объем, который можно реализовать), комиссии, и т.д.
\ No newline at end of file
+    stale: bool = False    # True, если возможность рассчитана по книгам из warm-start снапшота
+    # Статистики спреда лучших цен направления по окнам ('1m', '15m', '1h'): mean, std, zscore, percentile_rank
+    spread_stats: Dict[str, Dict[str, float | None]] | None = None
+    # Задержки этапов конвейера, мс: exchange_to_receive, receive_to_normalize, normalize_to_scan, scan,
+    # scan_to_enqueue (только в WS сообщениях); enqueue_to_send известен только после отправки и есть лишь
+    # в гистограммах. None - этап неизвестен (например, биржа не присылает timestamp)
+    stage_latencies_ms: Dict[str, float | None] | None = None
+
+
+# --- Внутренние записи для горячего пути (без валидации) ---
+# Pydantic модели выше используются на границе API (REST/WS ответы) и для выборочной
+# валидации входящих данных. Внутри сервиса (WS обновления, хранилище, сканер) данные
+# живут в этих slotted записях: их создание не валидирует каждый уровень книги.
+# Тикеры и книги неизменяемы (frozen): опубликованная в MarketStore версия не меняется,
+# поэтому читатели снапшота могут держать ее без копирования.
+
+@dataclass(slots=True, frozen=True)
+class TickerRecord:
+    exchange: str
+    symbol: str
+    bid: float
+    ask: float
+    last: float | None = None
+    timestamp: int | None = None
+    datetime: str | None = None
+
+    def to_model(self) -> NormalizedTicker:
+        """Создает (и валидирует) Pydantic модель для ответа API."""
+        return NormalizedTicker(**{f.name: getattr(self, f.name) for f in fields(self)})
+
+
+@dataclass(slots=True, frozen=True)
+class OrderBookRecord:
+    exchange: str
+    symbol: str
+    bids: List[Tuple[float, float]] # [(price, volume)], лучшая цена первая
+    asks: List[Tuple[float, float]]
+    timestamp: int | None = None
+    datetime: str | None = None
+    stale: bool = False
+
+    def to_model(self) -> NormalizedOrderBook:
+        """Создает (и валидирует) Pydantic модель для ответа API или выборочной проверки."""
+        return NormalizedOrderBook(**{f.name: getattr(self, f.name) for f in fields(self)})
+
+
+@dataclass(slots=True)
+class OpportunityRecord:
+    id: str
+    symbol: str
+    buy_exchange: str
+    sell_exchange: str
+    executable_volume_base: float
+    buy_price: float
+    sell_price: float
+    potential_profit_pct: float
+    fees_paid_quote: float
+    net_profit_pct: float
+    net_profit_quote: float
+    buy_network: str | None
+    sell_network: str | None
+    timestamp: int
+    stale: bool = False
+    spread_stats: Dict[str, Dict[str, float | None]] | None = None # см. SpreadStats.annotate
+    stage_latencies_ms: Dict[str, float | None] | None = None # см. LatencyTracer.annotate
+
+    def to_model(self) -> ArbitrageOpportunity:
+        """Создает (и валидирует) Pydantic модель для ответа API."""
+        return ArbitrageOpportunity(**{f.name: getattr(self, f.name) for f in fields(self)})
+
+# Модель запроса на изменение подписок во время работы (admin API)
+class SubscriptionUpdate(BaseModel):
+    add_exchanges: List[str] = []    # ID бирж ccxt.pro для подключения (например, 'okx')
+    remove_exchanges: List[str] = [] # ID бирж для отключения
+    add_symbols: List[str] = []      # Пары в формате 'BASE/QUOTE' для подписки на всех биржах
+    remove_symbols: List[str] = []   # Пары для отписки на всех биржах
+    # Лимиты объема для сканера по новым парам (см. DESIRED_TRADE_VOLUME_BASE в config.py)
+    trade_volume_limits: Dict[str, float] = {}
@@ -0,0 +1,65 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Any, Dict
+
+# Импортируем КЛАСС MarketDataService (для типизации)
+# Экземпляр сервиса получаем из app.state в хэндлере
+from src.market_data_service import MarketDataService
+from src.admin_endpoints import require_admin_token
+from src.memory_accounting import TracemallocSession
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# --- Создаем APIRouter для отладочных эндпоинтов ---
+# Доступ как у /admin: эндпоинты включают tracemalloc для всего процесса и обходят всю память
+debug_router = APIRouter(prefix="/debug", dependencies=[Depends(require_admin_token)])
+
+# tracemalloc - глобальное состояние процесса, поэтому и сессия сравнения одна на процесс
+_tracemalloc_session = TracemallocSession()
+
+
+@debug_router.get("/memory")
+async def get_memory(request: Request, top_books: int = Query(50, ge=0, le=10_000)) -> Dict[str, Any]:
+    """
+    Память процесса (RSS) и разбивка по компонентам сервиса: книги по биржам и самые большие
+    книги по (биржа, пара), тикеры, latest_opportunities, история возможностей, очередь каждого
+    WS подписчика, онлайн статистики. Если запущена tracemalloc сессия, добавляется ее статус.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    report = await service.memory_report(top_books=top_books)
+    report['tracemalloc_session_active'] = _tracemalloc_session.active
+    return report
+
+
+@debug_router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(frames: int = Query(1, ge=1, le=50)) -> Dict[str, Any]:
+    """
+    Включает tracemalloc (frames - глубина стека аллокаций) и запоминает базовый снапшот.
+    Пока сессия активна, аллокации медленнее: после сравнения ее следует остановить.
+    """
+    result = await asyncio.to_thread(_tracemalloc_session.start, frames)
+    logger.info(f"Debug: tracemalloc сессия запущена (кадров: {result['frames']}).")
+    return result
+
+
+@debug_router.get("/memory/tracemalloc/diff")
+async def diff_tracemalloc(
+    top: int = Query(20, ge=1, le=1000),
+    group_by: str = Query('lineno', pattern='^(lineno|filename|traceback)$'),
+    reset: bool = False,
+) -> Dict[str, Any]:
+    """Рост памяти по местам аллокаций с момента базового снапшота; reset=true сдвигает базу на текущий момент."""
+    try:
+        return await asyncio.to_thread(_tracemalloc_session.diff, top, group_by, reset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@debug_router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc() -> Dict[str, Any]:
+    _tracemalloc_session.stop()
+    logger.info("Debug: tracemalloc сессия остановлена.")
+    return {"tracing": False}
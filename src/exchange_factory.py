@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional, Protocol
+
+from src.config import EXCHANGE_FACTORY
+from src.startup import LazyModule, preload_module
+
+
+class ExchangeFactory(Protocol):
+    """
+    Источник объектов бирж для MarketDataService._watch_exchange.
+
+    create() возвращает объект с интерфейсом биржи ccxt.pro, который использует сервис:
+    id, has, markets, currencies, precisionMode, load_markets, set_markets,
+    watch_order_book, watch_ticker, close (и clients - словарь WS соединений).
+    prepare() вызывается перед create() и загружает модули бирж, не блокируя event loop.
+    """
+
+    def supports(self, exchange_id: str) -> bool: ...
+
+    async def prepare(self, exchange_ids: Iterable[str]) -> None: ...
+
+    def create(self, exchange_id: str, options: Dict[str, Any]) -> Any: ...
+
+
+class CcxtProExchangeFactory:
+    """
+    Реальные биржи: класс ccxt.pro по ID биржи.
+
+    ccxt.pro не импортируется при загрузке модуля: prepare() импортирует его в потоке при
+    подключении первой биржи. Загрузить только нужные биржи нельзя - ccxt/__init__.py и
+    ccxt/pro/__init__.py импортируют классы всех бирж, поэтому exchange_ids не сужают импорт.
+    """
+
+    def __init__(self):
+        self._ccxtpro = LazyModule('ccxt.pro')
+        self._loading: Optional[asyncio.Future] = None
+
+    def supports(self, exchange_id: str) -> bool:
+        # Сервис вызывает supports() после prepare(); без нее ccxt.pro импортируется синхронно
+        return hasattr(self._ccxtpro, exchange_id)
+
+    async def prepare(self, exchange_ids: Iterable[str]):
+        # Одна загрузка на все биржи: задачи подключения, стартующие одновременно, ждут ее вместе
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(preload_module('ccxt.pro'))
+        await asyncio.shield(self._loading)
+
+    def create(self, exchange_id: str, options: Dict[str, Any]) -> Any:
+        return getattr(self._ccxtpro, exchange_id)(options)
+
+
+def default_exchange_factory() -> ExchangeFactory:
+    """Фабрика по EXCHANGE_FACTORY: 'ccxtpro' или 'simulator' (общий симулятор процесса)."""
+    if EXCHANGE_FACTORY == 'simulator':
+        from src.exchange_simulator import default_simulator
+        return default_simulator()
+    if EXCHANGE_FACTORY != 'ccxtpro':
+        raise ValueError(f"Неизвестный EXCHANGE_FACTORY: {EXCHANGE_FACTORY} (доступны: ccxtpro, simulator)")
+    return CcxtProExchangeFactory()
@@ -0,0 +1,367 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from src.fixed_point import TICK_SIZE
+from src.startup import LazyModule, preload_module
+from src.config import (
+    PAIRS_TO_TRACK_WS, SIMULATOR_SEED, SIMULATOR_ORDER_BOOK_HZ, SIMULATOR_TICKER_HZ, SIMULATOR_SPREAD_BPS,
+    SIMULATOR_VOLATILITY_BPS, SIMULATOR_CROSSINGS_PER_MINUTE, SIMULATOR_CROSSING_BPS, SIMULATOR_CROSSING_SECONDS,
+    SIMULATOR_DISCONNECT_INTERVAL_SECONDS,
+)
+
+# Симулятор поднимает те же ошибки, что и ccxt.pro (см. startup.LazyModule)
+ccxt_errors = LazyModule('ccxt.base.errors')
+
+# Глубина книги, если watch_order_book вызван без limit
+DEFAULT_DEPTH = 100
+# Шаг случайного блуждания середины: середина - функция времени с начала работы симулятора,
+# одинаковая для всех бирж и воспроизводимая при одном seed
+_WALK_STEP_SECONDS = 0.1
+# Сколько верхних уровней меняет объем на каждом обновлении (остальные берутся из шаблона книги)
+_VOLATILE_LEVELS = 5
+
+
+class _Market:
+    """Общая для всех бирж середина пары: случайное блуждание в шагах цены."""
+    __slots__ = ('symbol', 'tick', 'lot', 'half_spread_ticks', 'steps', 'rng', 'step_sigma')
+
+    def __init__(self, symbol: str, seed: int, spread_bps: float, volatility_bps: float):
+        self.symbol = symbol
+        self.rng = random.Random(f"{seed}:{symbol}")
+        price = 10 ** self.rng.uniform(-1, 4.7) # Опорная цена 0.1 .. 50 000
+        # Шаг цены - 1/100 000 цены (степень 10), лот - так, чтобы уровень был порядка 1000 в цитируемой валюте
+        self.tick = 10.0 ** math.floor(math.log10(price) - 5)
+        self.lot = 10.0 ** math.floor(math.log10(1000 / price) - 3)
+        mid_ticks = price / self.tick
+        self.half_spread_ticks = max(1.0, mid_ticks * spread_bps / 20_000)
+        self.step_sigma = volatility_bps / 10_000 * math.sqrt(_WALK_STEP_SECONDS)
+        self.steps: List[float] = [mid_ticks]
+
+    def mid_ticks(self, elapsed: float) -> float:
+        step = int(elapsed / _WALK_STEP_SECONDS)
+        steps, rng, sigma = self.steps, self.rng, self.step_sigma
+        while len(steps) <= step:
+            steps.append(steps[-1] * math.exp(rng.gauss(0.0, sigma)))
+        return steps[step]
+
+
+class SimulatedExchange:
+    """
+    Одно "подключение" к симулированной бирже с интерфейсом ccxt.pro, который использует
+    MarketDataService: has, markets, load_markets/set_markets, watch_order_book, watch_ticker, close.
+
+    watch_* возвращают обновления с частотой симулятора на каждую подписку (без пачек догоняющих
+    обновлений, если потребитель не успевает). После disconnect() (или случайного разрыва)
+    ожидающие и следующие вызовы watch_* поднимают NetworkError - сервис переподключается
+    и создает новый объект через фабрику, как с ccxt.pro.
+    """
+    simulated = True
+
+    def __init__(self, simulator: 'ExchangeSimulator', exchange_id: str, options: Dict[str, Any]):
+        self.simulator = simulator
+        self.id = exchange_id
+        self.options = options
+        self.has = {'ws': True, 'watchOrderBook': True, 'watchTicker': True}
+        self.markets: Optional[Dict[str, Dict[str, Any]]] = None
+        self.currencies: Optional[Dict[str, Any]] = None
+        self.precisionMode = TICK_SIZE
+        self.clients: Dict[str, Any] = {} # WS соединений ccxt.pro нет; _watch_exchange вызывает close() для simulated всегда
+        self.connected = True
+        self.updates = 0
+        self._next_at: Dict[Tuple[str, str], float] = {}
+        self._failing_symbols: set = set()
+        self._last_books: Dict[str, Dict[str, Any]] = {}
+        interval = simulator.disconnect_interval
+        self._disconnect_at = time.monotonic() + simulator.rng.expovariate(1 / interval) if interval else None
+
+    async def load_markets(self, reload: bool = False) -> Dict[str, Dict[str, Any]]:
+        await asyncio.sleep(0)
+        self.markets = {symbol: self.simulator.market_description(symbol) for symbol in self.simulator.symbols}
+        self.currencies = {code: {'code': code} for market in self.markets.values() for code in (market['base'], market['quote'])}
+        return self.markets
+
+    def set_markets(self, markets: Dict[str, Dict[str, Any]], currencies: Optional[Dict[str, Any]] = None):
+        self.markets = markets
+        self.currencies = currencies or {}
+        return markets
+
+    def disconnect(self):
+        self.connected = False
+
+    def fail_symbol(self, symbol: str):
+        """Следующий watch_* по паре поднимет BadSymbol."""
+        self._failing_symbols.add(symbol)
+
+    async def close(self):
+        self.connected = False
+        self.simulator.forget(self)
+
+    async def watch_order_book(self, symbol: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        self._check_symbol(symbol)
+        script = self.simulator.script_for(self.id, symbol)
+        if script is not None:
+            book = await self._next_scripted_book(script, symbol)
+        else:
+            await self._wait_turn('ob', symbol, self.simulator.order_book_hz)
+            book = self.simulator.order_book(self.id, symbol, limit or DEFAULT_DEPTH)
+        self._last_books[symbol] = book
+        self.updates += 1
+        return book
+
+    async def watch_ticker(self, symbol: str) -> Dict[str, Any]:
+        self._check_symbol(symbol)
+        await self._wait_turn('ticker', symbol, self.simulator.ticker_hz)
+        book = self._last_books.get(symbol)
+        if book is None or self.simulator.script_for(self.id, symbol) is None:
+            book = self.simulator.order_book(self.id, symbol, 1)
+        bid, ask = book['bids'][0][0], book['asks'][0][0]
+        self.updates += 1
+        return {'symbol': symbol, 'bid': bid, 'ask': ask, 'last': (bid + ask) / 2,
+                'timestamp': int(time.time() * 1000), 'datetime': None}
+
+    def _check_symbol(self, symbol: str):
+        if symbol in self._failing_symbols:
+            self._failing_symbols.discard(symbol)
+            raise ccxt_errors.BadSymbol(f"{self.id} does not have market symbol {symbol} (simulated)")
+        if self.markets is not None and symbol not in self.markets:
+            raise ccxt_errors.BadSymbol(f"{self.id} does not have market symbol {symbol}")
+
+    def _check_connection(self, now: float):
+        if self._disconnect_at is not None and now >= self._disconnect_at:
+            self.connected = False
+        if not self.connected:
+            raise ccxt_errors.NetworkError(f"{self.id}: simulated disconnect")
+
+    async def _wait_turn(self, kind: str, symbol: str, hz: float):
+        now = time.monotonic()
+        key = (kind, symbol)
+        next_at = self._next_at.get(key, now) # Первое обновление (снапшот) - сразу
+        self._next_at[key] = max(next_at, now) + 1 / hz
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+        self._check_connection(time.monotonic())
+        self._check_symbol(symbol)
+
+    async def _next_scripted_book(self, script: Deque[Dict[str, Any]], symbol: str) -> Dict[str, Any]:
+        if not script:
+            # Сценарий пары закончился: новых обновлений нет (как у затихшего потока), ждем отмены или разрыва
+            while True:
+                await asyncio.sleep(0.1)
+                self._check_connection(time.monotonic())
+        event = script[0]
+        delay = self.simulator.script_started + event['at'] - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._check_connection(time.monotonic())
+        self._check_symbol(symbol)
+        script.popleft() # Событие снимается после ожидания: при отмене или разрыве его получит следующая подписка
+        return {'symbol': symbol, 'bids': [list(level) for level in event['bids']], 'asks': [list(level) for level in event['asks']],
+                'timestamp': event.get('timestamp') or int(time.time() * 1000), 'datetime': None, 'nonce': None}
+
+
+class ExchangeSimulator:
+    """
+    Локальный симулятор бирж: фабрика SimulatedExchange для MarketDataService (см. exchange_factory.py).
+
+    Книги всех бирж строятся вокруг общей середины пары (случайное блуждание, функция времени
+    и seed) со смещением биржи меньше половины спреда, поэтому без вмешательства книги разных бирж
+    не пересекаются. inject_crossing() (или случайные пересечения с crossings_per_minute в минуту)
+    сдвигает книгу биржи продажи так, что ее лучший bid выше лучшего ask биржи покупки на cross_bps;
+    каждое пересечение записывается в crossings - это ожидаемые возможности сканера (ground truth).
+    load_script() задает книги пар явно по времени: полностью детерминированный прогон.
+    disconnect() и fail_symbol() вызывают NetworkError и BadSymbol в работающих подписках.
+    """
+
+    def __init__(self, seed: int = SIMULATOR_SEED, symbols: Optional[List[str]] = None,
+                 order_book_hz: float = SIMULATOR_ORDER_BOOK_HZ, ticker_hz: float = SIMULATOR_TICKER_HZ,
+                 spread_bps: float = SIMULATOR_SPREAD_BPS, volatility_bps: float = SIMULATOR_VOLATILITY_BPS,
+                 crossings_per_minute: float = SIMULATOR_CROSSINGS_PER_MINUTE,
+                 crossing_bps: float = SIMULATOR_CROSSING_BPS, crossing_seconds: float = SIMULATOR_CROSSING_SECONDS,
+                 disconnect_interval: Optional[float] = SIMULATOR_DISCONNECT_INTERVAL_SECONDS):
+        self.seed = seed
+        self.symbols = list(symbols if symbols is not None else PAIRS_TO_TRACK_WS)
+        self.order_book_hz = order_book_hz
+        self.ticker_hz = ticker_hz
+        self.spread_bps = spread_bps
+        self.volatility_bps = volatility_bps
+        self.crossings_per_minute = crossings_per_minute
+        self.crossing_bps = crossing_bps
+        self.crossing_seconds = crossing_seconds
+        self.disconnect_interval = disconnect_interval
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        # Пересечения (ожидаемые возможности): symbol, buy/sell биржи, cross_bps, начало/конец (мс), id возможности
+        self.crossings: List[Dict[str, Any]] = []
+        self.script_started = self.started
+
+        self._markets: Dict[str, _Market] = {}
+        self._instances: Dict[str, List[SimulatedExchange]] = {}
+        # (биржа, пара) -> (смещение середины биржи в шагах, интервалы между уровнями, объемы уровней в лотах, rng)
+        self._templates: Dict[Tuple[str, str], Tuple[float, List[int], List[int], random.Random]] = {}
+        self._active_crossings: Dict[str, Tuple[str, str, float, float]] = {} # symbol -> (buy, sell, cross шагов, конец)
+        self._scripts: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = {}
+        self._errors_loaded = False
+        self._next_random_crossing = (self.started + self.rng.expovariate(crossings_per_minute / 60)
+                                      if crossings_per_minute > 0 else None)
+
+    # --- ExchangeFactory ---
+
+    def supports(self, exchange_id: str) -> bool:
+        return bool(exchange_id)
+
+    async def prepare(self, exchange_ids: Iterable[str]):
+        # Модулей бирж нет, но сбои поднимают ошибки ccxt: загружаем их в потоке, как фабрика ccxt.pro
+        if not self._errors_loaded:
+            await preload_module('ccxt.base.errors')
+            self._errors_loaded = True
+
+    def create(self, exchange_id: str, options: Dict[str, Any]) -> SimulatedExchange:
+        exchange = SimulatedExchange(self, exchange_id, options)
+        # Разорванные подключения заменяются новым: старые объекты не должны получать disconnect/fail_symbol
+        instances = [instance for instance in self._instances.get(exchange_id, []) if instance.connected]
+        instances.append(exchange)
+        self._instances[exchange_id] = instances
+        return exchange
+
+    def forget(self, exchange: SimulatedExchange):
+        instances = self._instances.get(exchange.id, [])
+        if exchange in instances:
+            instances.remove(exchange)
+
+    # --- Управление сценарием ---
+
+    def exchanges(self, exchange_id: str) -> List[SimulatedExchange]:
+        return list(self._instances.get(exchange_id, []))
+
+    def disconnect(self, exchange_id: str):
+        """Разрыв соединения: подписки биржи получат NetworkError на ближайшем обновлении."""
+        for exchange in self._instances.get(exchange_id, []):
+            exchange.disconnect()
+
+    def fail_symbol(self, exchange_id: str, symbol: str):
+        """Следующее обновление пары на бирже поднимет BadSymbol (сервис снимет подписку на пару)."""
+        for exchange in self._instances.get(exchange_id, []):
+            exchange.fail_symbol(symbol)
+
+    def inject_crossing(self, symbol: str, buy_exchange: str, sell_exchange: str,
+                        cross_bps: Optional[float] = None, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Пересекает книги пары на seconds секунд и возвращает запись ground truth."""
+        cross_bps = self.crossing_bps if cross_bps is None else cross_bps
+        seconds = self.crossing_seconds if seconds is None else seconds
+        now = time.monotonic()
+        market = self._market(symbol)
+        cross_ticks = market.mid_ticks(now - self.started) * cross_bps / 10_000
+        self._active_crossings[symbol] = (buy_exchange, sell_exchange, cross_ticks, now + seconds)
+        started_ms = int(time.time() * 1000)
+        crossing = {
+            'symbol': symbol,
+            'buy_exchange': buy_exchange,
+            'sell_exchange': sell_exchange,
+            'cross_bps': cross_bps,
+            'start_ms': started_ms,
+            'end_ms': started_ms + int(seconds * 1000),
+            'opportunity_id': f"{symbol.replace('/', '')}-{buy_exchange.lower()}-{sell_exchange.lower()}",
+        }
+        self.crossings.append(crossing)
+        return crossing
+
+    def load_script(self, events: List[Dict[str, Any]]):
+        """
+        Явные книги по времени: события {'at': секунды от загрузки, 'exchange', 'symbol', 'bids', 'asks'}
+        (уровни [price, amount]). Пары из сценария обновляются только событиями сценария.
+        """
+        self.script_started = time.monotonic()
+        self._scripts = {}
+        for event in sorted(events, key=lambda event: event['at']):
+            self._scripts.setdefault((event['exchange'], event['symbol']), deque()).append(event)
+
+    def script_for(self, exchange_id: str, symbol: str) -> Optional[Deque[Dict[str, Any]]]:
+        return self._scripts.get((exchange_id, symbol))
+
+    # --- Генерация книг ---
+
+    def market_description(self, symbol: str) -> Dict[str, Any]:
+        market = self._market(symbol)
+        base, quote = symbol.split('/')
+        return {
+            'id': symbol.replace('/', ''), 'symbol': symbol, 'base': base, 'quote': quote,
+            'type': 'spot', 'spot': True, 'active': True,
+            'precision': {'price': market.tick, 'amount': market.lot},
+            'limits': {'amount': {'min': market.lot, 'max': None}},
+        }
+
+    def order_book(self, exchange_id: str, symbol: str, depth: int) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._maybe_start_random_crossing(now)
+        market = self._market(symbol)
+        offset, gaps, sizes, rng = self._template(exchange_id, symbol, market, depth)
+        mid = market.mid_ticks(now - self.started) + offset
+        half = market.half_spread_ticks
+        crossing = self._active_crossings.get(symbol)
+        if crossing is not None:
+            buy_exchange, sell_exchange, cross_ticks, ends = crossing
+            if now >= ends:
+                del self._active_crossings[symbol]
+            elif exchange_id == sell_exchange:
+                # Лучший bid продажи выше лучшего ask покупки не меньше чем на cross_ticks (с запасом на округление)
+                buy_offset = self._template(buy_exchange, symbol, market, depth)[0]
+                mid += buy_offset - offset + 2 * half + cross_ticks + 2
+        bid_top = math.floor(mid - half)
+        ask_top = max(bid_top + 1, math.ceil(mid + half))
+
+        # Верхние уровни меняют объем на каждом обновлении, остальные - из шаблона
+        sizes = sizes[:depth]
+        for level in range(min(_VOLATILE_LEVELS, depth)):
+            sizes[level] = rng.randint(1, 2 * sizes[level])
+        tick, lot = market.tick, market.lot
+        bids, asks = [], []
+        bid_ticks, ask_ticks = bid_top, ask_top
+        for level in range(depth):
+            bids.append([bid_ticks * tick, sizes[level] * lot])
+            asks.append([ask_ticks * tick, sizes[depth - 1 - level] * lot])
+            bid_ticks -= gaps[level]
+            ask_ticks += gaps[depth - 1 - level]
+        return {'symbol': symbol, 'bids': bids, 'asks': asks, 'timestamp': int(time.time() * 1000),
+                'datetime': None, 'nonce': None}
+
+    def _market(self, symbol: str) -> _Market:
+        market = self._markets.get(symbol)
+        if market is None:
+            market = self._markets[symbol] = _Market(symbol, self.seed, self.spread_bps, self.volatility_bps)
+        return market
+
+    def _template(self, exchange_id: str, symbol: str, market: _Market, depth: int):
+        template = self._templates.get((exchange_id, symbol))
+        if template is None or len(template[1]) < depth:
+            rng = random.Random(f"{self.seed}:{exchange_id}:{symbol}")
+            # Смещение биржи меньше трети половины спреда: без пересечения книги бирж не пересекаются
+            offset = rng.uniform(-1, 1) * market.half_spread_ticks / 3
+            size = max(depth, DEFAULT_DEPTH)
+            template = (offset, [rng.randint(1, 3) for _ in range(size)], [rng.randint(1, 100) for _ in range(size)], rng)
+            self._templates[(exchange_id, symbol)] = template
+        return template
+
+    def _maybe_start_random_crossing(self, now: float):
+        if self._next_random_crossing is None or now < self._next_random_crossing:
+            return
+        self._next_random_crossing = now + self.rng.expovariate(self.crossings_per_minute / 60)
+        venues = [exchange_id for exchange_id, instances in self._instances.items() if instances]
+        if len(venues) < 2 or not self.symbols:
+            return
+        buy_exchange, sell_exchange = self.rng.sample(sorted(venues), 2)
+        self.inject_crossing(self.rng.choice(self.symbols), buy_exchange, sell_exchange)
+
+
+_default_simulator: Optional[ExchangeSimulator] = None
+
+
+def default_simulator() -> ExchangeSimulator:
+    """Общий симулятор процесса (EXCHANGE_FACTORY='simulator'), параметры - из config."""
+    global _default_simulator
+    if _default_simulator is None:
+        _default_simulator = ExchangeSimulator()
+    return _default_simulator
@@ -0,0 +1,189 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from src.data_models import OrderBookRecord, TickerRecord
+from src.fixed_point import FixedPointOrderBook
+from src.config import (
+    FEED_RECORDING_DIR, FEED_RECORDING_SEGMENT_MAX_BYTES, FEED_RECORDING_SEGMENT_MAX_SECONDS,
+    FEED_RECORDING_QUEUE_MAX_ITEMS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Префикс и суффикс файлов сегментов: feed-<UTC время открытия>-<номер>.jsonl.gz
+SEGMENT_PREFIX = 'feed-'
+SEGMENT_SUFFIX = '.jsonl.gz'
+
+
+class FeedRecorder:
+    """
+    Запись всех нормализованных обновлений книг и тикеров в сжатые сегментированные файлы.
+
+    Файлы только дописываются: каждый сегмент - gzip с JSON строкой на обновление,
+    новый сегмент открывается по достижении segment_max_bytes (несжатых) или segment_max_seconds.
+    Формат строки:
+      книга:  {"k": "ob", "r": время получения мс, "e": биржа, "s": пара, "ts": timestamp биржи, "b": bids, "a": asks}
+      тикер:  {"k": "tk", "r": ..., "e": ..., "s": ..., "ts": ..., "bid": ..., "ask": ..., "last": ...}
+    Для fixed-point книги добавляются шаг цены и лот рынка дробями: "pt": "1/100", "al": "1/1000"
+    (бэктест восстанавливает по ним fixed-point книги, см. backtest.py).
+
+    record_* вызываются из корутин приема данных и никогда не блокируют их: запись (неизменяемый
+    объект и время получения) кладется в ограниченную очередь без ожидания, а сериализация, сжатие
+    и запись на диск выполняются в отдельном потоке. При переполнении очереди обновление
+    отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self,
+                 directory: str = FEED_RECORDING_DIR,
+                 segment_max_bytes: int = FEED_RECORDING_SEGMENT_MAX_BYTES,
+                 segment_max_seconds: float = FEED_RECORDING_SEGMENT_MAX_SECONDS,
+                 max_queue_items: int = FEED_RECORDING_QUEUE_MAX_ITEMS):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_items)
+        self._thread: Optional[threading.Thread] = None
+        self._segment = None
+        self._segment_index = 0
+        self._segment_bytes = 0
+        self._segment_opened_at = 0.0
+        # Счетчики для логов и диагностики
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='feed-recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"Запись потока данных в {self.directory} запущена.")
+
+    def stop(self, timeout: float = 10.0):
+        """Дописывает очередь, закрывает текущий сегмент и останавливает поток."""
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout) # Сигнал остановки (ждет места в очереди)
+            except queue.Full:
+                # Поток не успевает разобрать очередь: оставшиеся записи отбрасываются
+                self._discard_pending()
+                self._queue.put_nowait(None)
+            self._thread.join(timeout)
+        else:
+            # Поток уже завершился с ошибкой: сигнал остановки некому прочитать
+            self._discard_pending()
+        self._thread = None
+        logger.info(f"Запись потока данных остановлена. Записано: {self.recorded}, отброшено: {self.dropped}.")
+
+    def _discard_pending(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self.dropped += 1
+
+    # --- Прием обновлений (из event loop, без блокировки) ---
+
+    def record_order_book(self, book: Union[OrderBookRecord, FixedPointOrderBook], received_at_ms: Optional[int] = None):
+        self._put(('ob', received_at_ms or int(time.time() * 1000), book))
+
+    def record_ticker(self, ticker: TickerRecord, received_at_ms: Optional[int] = None):
+        self._put(('tk', received_at_ms or int(time.time() * 1000), ticker))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- Поток записи ---
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                self._write(_serialize(*item))
+        except Exception as e:
+            logger.error(f"Ошибка записи потока данных: {e}", exc_info=True)
+        finally:
+            self._close_segment()
+
+    def _write(self, line: str):
+        now = time.time()
+        if self._segment is None or self._segment_bytes >= self.segment_max_bytes or \
+           now - self._segment_opened_at >= self.segment_max_seconds:
+            self._open_segment(now)
+        data = line.encode('utf-8')
+        self._segment.write(data)
+        self._segment_bytes += len(data)
+        self.recorded += 1
+
+    def _open_segment(self, now: float):
+        self._close_segment()
+        self._segment_index += 1
+        name = f"{SEGMENT_PREFIX}{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))}-{self._segment_index:04d}{SEGMENT_SUFFIX}"
+        # 'xb': сегменты только создаются и дописываются, существующие файлы не перезаписываются
+        self._segment = gzip.open(os.path.join(self.directory, name), 'xb', compresslevel=5)
+        self._segment_bytes = 0
+        self._segment_opened_at = now
+        logger.info(f"Запись потока данных: новый сегмент {name}")
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+def _serialize(kind: str, received_at_ms: int, record) -> str:
+    if kind == 'ob':
+        increments = None
+        if isinstance(record, FixedPointOrderBook):
+            increments = (str(record.price_tick), str(record.amount_lot))
+            record = record.to_normalized()
+        payload = {'k': 'ob', 'r': received_at_ms, 'e': record.exchange, 's': record.symbol,
+                   'ts': record.timestamp, 'b': record.bids, 'a': record.asks}
+        if increments is not None:
+            payload['pt'], payload['al'] = increments
+    else:
+        payload = {'k': 'tk', 'r': received_at_ms, 'e': record.exchange, 's': record.symbol,
+                   'ts': record.timestamp, 'bid': record.bid, 'ask': record.ask, 'last': record.last}
+    return json.dumps(payload, separators=(',', ':')) + '\n'
+
+
+def list_segments(path: str) -> List[str]:
+    """Сегменты в каталоге (или один файл) в порядке записи."""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def read_segment(path: str, symbol: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Читает записи сегмента. Последний сегмент может быть оборван (процесс остановлен
+    без закрытия файла) - чтение останавливается на последней целой строке.
+    symbol оставляет только записи одной пары: остальные строки отбрасываются до разбора JSON.
+    """
+    marker = f'"s":{json.dumps(symbol)}' if symbol is not None else None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n') or (marker is not None and marker not in line):
+                    continue
+                record = json.loads(line)
+                if symbol is None or record['s'] == symbol:
+                    yield record
+    except (EOFError, gzip.BadGzipFile) as e:
+        logger.warning(f"Сегмент {path} оборван: {e}. Прочитаны записи до обрыва.")
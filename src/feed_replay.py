@@ -0,0 +1,161 @@
+"""
+Воспроизведение записанного потока данных (см. feed_recorder.py) через MarketDataService.
+
+Записи подаются в сервис теми же путями, что и обновления WS подписок (MarketStore,
+FreshnessIndex), поэтому прогон воспроизводит поведение сканера на реальных данных
+без подключения к биржам.
+
+Скорость: 1 - в реальном времени, N - в N раз быстрее, max (или 0) - без пауз.
+
+Режимы сканера:
+  - по умолчанию детерминированный: сканер вызывается синхронно на границах
+    SCANNER_INTERVAL_SECONDS по времени записи, устаревание книг считается по времени записи.
+    Результат не зависит от скорости воспроизведения и нагрузки машины;
+  - --live-scanner: обычная задача сканера сервиса по часам процесса (время получения
+    записей подменяется текущим). Показывает поведение под нагрузкой, но результат
+    зависит от скорости воспроизведения. Запись в БД при этом отключена.
+
+Книги воспроизводятся как OrderBookRecord (float), даже если при записи использовались
+fixed-point книги (их шаг цены и лот записываются в поля "pt"/"al" и используются только бэктестом).
+
+Запуск: python -m src.feed_replay PATH [--speed 1|N|max] [--live-scanner]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.data_models import OrderBookRecord, TickerRecord
+from src.feed_recorder import list_segments, read_segment
+from src.market_data_service import MarketDataService
+from src.config import SCANNER_INTERVAL_SECONDS
+from src.logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+class FeedReplay:
+    """Подает записи из сегментов в сервис с заданной скоростью и собирает статистику прогона."""
+
+    def __init__(self, service: MarketDataService, paths: List[str], speed: float = 1.0,
+                 live_scanner: bool = False, scan_interval_seconds: float = SCANNER_INTERVAL_SECONDS):
+        self.service = service
+        self.paths = paths
+        self.speed = speed # 0 - без пауз
+        self.live_scanner = live_scanner
+        self.scan_interval_ms = int(scan_interval_seconds * 1000)
+        # Статистика прогона
+        self.updates = 0
+        self.scans = 0
+        self.opportunities = 0
+        self.scan_durations_ms: List[float] = []
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        for path in self.paths:
+            for segment in list_segments(path):
+                yield from read_segment(segment)
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        if self.live_scanner:
+            # Без записи в БД: воспроизведенные возможности не должны попасть в рабочую БД
+            await self.service.start(connect_exchanges=False, persistence=False)
+        try:
+            await self._replay()
+        finally:
+            if self.live_scanner:
+                self.opportunities = len(self.service.latest_opportunities)
+                await self.service.stop()
+        return self.stats(time.perf_counter() - started)
+
+    async def _replay(self):
+        first_recorded_ms: Optional[int] = None
+        next_scan_ms: Optional[int] = None
+        wall_started = time.perf_counter()
+
+        for record in self.iter_records():
+            recorded_ms = record['r']
+            if first_recorded_ms is None:
+                first_recorded_ms = recorded_ms
+                next_scan_ms = recorded_ms + self.scan_interval_ms
+
+            # Пауза до момента записи в масштабе скорости (при max - только уступаем event loop)
+            if self.speed > 0:
+                delay = (recorded_ms - first_recorded_ms) / 1000 / self.speed - (time.perf_counter() - wall_started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.live_scanner and self.updates % 1000 == 0:
+                await asyncio.sleep(0)
+
+            if not self.live_scanner:
+                # Сканирования, которые по времени записи произошли до этого обновления
+                while recorded_ms >= next_scan_ms:
+                    self._scan(next_scan_ms)
+                    next_scan_ms += self.scan_interval_ms
+
+            received_at_ms = int(time.time() * 1000) if self.live_scanner else recorded_ms
+            if record['k'] == 'ob':
+                self.service.replay_order_book(OrderBookRecord(
+                    exchange=record['e'], symbol=record['s'],
+                    bids=[tuple(level) for level in record['b']],
+                    asks=[tuple(level) for level in record['a']],
+                    timestamp=record['ts'],
+                ), received_at_ms)
+            else:
+                self.service.replay_ticker(TickerRecord(
+                    exchange=record['e'], symbol=record['s'], bid=record['bid'], ask=record['ask'],
+                    last=record['last'], timestamp=record['ts'],
+                ), received_at_ms)
+            self.updates += 1
+
+        if not self.live_scanner and next_scan_ms is not None:
+            self._scan(next_scan_ms)
+
+    def _scan(self, now_ms: int):
+        started = time.perf_counter()
+        opportunities = self.service.scan_once(now_ms=now_ms)
+        self.scan_durations_ms.append((time.perf_counter() - started) * 1000)
+        self.scans += 1
+        self.opportunities += len(opportunities)
+
+    def stats(self, elapsed_seconds: float) -> Dict[str, Any]:
+        return {
+            'updates': self.updates,
+            'scans': self.scans,
+            'opportunities': self.opportunities,
+            'scan_p50_ms': _percentile(self.scan_durations_ms, 50),
+            'scan_p99_ms': _percentile(self.scan_durations_ms, 99),
+            'elapsed_seconds': elapsed_seconds,
+            'updates_per_second': self.updates / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+        }
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _parse_speed(value: str) -> float:
+    return 0.0 if value == 'max' else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='Каталоги сегментов или отдельные файлы feed-*.jsonl.gz')
+    parser.add_argument('--speed', type=_parse_speed, default=1.0, help='1, N (ускорение) или max')
+    parser.add_argument('--live-scanner', action='store_true', help='Использовать задачу сканера сервиса вместо детерминированного')
+    args = parser.parse_args()
+
+    configure_logging()
+    replay = FeedReplay(MarketDataService(), args.paths, speed=args.speed, live_scanner=args.live_scanner)
+    stats = asyncio.run(replay.run())
+    print(f"Replay: updates={stats['updates']}, scans={stats['scans']}, opportunities={stats['opportunities']}, "
+          f"scan p50={stats['scan_p50_ms']:.3f}ms p99={stats['scan_p99_ms']:.3f}ms, "
+          f"elapsed={stats['elapsed_seconds']:.2f}s ({stats['updates_per_second']:.0f} updates/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+from array import array
+from fractions import Fraction
+from typing import Dict, Any, List, Tuple, Optional
+
+from src.data_models import OrderBookRecord
+
+# Режимы точности ccxt (см. ccxt.base.decimal_to_precision).
+# Продублированы здесь, чтобы модуль не зависел от импорта ccxt.
+DECIMAL_PLACES = 2
+SIGNIFICANT_DIGITS = 3
+TICK_SIZE = 4
+
+
+class FixedPointOrderBook:
+    """
+    Книга ордеров в целочисленном (fixed-point) представлении.
+
+    Цены хранятся как целое число шагов цены (price_tick), объемы - как целое число
+    лотов (amount_lot) рынка из exchange.markets. Уровни лежат в array('q'),
+    что компактнее списка кортежей float и позволяет сканеру считать точно, без допусков.
+    Перевод во float выполняется только при выдаче наружу (to_normalized).
+    """
+    __slots__ = (
+        'exchange', 'symbol', 'price_tick', 'amount_lot',
+        'bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes',
+        'timestamp', 'datetime', 'stale', '_float_view',
+    )
+
+    def __init__(self, exchange: str, symbol: str, price_tick: Fraction, amount_lot: Fraction,
+                 bid_prices: array, bid_sizes: array, ask_prices: array, ask_sizes: array,
+                 timestamp: int | None = None, datetime: str | None = None, stale: bool = False):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.price_tick = price_tick
+        self.amount_lot = amount_lot
+        self.bid_prices = bid_prices
+        self.bid_sizes = bid_sizes
+        self.ask_prices = ask_prices
+        self.ask_sizes = ask_sizes
+        self.timestamp = timestamp
+        self.datetime = datetime
+        self.stale = stale
+        self._float_view: Optional[OrderBookRecord] = None
+
+    def to_normalized(self) -> OrderBookRecord:
+        """Переводит книгу обратно во float представление (для API и снапшотов)."""
+        tick = float(self.price_tick)
+        lot = float(self.amount_lot)
+        return OrderBookRecord(
+            exchange=self.exchange,
+            symbol=self.symbol,
+            bids=[(price * tick, size * lot) for price, size in zip(self.bid_prices, self.bid_sizes)],
+            asks=[(price * tick, size * lot) for price, size in zip(self.ask_prices, self.ask_sizes)],
+            timestamp=self.timestamp,
+            datetime=self.datetime,
+            stale=self.stale,
+        )
+
+    def float_view(self) -> OrderBookRecord:
+        """
+        Float копия книги, создаваемая один раз на книгу (книга не изменяется после создания).
+        Нужна сканеру, когда fixed-point книгу сравнивают с float книгой другой биржи:
+        оба направления пары и все проходы сканера до следующего обновления используют одну копию.
+        """
+        view = self._float_view
+        if view is None:
+            view = self._float_view = self.to_normalized()
+        return view
+
+
+def market_increments(market: Dict[str, Any], precision_mode: int) -> Optional[Tuple[Fraction, Fraction]]:
+    """
+    Возвращает (шаг цены, лот объема) рынка как точные дроби.
+    Для режима SIGNIFICANT_DIGITS фиксированного шага нет - возвращает None.
+    """
+    precision = market.get('precision') or {}
+    price_precision = precision.get('price')
+    amount_precision = precision.get('amount')
+    if price_precision is None or amount_precision is None:
+        return None
+
+    if precision_mode == TICK_SIZE:
+        # Шаг задан числом (например, 0.01). str() дает десятичное представление без ошибки float.
+        price_tick = Fraction(str(price_precision))
+        amount_lot = Fraction(str(amount_precision))
+    elif precision_mode == DECIMAL_PLACES:
+        # Шаг задан количеством знаков после запятой
+        price_tick = Fraction(1, 10 ** int(price_precision))
+        amount_lot = Fraction(1, 10 ** int(amount_precision))
+    else:
+        return None
+
+    if price_tick <= 0 or amount_lot <= 0:
+        return None
+    return price_tick, amount_lot
+
+
+def _levels_to_fixed_point(levels: List[List[float]], price_tick: Fraction, amount_lot: Fraction) -> Tuple[array, array]:
+    """Переводит уровни [price, volume] в массивы целых шагов цены и лотов, отбрасывая пустые уровни."""
+    # Умножение на обратную величину шага выполняется во float, после чего round() дает точное целое
+    inverse_tick = float(1 / price_tick)
+    inverse_lot = float(1 / amount_lot)
+    prices = array('q')
+    sizes = array('q')
+    for level in levels:
+        ticks = round(level[0] * inverse_tick)
+        lots = round(level[1] * inverse_lot)
+        if ticks > 0 and lots > 0:
+            prices.append(ticks)
+            sizes.append(lots)
+    return prices, sizes
+
+
+def to_fixed_point_order_book(exchange_id: str, symbol: str, raw_order_book: Dict[str, Any],
+                              price_tick: Fraction, amount_lot: Fraction) -> FixedPointOrderBook:
+    """Нормализует сырые данные книги ордеров от ccxt.pro в FixedPointOrderBook."""
+    bid_prices, bid_sizes = _levels_to_fixed_point(raw_order_book.get('bids', []), price_tick, amount_lot)
+    ask_prices, ask_sizes = _levels_to_fixed_point(raw_order_book.get('asks', []), price_tick, amount_lot)
+    return FixedPointOrderBook(
+        exchange=exchange_id,
+        symbol=raw_order_book.get('symbol', symbol),
+        price_tick=price_tick,
+        amount_lot=amount_lot,
+        bid_prices=bid_prices,
+        bid_sizes=bid_sizes,
+        ask_prices=ask_prices,
+        ask_sizes=ask_sizes,
+        timestamp=raw_order_book.get('timestamp'),
+        datetime=raw_order_book.get('datetime'),
+    )
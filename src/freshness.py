@@ -0,0 +1,148 @@
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.config import CLOCK_OFFSET_WINDOW, CLOCK_OFFSET_REFRESH_EVERY
+
+# Ключ книги в индексе: (exchange_id, symbol)
+BookKey = Tuple[str, str]
+
+
+class ClockOffsets:
+    """
+    Смещение часов каждой биржи относительно локальных: скользящая медиана (received - exchange_ts)
+    по последним window обновлениям. Включает и обычную сетевую задержку биржи, поэтому после
+    поправки timestamps разных бирж сравнимы между собой, а отставание биржи сверх обычного
+    остается видно. Медиана пересчитывается раз в refresh_every обновлений.
+    """
+
+    def __init__(self, window: int = CLOCK_OFFSET_WINDOW, refresh_every: int = CLOCK_OFFSET_REFRESH_EVERY):
+        self.window = window
+        self.refresh_every = refresh_every
+        self._samples: Dict[str, Deque[int]] = {}
+        self._offsets: Dict[str, float] = {}
+        self._since_refresh: Dict[str, int] = {}
+
+    def observe(self, exchange_id: str, exchange_timestamp_ms: int, received_at_ms: int):
+        samples = self._samples.get(exchange_id)
+        if samples is None:
+            samples = self._samples[exchange_id] = deque(maxlen=self.window)
+        samples.append(received_at_ms - exchange_timestamp_ms)
+        since_refresh = self._since_refresh.get(exchange_id, 0) + 1
+        if since_refresh >= self.refresh_every or exchange_id not in self._offsets:
+            ordered = sorted(samples)
+            self._offsets[exchange_id] = ordered[len(ordered) // 2]
+            since_refresh = 0
+        self._since_refresh[exchange_id] = since_refresh
+
+    def to_local(self, exchange_id: str, exchange_timestamp_ms: int) -> int:
+        """Биржевой timestamp в локальных часах (без поправки, пока по бирже нет замеров)."""
+        return int(exchange_timestamp_ms + self._offsets.get(exchange_id, 0))
+
+    def offset(self, exchange_id: str) -> Optional[float]:
+        return self._offsets.get(exchange_id)
+
+    def discard_exchange(self, exchange_id: str):
+        for mapping in (self._samples, self._offsets, self._since_refresh):
+            mapping.pop(exchange_id, None)
+
+
+class FreshnessIndex:
+    """
+    Индекс свежести книг ордеров.
+
+    Для каждой книги хранит биржевой timestamp (если биржа его присылает) и локальное время
+    получения обновления. Записи лежат в OrderedDict в порядке последнего обновления:
+    самые старые - в начале, поэтому проверка истечения (expire) просматривает только
+    устаревшие записи и останавливается на первой свежей.
+
+    Используется для двух проверок:
+      - книга, не обновлявшаяся дольше max_age_seconds (например, поток биржи тихо завис,
+        а статус все еще 'connected'), исключается из сканирования;
+      - пара книг сравнивается, только если их timestamps расходятся не более чем на max_skew_ms.
+        Биржевые timestamps приводятся к локальным часам поправкой ClockOffsets; время получения
+        используется только для книг, у которых биржа timestamp не присылает.
+    """
+
+    def __init__(self, max_age_seconds: float, max_skew_ms: float):
+        self.max_age_seconds = max_age_seconds
+        self.max_skew_ms = max_skew_ms
+        # { (exchange_id, symbol): (exchange_timestamp_ms | None, received_at_ms) }
+        self._entries: "OrderedDict[BookKey, Tuple[Optional[int], int]]" = OrderedDict()
+        self.clock_offsets = ClockOffsets()
+
+    def touch(self, exchange_id: str, symbol: str, exchange_timestamp_ms: Optional[int], received_at_ms: Optional[int] = None,
+              stale: bool = False):
+        """
+        Отмечает обновление книги и переносит ее в конец (самые свежие).
+        stale=True - книга не из живого потока (warm-start снапшот): смещение часов по ней не оценивается.
+        """
+        if received_at_ms is None:
+            received_at_ms = int(time.time() * 1000)
+        if exchange_timestamp_ms is not None and not stale:
+            self.clock_offsets.observe(exchange_id, exchange_timestamp_ms, received_at_ms)
+        key = (exchange_id, symbol)
+        self._entries[key] = (exchange_timestamp_ms, received_at_ms)
+        self._entries.move_to_end(key)
+
+    def discard(self, exchange_id: str, symbol: str):
+        self._entries.pop((exchange_id, symbol), None)
+
+    def discard_exchange(self, exchange_id: str):
+        """Удаляет все записи биржи (при отключении или отписке)."""
+        for key in [key for key in self._entries if key[0] == exchange_id]:
+            del self._entries[key]
+        # После переподключения задержка и часы биржи могут быть другими
+        self.clock_offsets.discard_exchange(exchange_id)
+
+    def clear(self):
+        self._entries.clear()
+        self.clock_offsets = ClockOffsets()
+
+    def expire(self, now_ms: Optional[int] = None) -> List[BookKey]:
+        """
+        Удаляет и возвращает ключи книг, полученных раньше, чем max_age_seconds назад.
+        Стоимость пропорциональна числу устаревших записей, а не размеру индекса.
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        deadline_ms = now_ms - self.max_age_seconds * 1000
+        expired: List[BookKey] = []
+        while self._entries:
+            key, (_, received_at_ms) = next(iter(self._entries.items()))
+            if received_at_ms >= deadline_ms:
+                break
+            self._entries.popitem(last=False)
+            expired.append(key)
+        return expired
+
+    def timestamp(self, exchange_id: str, symbol: str) -> Optional[int]:
+        """
+        Время данных книги в мс по локальным часам: биржевой timestamp с поправкой на смещение
+        часов биржи, а если биржа его не присылает - время получения. None, если книга не отслеживается.
+        """
+        entry = self._entries.get((exchange_id, symbol))
+        if entry is None:
+            return None
+        exchange_timestamp_ms, received_at_ms = entry
+        if exchange_timestamp_ms is None:
+            return received_at_ms
+        return self.clock_offsets.to_local(exchange_id, exchange_timestamp_ms)
+
+    def timestamps_by_symbol(self, orderbooks_by_symbol: Dict[str, Dict[str, object]]) -> Dict[str, Dict[str, int]]:
+        """
+        Времена данных для группировки книг сканера: { symbol: { exchange_id: timestamp_ms } }.
+        Книги без записи в индексе не попадают в результат.
+        """
+        timestamps: Dict[str, Dict[str, int]] = {}
+        for symbol, books_by_exchange in orderbooks_by_symbol.items():
+            symbol_timestamps: Dict[str, int] = {}
+            for exchange_id in books_by_exchange:
+                timestamp_ms = self.timestamp(exchange_id, symbol)
+                if timestamp_ms is not None:
+                    symbol_timestamps[exchange_id] = timestamp_ms
+            timestamps[symbol] = symbol_timestamps
+        return timestamps
+
+    def __len__(self) -> int:
+        return len(self._entries)
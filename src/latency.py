@@ -0,0 +1,97 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.data_models import OpportunityRecord
+from src.metrics import LATENCY_BUCKETS, MetricsRegistry
+
+# Этапы конвейера от события на бирже до отправки клиенту по WebSocket, в порядке прохождения
+STAGES: Tuple[str, ...] = (
+    'exchange_to_receive',   # timestamp биржи -> получение обновления от ccxt.pro (включает расхождение часов)
+    'receive_to_normalize',  # получение -> нормализованная книга опубликована в market_store
+    'normalize_to_scan',     # публикация книги -> начало прохода сканера, который ее использовал
+    'scan',                  # проход сканера
+    'scan_to_enqueue',       # конец прохода -> сообщение поставлено в очереди WS подписчиков
+    'enqueue_to_send',       # очередь подписчика -> send_text завершен
+)
+# Квантили, которые отдаются в сводке
+REPORTED_QUANTILES = (0.5, 0.99)
+
+
+class LatencyTracer:
+    """
+    Время прохождения обновлений книг через конвейер по этапам STAGES.
+
+    Для каждой (биржа, пара) хранятся отметки времени последней опубликованной книги:
+    timestamp биржи, получение и нормализация (wall clock, мс). Возможность наследует отметки
+    более свежей из двух своих книг (той, что ее вызвала), к ним добавляются отметки прохода
+    сканера и постановки в очереди WS. Каждый этап учитывается в гистограмме с частотой,
+    с которой он происходит: этапы получения - на каждую книгу, сканер - на проход, отправка -
+    на сообщение подписчику; p50/p99 считаются по интервалам гистограмм.
+    """
+
+    def __init__(self, metrics: MetricsRegistry):
+        self._histogram = metrics.histogram(
+            'stage_latency_seconds', 'Задержка этапа конвейера от биржи до отправки по WebSocket', ('stage',),
+            buckets=LATENCY_BUCKETS)
+        # (биржа, пара) -> (timestamp биржи | None, получение мс, нормализация мс)
+        self._book_marks: Dict[Tuple[str, str], Tuple[Optional[int], float, float]] = {}
+        self.last_scan_end_ms: Optional[float] = None
+
+    def record_book(self, exchange_id: str, symbol: str, exchange_ts: Optional[int], received_ms: float,
+                    normalized_ms: Optional[float] = None):
+        normalized_ms = time.time() * 1000 if normalized_ms is None else normalized_ms
+        self._book_marks[(exchange_id, symbol)] = (exchange_ts, received_ms, normalized_ms)
+        observe = self._histogram.observe
+        if exchange_ts:
+            observe(max(0.0, received_ms - exchange_ts) / 1000, ('exchange_to_receive',))
+        observe((normalized_ms - received_ms) / 1000, ('receive_to_normalize',))
+
+    def discard_exchange(self, exchange_id: str):
+        for key in [key for key in self._book_marks if key[0] == exchange_id]:
+            del self._book_marks[key]
+
+    def annotate(self, opportunities: Iterable[OpportunityRecord], scan_start_ms: float, scan_end_ms: float):
+        """Добавляет к возможностям stage_latencies_ms (кроме этапов отправки, известных позже)."""
+        self.last_scan_end_ms = scan_end_ms
+        observe = self._histogram.observe
+        observe((scan_end_ms - scan_start_ms) / 1000, ('scan',))
+        for opp in opportunities:
+            buy = self._book_marks.get((opp.buy_exchange, opp.symbol))
+            sell = self._book_marks.get((opp.sell_exchange, opp.symbol))
+            marks = max((m for m in (buy, sell) if m is not None), key=lambda m: m[2], default=None)
+            latencies: Dict[str, Optional[float]] = dict.fromkeys(STAGES)
+            latencies['scan'] = scan_end_ms - scan_start_ms
+            if marks is not None:
+                exchange_ts, received_ms, normalized_ms = marks
+                if exchange_ts:
+                    latencies['exchange_to_receive'] = received_ms - exchange_ts
+                latencies['receive_to_normalize'] = normalized_ms - received_ms
+                # Книга могла прийти во время прохода после снапшота - тогда ее использует следующий проход
+                latencies['normalize_to_scan'] = max(0.0, scan_start_ms - normalized_ms)
+                observe(latencies['normalize_to_scan'] / 1000, ('normalize_to_scan',))
+            opp.stage_latencies_ms = latencies
+
+    def stamp_enqueue(self, payload: List[dict], enqueued_ms: float):
+        """Дописывает scan_to_enqueue в сериализуемые возможности последнего прохода."""
+        if self.last_scan_end_ms is None:
+            return
+        scan_to_enqueue = enqueued_ms - self.last_scan_end_ms
+        self._histogram.observe(max(0.0, scan_to_enqueue) / 1000, ('scan_to_enqueue',))
+        for item in payload:
+            if item.get('stage_latencies_ms') is not None:
+                item['stage_latencies_ms']['scan_to_enqueue'] = scan_to_enqueue
+
+    def observe_send(self, enqueued_ms: float):
+        """Вызывается эндпоинтом WS после send_text сообщения, поставленного в очередь в enqueued_ms."""
+        self._histogram.observe(max(0.0, time.time() * 1000 - enqueued_ms) / 1000, ('enqueue_to_send',))
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """{этап: {count, p50_ms, p99_ms}} по гистограммам с момента запуска."""
+        result = {}
+        for stage in STAGES:
+            stats: Dict[str, Optional[float]] = {'count': self._histogram.count((stage,))}
+            for q in REPORTED_QUANTILES:
+                value = self._histogram.quantile(q, (stage,))
+                stats[f"p{int(q * 100)}_ms"] = value * 1000 if value is not None else None
+            result[stage] = stats
+        return result
@@ -0,0 +1,215 @@
+import math
+import time
+from collections import deque
+from itertools import combinations
+from typing import Any, Deque, Dict, List, Optional
+
+from src.data_models import TickerRecord
+from src.config import LEADLAG_BUCKET_MS, LEADLAG_MAX_LAG_MS, LEADLAG_WINDOW_SECONDS, LEADLAG_MIN_BUCKETS
+
+
+class _ExchangeSeries:
+    """Доходности mid цены одной биржи по интервалам времени."""
+    __slots__ = ('close_mid', 'pending', 'returns')
+
+    def __init__(self, history: int):
+        self.close_mid: Optional[float] = None  # mid на конец последнего закрытого интервала
+        self.pending: Dict[int, float] = {}     # интервал -> последний mid в нем (еще не закрытые)
+        self.returns: Deque[float] = deque([0.0] * history, maxlen=history)
+
+
+class _PairSums:
+    """
+    Взвешенные суммы для корреляции доходностей бирж a и b со сдвигом.
+    lagged[max_lag + k] = sum r_a(t) * r_b(t - k): при k > 0 биржа b опережает a на k интервалов.
+    """
+    __slots__ = ('sum_a', 'sum_b', 'sum_aa', 'sum_bb', 'lagged')
+
+    def __init__(self, max_lag: int):
+        self.sum_a = self.sum_b = self.sum_aa = self.sum_bb = 0.0
+        self.lagged = [0.0] * (2 * max_lag + 1)
+
+    def decay(self, factor: float):
+        self.sum_a *= factor
+        self.sum_b *= factor
+        self.sum_aa *= factor
+        self.sum_bb *= factor
+        lagged = self.lagged
+        for i in range(len(lagged)):
+            lagged[i] *= factor
+
+
+class _SymbolLeadLag:
+    def __init__(self, max_lag: int, decay: float):
+        self.max_lag = max_lag
+        self.decay = decay
+        self.series: Dict[str, _ExchangeSeries] = {}
+        self.pairs: Dict[tuple, _PairSums] = {}
+        self.weight = 0.0            # Взвешенное количество интервалов
+        self.buckets = 0             # Всего закрытых интервалов
+        self.closed_bucket: Optional[int] = None # Последний закрытый интервал
+        self.zero_run = 0            # Закрытых подряд интервалов без изменения цен
+
+    def add_mid(self, exchange_id: str, bucket: int, mid: float):
+        series = self.series.get(exchange_id)
+        if series is None:
+            series = self.series[exchange_id] = _ExchangeSeries(self.max_lag + 1)
+            for other in self.series:
+                if other != exchange_id:
+                    self.pairs[tuple(sorted((exchange_id, other)))] = _PairSums(self.max_lag)
+        if self.closed_bucket is None:
+            self.closed_bucket = bucket - 1
+        # Опоздавшее обновление относим к первому открытому интервалу
+        bucket = max(bucket, self.closed_bucket + 1)
+        series.pending[bucket] = mid
+        # Интервал закрывается, когда пришли данные на два интервала позже (один интервал - запас на задержку)
+        if bucket - 2 > self.closed_bucket:
+            self._close_until(bucket - 2)
+
+    def _close_until(self, last_bucket: int):
+        while self.closed_bucket < last_bucket:
+            # Интервалы без обновлений дают нулевые доходности. Когда нули заполнили всю историю лагов,
+            # вклад следующих пустых интервалов - только затухание сумм: пропускаем их разом
+            if self.zero_run > self.max_lag and not any(
+                    bucket <= last_bucket for series in self.series.values() for bucket in series.pending):
+                self._skip_quiet(last_bucket - self.closed_bucket)
+                return
+            self._close_bucket(self.closed_bucket + 1)
+
+    def _close_bucket(self, bucket: int):
+        self.closed_bucket = bucket
+        current: Dict[str, float] = {}
+        for exchange_id, series in self.series.items():
+            mid = series.pending.pop(bucket, None)
+            if mid is None:
+                mid = series.close_mid # Цена не менялась
+            value = math.log(mid / series.close_mid) if mid is not None and series.close_mid else 0.0
+            if mid is not None:
+                series.close_mid = mid
+            series.returns.append(value)
+            current[exchange_id] = value
+        self.zero_run = 0 if any(current.values()) else self.zero_run + 1
+
+        decay, max_lag = self.decay, self.max_lag
+        self.weight = self.weight * decay + 1.0
+        self.buckets += 1
+        for (a, b), sums in self.pairs.items():
+            sums.decay(decay)
+            returns_a, returns_b = self.series[a].returns, self.series[b].returns
+            r_a, r_b = current[a], current[b]
+            sums.sum_a += r_a
+            sums.sum_b += r_b
+            sums.sum_aa += r_a * r_a
+            sums.sum_bb += r_b * r_b
+            lagged = sums.lagged
+            # returns[-1] - текущий интервал, returns[-1 - k] - на k интервалов раньше
+            for k in range(max_lag + 1):
+                lagged[max_lag + k] += r_a * returns_b[-1 - k]
+                if k:
+                    lagged[max_lag - k] += r_b * returns_a[-1 - k]
+
+    def _skip_quiet(self, count: int):
+        factor = self.decay ** count
+        self.weight = self.weight * factor + (1 - factor) / (1 - self.decay)
+        self.buckets += count
+        self.closed_bucket += count
+        self.zero_run += count
+        for sums in self.pairs.values():
+            sums.decay(factor)
+
+    def correlations(self, a: str, b: str) -> Optional[List[Optional[float]]]:
+        """Корреляции доходностей a и b по лагам -max_lag..max_lag (None, если нет разброса)."""
+        sums = self.pairs[(a, b)]
+        weight = self.weight
+        mean_a, mean_b = sums.sum_a / weight, sums.sum_b / weight
+        var_a = sums.sum_aa / weight - mean_a * mean_a
+        var_b = sums.sum_bb / weight - mean_b * mean_b
+        if var_a <= 1e-18 or var_b <= 1e-18:
+            return None
+        norm = math.sqrt(var_a * var_b)
+        return [(value / weight - mean_a * mean_b) / norm for value in sums.lagged]
+
+
+class LeadLagEstimator:
+    """
+    Онлайн оценка опережения между биржами по mid цене тикеров для каждой пары.
+
+    Обновления тикеров раскладываются по интервалам bucket_ms (по локальному времени получения,
+    общему для всех бирж); для каждого закрытого интервала считается лог-доходность mid каждой биржи.
+    Для каждой пары бирж поддерживаются экспоненциально взвешенные (окно window_seconds) суммы
+    произведений доходностей со сдвигом 0..max_lag_ms в обе стороны - корреляция по лагам
+    считается из них при запросе.
+
+    Обработка тикера - запись mid в открытый интервал (O(1)); работа на закрытие интервала
+    зависит только от количества бирж и лагов, но не от частоты тикеров.
+    """
+
+    def __init__(self,
+                 bucket_ms: int = LEADLAG_BUCKET_MS,
+                 max_lag_ms: int = LEADLAG_MAX_LAG_MS,
+                 window_seconds: float = LEADLAG_WINDOW_SECONDS,
+                 min_buckets: int = LEADLAG_MIN_BUCKETS):
+        self.bucket_ms = bucket_ms
+        self.max_lag = max(1, max_lag_ms // bucket_ms)
+        self.decay = math.exp(-bucket_ms / 1000 / window_seconds)
+        self.min_buckets = min_buckets
+        self._symbols: Dict[str, _SymbolLeadLag] = {}
+
+    def update_ticker(self, ticker: TickerRecord, received_at_ms: Optional[int] = None):
+        if ticker.bid and ticker.ask:
+            mid = (ticker.bid + ticker.ask) / 2
+        elif ticker.last:
+            mid = ticker.last
+        else:
+            return
+        if mid <= 0:
+            return
+        received_at_ms = int(time.time() * 1000) if received_at_ms is None else received_at_ms
+        state = self._symbols.get(ticker.symbol)
+        if state is None:
+            state = self._symbols[ticker.symbol] = _SymbolLeadLag(self.max_lag, self.decay)
+        state.add_mid(ticker.exchange, received_at_ms // self.bucket_ms, mid)
+
+    def discard_exchange(self, exchange_id: str):
+        """Забывает последнюю цену биржи: после переподключения первая цена не дает скачка доходности."""
+        for state in self._symbols.values():
+            series = state.series.get(exchange_id)
+            if series is not None:
+                series.close_mid = None
+                series.pending.clear()
+
+    def matrix(self, symbol: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Для каждой пары: matrix[a][b] - на сколько мс биржа a опережает b (по лагу максимальной корреляции;
+        отрицательное значение - a отстает), и подробности по каждой паре бирж.
+        """
+        result: Dict[str, Dict[str, Any]] = {}
+        for symbol_name, state in self._symbols.items():
+            if symbol is not None and symbol_name != symbol:
+                continue
+            exchanges = sorted(state.series)
+            matrix: Dict[str, Dict[str, Optional[int]]] = {a: {b: (0 if a == b else None) for b in exchanges} for a in exchanges}
+            pairs = []
+            for a, b in combinations(exchanges, 2):
+                correlations = state.correlations(a, b) if state.buckets >= self.min_buckets else None
+                pair = {'a': a, 'b': b, 'leader': None, 'lead_ms': None, 'correlation': None, 'correlations': None}
+                if correlations is not None:
+                    best = max(range(len(correlations)), key=lambda i: correlations[i])
+                    lag = best - self.max_lag # > 0: b опережает a
+                    lead_ms = abs(lag) * self.bucket_ms
+                    matrix[b][a], matrix[a][b] = lag * self.bucket_ms, -lag * self.bucket_ms
+                    pair.update({
+                        'leader': b if lag > 0 else a if lag < 0 else None,
+                        'lead_ms': lead_ms,
+                        'correlation': correlations[best],
+                        'correlations': {(i - self.max_lag) * self.bucket_ms: value for i, value in enumerate(correlations)},
+                    })
+                pairs.append(pair)
+            result[symbol_name] = {
+                'bucket_ms': self.bucket_ms,
+                'buckets': state.buckets,
+                'exchanges': exchanges,
+                'matrix': matrix,
+                'pairs': pairs,
+            }
+        return result
@@ -0,0 +1,154 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import (
+    LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_MAX_ITEMS, LOG_RATE_LIMIT_PER_SITE, LOG_RATE_LIMIT_WINDOW_SECONDS,
+)
+
+
+class _RateLimitFilter(logging.Filter):
+    """
+    Ограничение темпа и подавление повторов по месту вызова (файл, строка).
+
+    Одно место вызова пропускает не больше limit записей за окно window секунд; запись,
+    совпадающая с предыдущей из того же места (текст шаблона и аргументы), в пределах окна
+    подавляется сразу. Подавленные записи считаются: первая пропущенная запись места после
+    подавления получает поле suppressed с их количеством. Сравнение идет по шаблону, аргументам
+    и структурным полям без форматирования сообщения.
+    """
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.suppressed_total = 0
+        # (путь, строка) -> [начало окна, пропущено в окне, подавлено, (msg, args, fields) последней записи]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock() # Логируют и поток event loop, и фоновые потоки
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0, None]
+            if now - site[0] >= self.window:
+                site[0], site[1] = now, 0
+                site[3] = None # Повтор после окна снова пропускается (с числом подавленных)
+            message = (record.msg, record.args, getattr(record, 'fields', None))
+            if site[1] >= self.limit or site[3] == message:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+            site[1] += 1
+            site[3] = message
+            if site[2]:
+                record.suppressed = site[2]
+                site[2] = 0
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler с ограниченной очередью: put_nowait, при переполнении запись отбрасывается
+    и считается. Запись кладется в очередь без форматирования (в отличие от стандартного prepare):
+    сообщение, аргументы и traceback форматируются в потоке QueueListener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """Формат LOG_FORMAT плюс поля записи (extra={'fields': {...}}) как ' key=value', и счетчик подавленных повторов."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={_format_field(value)}" for key, value in fields.items())
+        suppressed = getattr(record, 'suppressed', None)
+        if suppressed:
+            text += f" [подавлено повторов: {suppressed}]"
+        return text
+
+
+def _format_field(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+_handler: Optional[_DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_rate_limit: Optional[_RateLimitFilter] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, queue_max_items: int = LOG_QUEUE_MAX_ITEMS,
+                      rate_limit: int = LOG_RATE_LIMIT_PER_SITE, rate_window: float = LOG_RATE_LIMIT_WINDOW_SECONDS):
+    """
+    Настраивает корневой логгер: записи через ограниченную очередь передаются в фоновый
+    QueueListener, который форматирует их и пишет в stderr. Поток, который логирует (event loop),
+    тратит на запись только фильтр темпа и put_nowait. Повторный вызов ничего не меняет.
+    """
+    global _handler, _listener, _rate_limit
+    if _listener is not None:
+        return
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_max_items)
+    _rate_limit = _RateLimitFilter(rate_limit, rate_window)
+    _handler = _DroppingQueueHandler(log_queue)
+    _handler.addFilter(_rate_limit)
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Останавливает фоновый поток, дописав записи из очереди."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Записи в очереди, отброшенные из-за переполнения и подавленные ограничением темпа."""
+    return {
+        'queued': _handler.queue.qsize() if _handler is not None else 0,
+        'dropped': _handler.dropped if _handler is not None else 0,
+        'suppressed': _rate_limit.suppressed_total if _rate_limit is not None else 0,
+    }
+
+
+def log_fields(logger: logging.Logger, level: int, event: str, **fields: Any):
+    """
+    Структурная запись: событие и поля key=value. Если уровень выключен, ничего не создается;
+    значения полей форматируются в фоновом потоке.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields}, stacklevel=2)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from src.metrics import LATENCY_BUCKETS, MetricsRegistry
+from src.config import (
+    LOOP_MONITOR_INTERVAL_SECONDS, LOOP_BLOCK_THRESHOLD_SECONDS, LOOP_MONITOR_MAX_EVENTS, LOOP_MONITOR_STACK_DEPTH,
+)
+
+logger = logging.getLogger(__name__)
+
+# Этап, к которому относится блокировка, если код не отметил свой этап и его не удалось определить по стеку
+UNKNOWN_STAGE = 'other'
+# Неотмеченные этапы, определяемые по файлам в стеке: разбор сообщений бирж внутри ccxt.pro
+# (обработчики сообщений вызываются из его собственных колбэков, вне кода сервиса)
+_STACK_STAGES = (('/ccxt/', 'ccxt_parse'), ('/websockets/', 'websocket_io'), ('/pydantic/', 'validation'))
+
+
+class _Stage:
+    """Контекстный менеджер этапа: синхронно запоминает имя текущего этапа в мониторе (без аллокаций)."""
+    __slots__ = ('monitor', 'name', 'previous')
+
+    def __init__(self, monitor: 'LoopMonitor', name: str):
+        self.monitor = monitor
+        self.name = name
+        self.previous: Optional[str] = None
+
+    def __enter__(self):
+        self.previous = self.monitor.current_stage
+        self.monitor.current_stage = self.name
+
+    def __exit__(self, *exc_info):
+        self.monitor.current_stage = self.previous
+
+
+class LoopMonitor:
+    """
+    Монитор задержки event loop с поиском источника блокировок.
+
+    Корутина просыпается каждые interval секунд: разница между фактическим и запланированным
+    временем пробуждения - задержка планирования (lag), она учитывается в гистограмме.
+    Отдельный поток (watchdog) следит за отметкой последнего пробуждения: если loop не
+    возвращал управление дольше порога, watchdog снимает стек потока loop через
+    sys._current_frames() - это стек кода, который блокирует loop прямо сейчас - и
+    запоминает текущий этап (scan, normalize, serialize), отмеченный кодом через stage().
+    Когда loop освобождается, блокировка записывается с длительностью в журнал и метрики.
+    """
+
+    def __init__(self, metrics: MetricsRegistry,
+                 interval: float = LOOP_MONITOR_INTERVAL_SECONDS,
+                 block_threshold: float = LOOP_BLOCK_THRESHOLD_SECONDS,
+                 max_events: int = LOOP_MONITOR_MAX_EVENTS,
+                 stack_depth: int = LOOP_MONITOR_STACK_DEPTH):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.stack_depth = stack_depth
+        self.current_stage: Optional[str] = None
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.blocks = 0
+
+        self._m_lag = metrics.histogram(
+            'event_loop_lag_seconds', 'Задержка планирования event loop', buckets=LATENCY_BUCKETS)
+        self._m_block = metrics.histogram(
+            'event_loop_block_seconds', 'Блокировки event loop дольше порога по этапам', ('stage',),
+            buckets=LATENCY_BUCKETS)
+
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        # Блокировка, обнаруженная watchdog и еще не завершенная (записывается корутиной после освобождения loop)
+        self._pending_block: Optional[Dict[str, Any]] = None
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def start(self):
+        """Запускает измерение в текущем event loop и watchdog поток."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watchdog, name='loop-monitor', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop_event.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    async def _measure(self):
+        interval = self.interval
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._m_lag.observe(lag)
+            block, self._pending_block = self._pending_block, None
+            if block is not None:
+                self._finish_block(block, now)
+
+    def _finish_block(self, block: Dict[str, Any], now: float):
+        block['duration_ms'] = (now - block.pop('_since')) * 1000
+        self.blocks += 1
+        self.events.append(block)
+        self._m_block.observe(block['duration_ms'] / 1000, (block['stage'],))
+        innermost = block['stack'][-1] if block['stack'] else '?'
+        logger.warning(f"Event loop заблокирован на {block['duration_ms']:.0f} мс (этап: {block['stage']}): {innermost}")
+
+    def _watchdog(self):
+        check_interval = max(0.005, self.block_threshold / 4)
+        captured_heartbeat = None
+        while not self._stop_event.wait(check_interval):
+            heartbeat = self._heartbeat
+            # Между пробуждениями корутина спит interval - блокировкой считается только превышение сверх него
+            if heartbeat == captured_heartbeat or time.perf_counter() - heartbeat < self.interval + self.block_threshold:
+                continue
+            captured_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = [f"{entry.filename}:{entry.lineno} in {entry.name}"
+                     for entry in traceback.extract_stack(frame, limit=self.stack_depth)] if frame is not None else []
+            self._pending_block = {
+                'stage': self.current_stage or _infer_stage(stack),
+                'detected_at': int(time.time() * 1000),
+                'stack': stack,
+                '_since': heartbeat + self.interval, # loop должен был проснуться в это время
+            }
+
+    def status(self, recent: int = 5) -> Dict[str, Any]:
+        """Сводка для /status: текущая и максимальная задержка, p99, последние блокировки."""
+        p99 = self._m_lag.quantile(0.99)
+        by_stage: Dict[str, int] = {}
+        for event in self.events:
+            by_stage[event['stage']] = by_stage.get(event['stage'], 0) + 1
+        recent_events: List[Dict[str, Any]] = list(self.events)[-recent:] if recent else []
+        return {
+            'lag_ms': self.last_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'p99_lag_ms': p99 * 1000 if p99 is not None else None,
+            'block_threshold_ms': self.block_threshold * 1000,
+            'blocks': self.blocks,
+            'recent_blocks_by_stage': by_stage,
+            'recent_blocks': recent_events,
+        }
+
+
+def _infer_stage(stack: List[str]) -> str:
+    # Самый внутренний кадр, относящийся к известной библиотеке, определяет этап
+    for entry in reversed(stack):
+        for marker, stage in _STACK_STAGES:
+            if marker in entry:
+                return stage
+    return UNKNOWN_STAGE
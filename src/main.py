@@ -1,23 +1,36 @@
 # src/main.py
 
+# Хронология запуска импортируется первой: ниже отмечаются этапы импорта и настройки приложения.
+# Сводка выводится в лог при старте сервера и после первого прохода сканера (см. startup.py)
+from src.startup import timeline
+
 import asyncio
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
+from fastapi.responses import PlainTextResponse
+from typing import List, Dict, Any, Optional
+timeline.phase('import_fastapi')
 
-# Импортируем наши сервисы и модели
+# Импортируем наши сервисы и модели (ccxt не импортируется: модули бирж загружаются при подключении)
 from src.market_data_service import MarketDataService
 from src.data_models import ArbitrageOpportunity, NormalizedTicker # Импортируем NormalizedTicker для эндпоинта /tickers
-# Импортируем конфигурацию
-from src.config import EXCHANGES_TO_TRACK_WS, PAIRS_TO_TRACK_WS
-
+timeline.phase('import_service')
 # Импортируем роутер для WS
 from src.ws_endpoints import router # Импорт после создания app
+# Импортируем роутер для административных эндпоинтов (управление подписками)
+from src.admin_endpoints import admin_router
+# Импортируем роутер для аналитических эндпоинтов (статистики спредов, опережение бирж)
+from src.analytics_endpoints import analytics_router
+# Импортируем роутер для отладочных эндпоинтов (память по компонентам, tracemalloc)
+from src.debug_endpoints import debug_router
+from src.config import OPPORTUNITY_HISTORY_MAX_LIMIT, TICKER_HISTORY_MAX_POINTS
+from src.logging_setup import configure_logging
 
 import logging # Используем logging
+timeline.phase('import_routers')
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Настройка логирования: форматирование и вывод в фоновом потоке через ограниченную очередь (см. logging_setup.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -55,10 +68,15 @@ app.state.market_data_service = market_data_service
 
 # --- Подключаем роутер с WebSocket эндпоинтами ---
 app.include_router(router) # Подключаем роутер
+app.include_router(admin_router)
+app.include_router(analytics_router)
+app.include_router(debug_router)
 
 # --- Определение событий запуска и остановки приложения ---
 @app.on_event("startup")
 async def startup_event():
+    timeline.phase('server_start')
+    timeline.log_summary("Запуск API")
     logger.info("FastAPI startup event: Starting MarketDataService...")
     service = app.state.market_data_service
     # Запускаем сервис в виде задачи, чтобы не блокировать startup
@@ -81,9 +99,30 @@ async def get_opportunities(request: Request):
     Данные предварительно отфильтрованы и отсортированы сканером.
     """
     service: MarketDataService = request.app.state.market_data_service
-    # get_latest_opportunities синхронный и возвращает копию
+    # get_latest_opportunities синхронный и возвращает копию внутренних записей.
+    # Pydantic модели создаются только здесь, при формировании ответа.
     opportunities = service.get_latest_opportunities()
-    return opportunities
+    return [opp.to_model() for opp in opportunities]
+
+@app.get("/api/v1/opportunities/history", response_model=List[ArbitrageOpportunity])
+async def get_opportunities_history(
+    request: Request,
+    symbol: Optional[str] = None,
+    buy_exchange: Optional[str] = None,
+    sell_exchange: Optional[str] = None,
+    since: Optional[int] = Query(None, description="Unix timestamp ms: только возможности, найденные начиная с этого момента"),
+    limit: int = Query(500, ge=1, le=OPPORTUNITY_HISTORY_MAX_LIMIT),
+):
+    """
+    Возвращает историю найденных возможностей из памяти сервиса (новые первыми).
+    Хранятся только изменения: повтор возможности с теми же объемом, ценами и прибылью не записывается.
+    Глубина истории ограничена бюджетом памяти OPPORTUNITY_HISTORY_MAX_BYTES.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    history = service.opportunity_history.query(
+        symbol=symbol, buy_exchange=buy_exchange, sell_exchange=sell_exchange, since=since, limit=limit,
+    )
+    return [opp.to_model() for opp in history]
 
 @app.get("/status")
 async def get_status(request: Request):
@@ -97,20 +136,44 @@ async def get_status(request: Request):
     return {
         "status": "running",
         "service_running": service._running, # Это синхронный доступ, флаг bool
-        "exchange_statuses": exchange_statuses
+        "exchange_statuses": exchange_statuses,
+        # Задержка event loop и последние блокировки со стеком и этапом (см. loop_monitor.py)
+        "event_loop": service.loop_monitor.status(),
+        # Этапы запуска процесса, события (первая биржа, первый проход сканера) и отложенные импорты
+        "startup": timeline.status(),
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """
+    Метрики сервиса в текстовом формате Prometheus: темп обновлений по биржам и парам,
+    длительность сканирования, ожидание _data_lock, очереди WS подписчиков, переподключения.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    return PlainTextResponse(service.metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/v1/latency")
+async def get_latency(request: Request):
+    """
+    Задержки по этапам конвейера (от timestamp биржи до отправки по WebSocket): количество, p50 и p99 в мс.
+    Те же данные в виде гистограмм - arbitrage_stage_latency_seconds в /metrics.
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    return service.latency.summary()
+
 @app.get("/hello")
 async def hello():
     return {"message": "Hello, FastAPI is working!"}
 
 # --- ЭНДПОИНТ: Список мониторируемых пар и бирж (конфигурация) ---
 @app.get("/api/v1/monitored_pairs", response_model=Dict[str, List[str]])
-async def get_monitored_pairs():
+async def get_monitored_pairs(request: Request):
     """
-    Возвращает список всех бирж и пар, которые настроены для мониторинга из конфигурации.
+    Возвращает список всех бирж и пар, которые настроены для мониторинга
+    (начальные значения из конфигурации с учетом изменений через admin API).
     """
-    monitored_data = {exchange: list(PAIRS_TO_TRACK_WS) for exchange in EXCHANGES_TO_TRACK_WS}
+    service: MarketDataService = request.app.state.market_data_service
+    monitored_data = {exchange: list(service.tracked_pairs) for exchange in service.tracked_exchanges}
     return monitored_data
 
 # --- ЭНДПОИНТ: Получение всех актуальных тикеров (ВРЕМЕННО для MonitoredList) ---
@@ -123,22 +186,41 @@ async def get_all_tickers(request: Request):
     """
     service: MarketDataService = request.app.state.market_data_service
     tickers_data: Dict[str, Dict[str, NormalizedTicker]] = {}
-    # Чтение current_market_data требует блокировки, поэтому этот эндпоинт должен быть async
-    async with service._data_lock:
-         # Перебираем все биржи в текущих данных
-         for exchange_id, data_by_symbol in service.current_market_data.items():
-             # Проверяем, что биржа имеет статус, при котором мы ожидаем данные
-             status = service._exchange_status.get(exchange_id, 'disconnected')
-             if status not in ['connected', 'connecting']:
-                  # Пропускаем биржи в ошибке или отключенные
-                  continue
-
-             tickers_data[exchange_id] = {}
-             if isinstance(data_by_symbol, dict):
-                 # Перебираем все элементы для символа
-                 for symbol_key, data_item in data_by_symbol.items():
-                     # Если элемент является NormalizedTicker
-                     if isinstance(data_item, NormalizedTicker):
-                         tickers_data[exchange_id][symbol_key] = data_item
+    # Статусы и хранилище публикуются copy-on-write: читаем версионный снапшот без лока,
+    # не конкурируя с записью WS обновлений.
+    exchange_statuses = await service.get_exchange_statuses()
+    market_snapshot = service.market_store.snapshot()
+    # Берем только биржи со статусом, при котором мы ожидаем данные (пропускаем биржи в ошибке или отключенные)
+    active_exchanges = [
+        exchange_id for exchange_id, status in exchange_statuses.items()
+        if status in ['connected', 'connecting']
+    ]
+    for exchange_id, tickers_by_symbol in market_snapshot.tickers_by_exchange(active_exchanges).items():
+        # Внутренняя запись -> Pydantic модель для ответа
+        tickers_data[exchange_id] = {symbol: ticker.to_model() for symbol, ticker in tickers_by_symbol.items()}
 
     return tickers_data
+
+@app.get("/api/v1/tickers/{exchange}/{symbol:path}/history")
+async def get_ticker_history(
+    request: Request,
+    exchange: str,
+    symbol: str,
+    since: Optional[int] = Query(None, description="Unix timestamp ms начала диапазона"),
+    until: Optional[int] = Query(None, description="Unix timestamp ms конца диапазона"),
+    points: int = Query(500, ge=1, le=TICKER_HISTORY_MAX_POINTS, description="Максимальное количество точек"),
+):
+    """
+    Возвращает историю тикера пары на бирже для графиков в колоночном виде:
+    { timestamp: [...], bid: [...], ask: [...], last: [...] }.
+    Если записей в диапазоне больше points, берется последнее значение в каждом из points интервалов.
+    Пара передается как есть (BTC/USDT) или в URL-кодировке (BTC%2FUSDT).
+    """
+    service: MarketDataService = request.app.state.market_data_service
+    history = service.ticker_history.read(exchange, symbol, since=since, until=until, max_points=points)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Нет истории тикеров для {symbol} на {exchange}")
+    return {"exchange": exchange, "symbol": symbol, **history}
+
+# Приложение настроено: эндпоинты зарегистрированы
+timeline.phase('app_setup')
@@ -1,27 +1,47 @@
 import asyncio
-import ccxt.pro as ccxtpro
+import contextlib
 import time
 import json
 import logging
 from typing import Dict, Any, List, Tuple, Set, Optional, Union
 
 # Импортируем модели, утилиты и конфигурацию
-from src.data_models import NormalizedTicker, NormalizedOrderBook, ArbitrageOpportunity
+from src.data_models import TickerRecord, OrderBookRecord, OpportunityRecord
+from src.utils import normalize_ccxt_order_book, normalize_ccxt_ticker
 from src.arbitrage_scanner import find_arbitrage_opportunities_with_order_book
+from src.warm_start_cache import WarmStartCache
+from src.fixed_point import market_increments, to_fixed_point_order_book
+from src.market_store import MarketStore
+from src.freshness import FreshnessIndex
+from src.binance_depth_feed import BinanceDepthFeed
+from src.exchange_factory import ExchangeFactory, default_exchange_factory
+from src.persistence import PersistenceWriter, create_backend
+from src.feed_recorder import FeedRecorder
+from src.opportunity_history import OpportunityHistory
+from src.ticker_history import TickerHistoryStore
+from src.spread_stats import SpreadStats
+from src.lead_lag import LeadLagEstimator
+from src.metrics import MetricsRegistry
+from src.latency import LatencyTracer
+from src.loop_monitor import LoopMonitor
+from src.memory_accounting import deep_sizeof, process_memory
+from src.logging_setup import log_fields, logging_stats
 from src.config import (
-    EXCHANGES_TO_TRACK_WS, PAIRS_TO_TRACK_WS, WS_ORDER_BOOK_DEPTH,
-    MIN_PROFIT_PCT, SCANNER_INTERVAL_SECONDS, DESIRED_TRADE_VOLUME_BASE
+    EXCHANGES_TO_TRACK_WS, PAIRS_TO_TRACK_WS, WS_ORDER_BOOK_DEPTH, WS_UNWATCH_TIMEOUT_SECONDS, USE_FIXED_POINT_ORDER_BOOKS,
+    MODEL_VALIDATION_SAMPLE_RATE, USE_NATIVE_BINANCE_FEED,
+    MIN_PROFIT_PCT, SCANNER_INTERVAL_SECONDS, DESIRED_TRADE_VOLUME_BASE,
+    MAX_BOOK_AGE_SECONDS, MAX_BOOK_SKEW_MS, PERSISTENCE_BOOK_SAMPLE_INTERVAL_SECONDS, PERSISTENCE_OPEN_TIMEOUT_SECONDS,
+    FEED_RECORDING_ENABLED, TICKER_HISTORY_ENABLED, WS_SUBSCRIBER_QUEUE_MAX_ITEMS
 )
 
-from ccxt.base.errors import (
-    BaseError, BadSymbol, ExchangeError, RequestTimeout, NetworkError,
-    AuthenticationError, OperationRejected, ArgumentsRequired, NotSupported
-)
+from src.startup import LazyModule, timeline
+
+# Ошибки ccxt: импорт ccxt загружает классы всех бирж, поэтому откладывается до первого исключения
+# (или до загрузки модулей бирж фабрикой, см. ExchangeFactory.prepare)
+ccxt_errors = LazyModule('ccxt.base.errors')
 import traceback # Импортируем traceback для более подробных логов ошибок
 
-# Настройка логирования
-# Уровень логирования можно настроить в основном файле запуска или через env переменные
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Логирование настраивается точкой входа (main.py, feed_replay.py) через logging_setup.configure_logging
 logger = logging.getLogger(__name__)
 
 # --- Вспомогательные функции нормализации (если они не в utils.py) ---
@@ -103,11 +123,18 @@ class MarketDataService:
     Сервис для сбора данных рынка по WebSocket, их хранения и запуска сканера арбитража.
     Управляет подключениями к биржам, обработкой данных и рассылкой возможностей по WS.
     """
-    def __init__(self):
-        # current_market_data хранит последние данные с бирж по всем отслеживаемым парам.
-        # Структура: { exchange_id: { symbol: NormalizedTicker, symbol+'_ob': NormalizedOrderBook, ... }, ... }
-        # Доступ к этому словарю должен быть синхронизирован с _data_lock.
-        self.current_market_data: Dict[str, Dict[str, Union[NormalizedTicker, NormalizedOrderBook]]] = {}
+    def __init__(self, exchange_factory: ExchangeFactory | None = None):
+        # Источник объектов бирж для _watch_exchange: ccxt.pro или симулятор (см. exchange_factory.py)
+        self._exchange_factory = exchange_factory or default_exchange_factory()
+
+        # market_store хранит последние данные с бирж по всем отслеживаемым парам.
+        # Биржи и пары интернированы в целочисленные индексы, книги ордеров и тикеры лежат
+        # в отдельных таблицах (см. market_store.py), поэтому сканер и REST эндпоинты получают
+        # готовую группировку без разбора строковых ключей.
+        # Хранятся внутренние записи без валидации (см. data_models.py), Pydantic модели
+        # создаются только при ответе API. При USE_FIXED_POINT_ORDER_BOOKS книги хранятся как FixedPointOrderBook.
+        # Хранилище copy-on-write: писатели публикуют новые версии, читатели берут снапшот без лока.
+        self.market_store = MarketStore()
 
         # latest_opportunities хранит список последних найденных арбитражных возможностей.
         # Этот список уже отфильтрован сканером по MIN_PROFIT_PCT и отсортирован.
@@ -115,17 +142,19 @@ class MarketDataService:
         # он только читается извне (get_latest_opportunities) и перезаписывается сканером.
         # Для простоты, get_latest_opportunities возвращает копию без захвата лока,
         # что безопасно для чтения, но не для модификации. Сканер модифицирует его под своим контролем.
-        self.latest_opportunities: List[ArbitrageOpportunity] = []
+        self.latest_opportunities: List[OpportunityRecord] = []
 
         # Флаг для управления циклом работы сервиса
         self._running = False
 
-        # Список задач (task) asyncio для отслеживания данных с бирж
-        self._collector_tasks: List[asyncio.Task] = []
+        # Задачи (task) asyncio для отслеживания данных с бирж: { exchange_id: task }
+        self._collector_tasks: Dict[str, asyncio.Task] = {}
         # Задача (task) asyncio для запуска сканера арбитража
         self._scanner_task: asyncio.Task | None = None
 
-        # asyncio.Lock для синхронизации доступа к current_market_data и _exchange_status
+        # asyncio.Lock для структурных изменений: набор подписок и задач бирж, открытие/закрытие
+        # бирж в market_store, старт/остановка. Обновления книг и тикеров, статусы, сканер и REST
+        # эндпоинты лок не используют: market_store и _exchange_status публикуются copy-on-write.
         self._data_lock = asyncio.Lock()
 
         # Множество очередей активных WebSocket подписчиков
@@ -134,14 +163,101 @@ class MarketDataService:
         # --- Состояние подключения бирж ---
         # Словарь: { exchange_id: статус }
         # Статусы: 'connecting', 'connected', 'disconnected', 'error', 'auth_error', 'no_ws_support', 'no_pairs'
-        # Доступ к этому словарю должен быть синхронизирован с _data_lock.
+        # Словарь публикуется copy-on-write (см. _set_exchange_status): не изменяйте его на месте.
         self._exchange_status: Dict[str, str] = {}
 
+        # --- Текущий набор подписок ---
+        # Инициализируется из конфигурации, но может изменяться во время работы через admin API
+        # (add_subscriptions / remove_subscriptions) без перезапуска процесса.
+        # Список пар применяется ко ВСЕМ отслеживаемым биржам, как и PAIRS_TO_TRACK_WS.
+        self.tracked_exchanges: List[str] = list(EXCHANGES_TO_TRACK_WS)
+        self.tracked_pairs: List[str] = list(PAIRS_TO_TRACK_WS)
+
+        # Живые объекты бирж ccxt.pro, для которых загружены рынки: { exchange_id: exchange }
+        self._exchanges: Dict[str, Any] = {}
+        # Задачи подписок по парам: { exchange_id: { ('ob' | 'ticker', symbol): task } }
+        self._pair_tasks: Dict[str, Dict[Tuple[str, str], asyncio.Task]] = {}
+        # События для пробуждения супервизора биржи при изменении набора ее задач подписки
+        self._subscriptions_changed: Dict[str, asyncio.Event] = {}
+
+        # Warm-start кэш: метаданные рынков с TTL и снапшот книг/возможностей с прошлого запуска
+        self._warm_cache = WarmStartCache()
+        # Индекс свежести книг ордеров: исключает из сканирования зависшие книги
+        # и пары книг с большим расхождением timestamps. Изменяется только синхронно (без await).
+        self._freshness = FreshnessIndex(MAX_BOOK_AGE_SECONDS, MAX_BOOK_SKEW_MS)
+        # Фоновая запись возможностей и top-of-book снапшотов в БД (None, если хранение отключено)
+        self._persistence: PersistenceWriter | None = None
+        self._persistence_start_task: asyncio.Task | None = None
+        # История найденных возможностей в памяти (кольцевой буфер с индексами по паре и направлению)
+        self.opportunity_history = OpportunityHistory()
+        # История тикеров в memory-mapped файлах. Читать можно всегда (файлы открываются по запросу),
+        # пишется только при работе с живыми данными (не при воспроизведении записи).
+        self.ticker_history = TickerHistoryStore()
+        self._record_ticker_history = False
+        # Онлайн статистики спреда лучших цен по направлениям (обновляются при публикации книг)
+        self.spread_stats = SpreadStats()
+        # Онлайн оценка опережения бирж по mid цене тикеров
+        self.lead_lag = LeadLagEstimator()
+        # Запись всех нормализованных обновлений книг и тикеров на диск (None, если выключена)
+        self._recorder: FeedRecorder | None = None
+        # Метрики для /metrics. На горячем пути - только инкременты счетчиков в словарях;
+        # размеры очередей и другие текущие значения вычисляются при запросе метрик.
+        self.metrics = MetricsRegistry(prefix='arbitrage_')
+        self._init_metrics()
+        # Задержки по этапам конвейера от timestamp биржи до отправки по WS
+        self.latency = LatencyTracer(self.metrics)
+        # Монитор задержки event loop: блокировки относятся к этапам, отмеченным через loop_monitor.stage()
+        self.loop_monitor = LoopMonitor(self.metrics)
+
+
+    def _init_metrics(self):
+        metrics = self.metrics
+        self._m_book_updates = metrics.counter(
+            'order_book_updates', 'Опубликованные обновления книг ордеров', ('exchange', 'symbol'))
+        self._m_ticker_updates = metrics.counter(
+            'ticker_updates', 'Опубликованные обновления тикеров', ('exchange', 'symbol'))
+        self._m_reconnects = metrics.counter(
+            'exchange_reconnects', 'Повторные подключения к бирже после ошибки или разрыва', ('exchange',))
+        self._m_scan_duration = metrics.histogram(
+            'scan_duration_seconds', 'Длительность прохода сканера (снапшот, поиск, аннотации, история)')
+        self._m_scans_skipped = metrics.counter(
+            'scans_skipped', 'Проходы сканера, пропущенные из-за недостатка книг')
+        self._m_lock_wait = metrics.histogram(
+            'data_lock_wait_seconds', 'Ожидание захвата _data_lock', ('site',))
+        self._m_ws_dropped = metrics.counter(
+            'ws_dropped_messages', 'Сообщения, вытесненные из переполненных очередей WS подписчиков')
+        metrics.gauge('ws_subscribers', 'Активные WS подписчики',
+                      collect=lambda: {(): len(self.active_ws_connections)})
+        metrics.gauge('ws_queue_depth', 'Сообщений в очередях WS подписчиков: сумма и максимум по подписчикам', ('stat',),
+                      collect=self._ws_queue_depths)
+        metrics.gauge('opportunities', 'Возможности в результате последнего прохода сканера',
+                      collect=lambda: {(): len(self.latest_opportunities)})
+        metrics.gauge('log_records', 'Записи логирования: в очереди, отброшенные при переполнении, подавленные ограничением темпа',
+                      ('state',), collect=lambda: {(state,): value for state, value in logging_stats().items()})
+        metrics.gauge('exchange_connected', '1, если биржа подключена', ('exchange',),
+                      collect=lambda: {(exchange_id,): int(status == 'connected')
+                                       for exchange_id, status in self._exchange_status.items()})
+
+    def _ws_queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        depths = [queue.qsize() for queue in self.active_ws_connections]
+        return {('sum',): sum(depths), ('max',): max(depths, default=0)}
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, site: str):
+        """Захватывает _data_lock и учитывает время ожидания в гистограмме по месту вызова."""
+        started = time.perf_counter()
+        async with self._data_lock:
+            self._m_lock_wait.observe(time.perf_counter() - started, (site,))
+            yield
+
 
-    async def start(self):
+    async def start(self, connect_exchanges: bool = True, persistence: bool = True):
         """
         Запускает задачи сбора данных с бирж и задачу сканера арбитража.
         Этот метод вызывается при запуске FastAPI приложения.
+        connect_exchanges=False запускает только сканер: данные подаются
+        извне через replay_order_book/replay_ticker (см. feed_replay.py).
+        persistence=False отключает запись в БД (воспроизведение не пишет в рабочую БД).
         """
         if self._running:
             logger.info("MarketDataService уже запущен.")
@@ -149,20 +265,41 @@ class MarketDataService:
 
         logger.info("Запуск MarketDataService...")
         self._running = True
+        self.loop_monitor.start()
 
         # Инициализируем статус бирж перед запуском задач
-        async with self._data_lock:
-             for exchange_id in EXCHANGES_TO_TRACK_WS:
-                  # Устанавливаем начальный статус 'disconnected' для всех настроенных бирж
-                  self._exchange_status[exchange_id] = 'disconnected'
+        if connect_exchanges:
+            # Чтение снапшота (JSON) - в потоке, чтобы не блокировать event loop
+            snapshot_books, snapshot_opportunities = await asyncio.to_thread(self._warm_cache.load_snapshot)
+            async with self._locked('start'):
+                 for exchange_id in self.tracked_exchanges:
+                      # Устанавливаем начальный статус 'disconnected' для всех настроенных бирж
+                      self._set_exchange_status(exchange_id, 'disconnected')
+
+                 # Загружаем warm-start снапшот: сканер сможет работать по нему сразу,
+                 # не дожидаясь первого снапшота от каждого WS потока.
+                 self._restore_warm_start_snapshot(snapshot_books, snapshot_opportunities)
+
+            # Запись потока данных (только для живых данных, не для воспроизведения)
+            if FEED_RECORDING_ENABLED:
+                self._recorder = FeedRecorder()
+                self._recorder.start()
+            self._record_ticker_history = TICKER_HISTORY_ENABLED
+
+        # Запускаем фоновую запись в БД отдельной задачей: подключение к БД не задерживает подключение
+        # к биржам и первый проход сканера. До открытия БД строки ждут в ограниченной очереди писателя.
+        # Ошибка подключения к БД не мешает работе сервиса.
+        backend = create_backend() if persistence else None
+        if backend is not None:
+            self._persistence = PersistenceWriter(backend)
+            self._persistence_start_task = asyncio.create_task(self._start_persistence(self._persistence))
 
         # Запускаем отдельную асинхронную задачу для подключения к каждой бирже
-        for exchange_id in EXCHANGES_TO_TRACK_WS:
-            task = asyncio.create_task(self._watch_exchange(exchange_id))
-            self._collector_tasks.append(task)
-            logger.debug(f"Создана задача _watch_exchange для биржи {exchange_id.upper()}")
+        if connect_exchanges:
+            for exchange_id in self.tracked_exchanges:
+                self._start_exchange_task(exchange_id)
 
-        logger.info(f"Задачи подключения к {len(self._collector_tasks)} WebSocket биржам запущены.")
+            logger.info(f"Задачи подключения к {len(self._collector_tasks)} WebSocket биржам запущены.")
 
         # Запускаем задачу периодического сканера арбитража
         self._scanner_task = asyncio.create_task(self._run_arbitrage_scanner())
@@ -181,16 +318,25 @@ class MarketDataService:
         logger.info("Остановка MarketDataService...")
         self._running = False # Устанавливаем флаг, чтобы циклы завершились
 
+        # --- Сохраняем warm-start снапшот ДО отмены задач (их finally-блоки очищают данные бирж) ---
+        # Сохраняем только живые данные: книги, которые так и остались stale, повторно не сохраняем.
+        # При воспроизведении записанного потока (без задач бирж) снапшот не сохраняется.
+        if self._collector_tasks:
+            live_books = [book for book in self.market_store.snapshot().iter_order_books() if not book.stale]
+            live_opportunities = [opp for opp in self.latest_opportunities if not opp.stale]
+            # Запись JSON - в потоке: книги в снапшоте market_store не меняются (copy-on-write)
+            await asyncio.to_thread(self._warm_cache.save_snapshot, live_books, live_opportunities)
+
         # --- Отменяем задачи коллектора ---
         logger.info("Отмена задач коллектора...")
-        for task in self._collector_tasks:
+        for task in self._collector_tasks.values():
             #logger.debug(f"Отмена задачи: {task}")
             task.cancel() # Отправляем сигнал отмены задаче
         # Ожидаем завершения всех задач коллектора. return_exceptions=True
         # предотвращает остановку gather, если одна из задач завершится с ошибкой,
         # но не с CancelledError.
-        results = await asyncio.gather(*self._collector_tasks, return_exceptions=True)
-        self._collector_tasks = []
+        results = await asyncio.gather(*self._collector_tasks.values(), return_exceptions=True)
+        self._collector_tasks = {}
         logger.info("Задачи коллектора отменены.")
         # Можно проанализировать results на ошибки, если нужно
 
@@ -212,6 +358,36 @@ class MarketDataService:
         else:
              logger.info("Задача сканера уже завершена или отсутствует.")
 
+        await self.loop_monitor.stop()
+
+        # --- Дописываем накопленные строки и закрываем БД (после сканера: новых строк больше не будет) ---
+        # Открытие БД не отменяем: отмена не останавливает открытие в рабочем потоке (соединение осталось бы
+        # незакрытым), а строки из очереди были бы потеряны. Ждем его ограниченное время.
+        if self._persistence_start_task is not None:
+            start_task, self._persistence_start_task = self._persistence_start_task, None
+            try:
+                await asyncio.wait_for(asyncio.shield(start_task), PERSISTENCE_OPEN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(f"БД не открылась за {PERSISTENCE_OPEN_TIMEOUT_SECONDS} с при остановке: накопленные строки не записаны.")
+                start_task.cancel()
+                await asyncio.gather(start_task, return_exceptions=True)
+                if self._persistence is not None:
+                    await self._persistence.backend.close()
+                self._persistence = None
+        # Writer останавливается, только если БД открылась (при ошибке открытия _persistence уже None)
+        if self._persistence is not None:
+            await self._persistence.stop()
+            self._persistence = None
+
+        # --- Дописываем и закрываем сегменты записи потока (в потоке: stop ждет очередь записи) ---
+        if self._recorder is not None:
+            await asyncio.to_thread(self._recorder.stop)
+            self._recorder = None
+
+        # --- Закрываем файлы истории тикеров (сбрасывает измененные страницы на диск) ---
+        self._record_ticker_history = False
+        self.ticker_history.close()
+
 
         # --- Уведомляем WS подписчиков о завершении работы ---
         if self.active_ws_connections:
@@ -222,7 +398,7 @@ class MarketDataService:
                  try:
                       # Отправляем специальный сигнал (например, None) в очередь подписчика
                       # Это позволит его циклу чтения `await queue.get()` завершиться.
-                     await queue.put(None)
+                     self._put_ws_message(queue, None)
                  except Exception:
                      # Игнорируем ошибки, если очередь уже закрыта или некорректна
                      pass
@@ -234,9 +410,10 @@ class MarketDataService:
 
         # --- Очищаем данные и сбрасываем статусы бирж при остановке сервиса ---
         # Доступ к разделяемому состоянию под локом
-        async with self._data_lock:
+        async with self._locked('stop'):
              # Очищаем все собранные рыночные данные
-             self.current_market_data.clear()
+             self.market_store.clear()
+             self._freshness.clear()
              logger.info("Хранилище market_data очищено.")
 
              # Сбрасываем статусы бирж. Для статусов auth_error, no_ws_support, no_pairs
@@ -247,14 +424,14 @@ class MarketDataService:
                  if status not in ['auth_error', 'no_ws_support', 'no_pairs']
              ]
              for ex_id in exchanges_to_reset_status:
-                  self._exchange_status[ex_id] = 'disconnected'
+                  self._set_exchange_status(ex_id, 'disconnected')
              logger.info("Статусы бирж сброшены на 'disconnected'.")
 
 
         logger.info("MarketDataService остановлен.")
 
 
-    def get_latest_opportunities(self) -> List[ArbitrageOpportunity]:
+    def get_latest_opportunities(self) -> List[OpportunityRecord]:
         """
         Возвращает список последних найденных арбитражных возможностей.
         Этот метод синхронный. Используется для REST API эндпоинтов.
@@ -265,6 +442,70 @@ class MarketDataService:
         return self.latest_opportunities[:]
 
 
+    async def memory_report(self, top_books: int = 50) -> Dict[str, Any]:
+        """
+        Память по компонентам сервиса в байтах (глубокий размер объектов, см. deep_sizeof):
+        книги по биржам и по (биржа, пара), тикеры, latest_opportunities, история возможностей,
+        очереди каждого WS подписчика и онлайн статистики. Общие объекты (строки имен, одно
+        сообщение в очередях нескольких подписчиков) в итогах учитываются один раз.
+        Книги и тикеры (самая большая часть) обходятся в отдельном потоке: снапшот market_store
+        copy-on-write и не меняется. Остальные структуры изменяемые и обходятся в event loop.
+        """
+        seen: Dict[int, Any] = {}
+        books, books_by_exchange, tickers_bytes = await asyncio.to_thread(
+            self._market_snapshot_sizes, self.market_store.snapshot(), seen)
+        with self.loop_monitor.stage('memory_report'):
+            # Очереди подписчиков: собственный размер каждой очереди (сообщение, общее для нескольких
+            # подписчиков, входит в размер каждой из них) и общий итог без повторов
+            subscribers = []
+            queues_total = 0
+            for queue in list(self.active_ws_connections):
+                items = list(queue._queue) # Содержимое asyncio.Queue (внутренний deque)
+                own_bytes = sum(deep_sizeof(item) for item in items)
+                queues_total += sum(deep_sizeof(item, seen) for item in items)
+                subscribers.append({'queue_items': len(items), 'maxsize': queue.maxsize, 'bytes': own_bytes})
+
+            components = {
+                'order_books': sum(books_by_exchange.values()),
+                'tickers': tickers_bytes,
+                'latest_opportunities': deep_sizeof(self.latest_opportunities, seen),
+                'opportunity_history': self.opportunity_history.estimated_bytes(),
+                'ws_queues': queues_total,
+                'spread_stats': deep_sizeof(self.spread_stats, seen),
+                'lead_lag': deep_sizeof(self.lead_lag, seen),
+                'freshness': deep_sizeof(self._freshness, seen),
+                'latency_marks': deep_sizeof(self.latency, seen),
+            }
+            return {
+                'process': process_memory(),
+                'components_bytes': components,
+                'components_total_bytes': sum(components.values()),
+                'ticker_history_mapped_bytes': self.ticker_history.mapped_bytes(),
+                'order_books': {
+                    'count': len(books),
+                    'by_exchange_bytes': books_by_exchange,
+                    'largest': books[:top_books],
+                },
+                'latest_opportunities_count': len(self.latest_opportunities),
+                'opportunity_history': {'records': len(self.opportunity_history), 'capacity': self.opportunity_history.capacity},
+                'ws_subscribers': subscribers,
+            }
+
+    @staticmethod
+    def _market_snapshot_sizes(snapshot, seen: Dict[int, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, int], int]:
+        """Размеры книг (по убыванию) и их сумма по биржам, размер тикеров снапшота market_store."""
+        books: List[Dict[str, Any]] = []
+        books_by_exchange: Dict[str, int] = {}
+        for book in snapshot.iter_order_books():
+            size = deep_sizeof(book, seen)
+            books_by_exchange[book.exchange] = books_by_exchange.get(book.exchange, 0) + size
+            levels = (len(book.bid_prices), len(book.ask_prices)) if hasattr(book, 'bid_prices') else (len(book.bids), len(book.asks))
+            books.append({'exchange': book.exchange, 'symbol': book.symbol, 'bytes': size,
+                          'bid_levels': levels[0], 'ask_levels': levels[1], 'stale': book.stale})
+        books.sort(key=lambda item: item['bytes'], reverse=True)
+        return books, books_by_exchange, deep_sizeof(snapshot.tickers_by_exchange(), seen)
+
+
     async def subscribe_ws(self) -> asyncio.Queue:
         """
         Добавляет нового WebSocket подписчика.
@@ -272,7 +513,7 @@ class MarketDataService:
         Отправляет текущий список возможностей сразу при подключении.
         """
         # Создаем новую очередь для этого подписчика
-        queue = asyncio.Queue()
+        queue = asyncio.Queue(maxsize=WS_SUBSCRIBER_QUEUE_MAX_ITEMS)
         # Добавляем очередь в множество активных соединений
         self.active_ws_connections.add(queue)
         logger.info(f"Новый WS подписчик добавлен. Всего: {len(self.active_ws_connections)}")
@@ -281,12 +522,11 @@ class MarketDataService:
         # latest_opportunities уже содержит отфильтрованные и отсортированные данные из последнего сканирования
         if self.latest_opportunities:
              try:
-                 # Сериализуем список возможностей в JSON строку. model_dump() корректно обрабатывает Pydantic модели.
-                 message = json.dumps([opp.model_dump() for opp in self.latest_opportunities])
-                 # Помещаем сообщение в очередь подписчика. put_nowait может вызвать QueueFull,
-                 # но при первой отправке очередь пуста, поэтому маловероятно.
-                 # Используем await put, чтобы убедиться, что сообщение помещено.
-                 await queue.put(message)
+                 # Сериализуем список возможностей в JSON строку. Pydantic модели создаются только здесь, на границе API.
+                 with self.loop_monitor.stage('serialize'):
+                     message = json.dumps([opp.to_model().model_dump() for opp in self.latest_opportunities])
+                 # Помещаем сообщение в очередь подписчика (при первой отправке очередь пуста)
+                 self._put_ws_message(queue, (message, time.time() * 1000))
                  logger.debug(f"Отправлены текущие возможности новому подписчику {queue} ({len(self.latest_opportunities)} шт).")
              except Exception as e:
                   # Логируем ошибку, но не считаем ее критичной для сервиса, просто для этого подписчика.
@@ -307,7 +547,7 @@ class MarketDataService:
             # в логике эндпоинта, который ее читает (ws_endpoints.py)
 
 
-    async def _notify_ws_subscribers(self, opportunities: List[ArbitrageOpportunity]):
+    async def _notify_ws_subscribers(self, opportunities: List[OpportunityRecord]):
         """
         Отправляет список найденных возможностей всем активным WebSocket подписчикам.
         Этот список уже отфильтрован сканером по MIN_PROFIT_PCT и отсортирован.
@@ -315,8 +555,13 @@ class MarketDataService:
         # Мы отправляем список, даже если он пуст (0 возможностей >= MIN_PROFIT_PCT).
         # Это позволяет фронтенду очистить таблицу, если прибыльных возможностей временно нет.
         try:
-             # Сериализуем список возможностей в JSON строку
-             message = json.dumps([opp.model_dump() for opp in opportunities])
+             # Сериализуем список возможностей в JSON строку (через Pydantic модели - граница API).
+             # Время постановки в очередь передается вместе с сообщением для учета задержки отправки.
+             with self.loop_monitor.stage('serialize'):
+                 payload = [opp.to_model().model_dump() for opp in opportunities]
+                 enqueued_ms = time.time() * 1000
+                 self.latency.stamp_enqueue(payload, enqueued_ms)
+                 message = json.dumps(payload)
              # print(f"Отправка WS сообщения: {len(message)} байт, {len(opportunities)} возможностей") # Отладка
 
         except Exception as e:
@@ -335,16 +580,10 @@ class MarketDataService:
         #logger.debug(f"Уведомление {len(subscribers_to_notify)} WS подписчиков...")
         for queue in subscribers_to_notify:
             try:
-                # Используем put_nowait для неблокирующей отправки.
-                # Если очередь полна (подписчик медленный), это вызовет asyncio.QueueFull.
-                queue.put_nowait(message)
+                # Неблокирующая отправка. Если очередь полна (подписчик медленный), вытесняется
+                # самое старое сообщение: новое содержит полный актуальный список возможностей.
+                self._put_ws_message(queue, (message, enqueued_ms))
                 # logger.debug(f"Сообщение поставлено в очередь подписчика {queue}.")
-            except asyncio.QueueFull:
-                 # Если очередь полна, логируем предупреждение и, возможно,
-                 # отключаем этого подписчика в будущем, чтобы не тратить ресурсы.
-                 # Пока просто пропускаем отправку для него в этом цикле.
-                 logger.warning(f"Ошибка: Очередь подписчика {queue} заполнена. Пропускаем сообщение для него.")
-                 # TODO: Реализовать логику отключения медленных клиентов.
             except Exception as e:
                 # Ловим любые другие ошибки при работе с очередью (например, очередь закрыта)
                 logger.error(f"Не удалось поставить сообщение в очередь подписчика {queue}: {e}. Отписка.", exc_info=True)
@@ -353,33 +592,302 @@ class MarketDataService:
                 asyncio.create_task(self.unsubscribe_ws(queue))
 
 
+    def _put_ws_message(self, queue: asyncio.Queue, message: Tuple[str, float] | None):
+        """Кладет сообщение в очередь подписчика без ожидания, вытесняя самое старое при переполнении."""
+        if queue.full():
+            try:
+                queue.get_nowait()
+                self._m_ws_dropped.inc()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(message)
+
+
+    # --- Управление подписками во время работы (admin API) ---
+    # Изменения применяются как разница к работающим задачам: затрагиваются только
+    # добавленные/удаленные биржи и пары, остальные подписки и книги ордеров не трогаются.
+
+    def get_subscriptions(self) -> Dict[str, Any]:
+        """
+        Возвращает текущий набор подписок: настроенные биржи и пары,
+        а также пары, по которым на каждой бирже реально запущены задачи подписки.
+        """
+        active: Dict[str, List[str]] = {}
+        for exchange_id, pair_tasks in self._pair_tasks.items():
+            active[exchange_id] = sorted({symbol for (_, symbol), task in pair_tasks.items() if not task.done()})
+        return {
+            "exchanges": list(self.tracked_exchanges),
+            "pairs": list(self.tracked_pairs),
+            "active": active,
+        }
+
+    async def unsupported_exchanges(self, exchanges: List[str]) -> List[str]:
+        """ID бирж, которые фабрика бирж не поддерживает (проверка до изменения подписок)."""
+        if not exchanges:
+            return []
+        await self._exchange_factory.prepare(exchanges)
+        return [exchange_id for exchange_id in exchanges if not self._exchange_factory.supports(exchange_id)]
+
+    async def add_subscriptions(self, exchanges: List[str] | None = None, symbols: List[str] | None = None) -> Dict[str, List[str]]:
+        """
+        Добавляет биржи и/или пары к отслеживаемым без переподключения уже работающих бирж.
+        Новые пары подписываются на всех подключенных биржах (если биржа их поддерживает),
+        новые биржи запускаются отдельной задачей _watch_exchange.
+        Возвращает фактически добавленные биржи и пары (уже отслеживаемые пропускаются).
+        Вызывает ValueError, если биржа не поддерживается фабрикой бирж (ccxt.pro).
+        """
+        exchanges = exchanges or []
+        symbols = symbols or []
+
+        unknown = await self.unsupported_exchanges(exchanges)
+        if unknown:
+            raise ValueError(f"Биржи не поддерживаются ccxt.pro: {', '.join(unknown)}")
+
+        added_symbols = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.tracked_pairs]
+        added_exchanges = [exchange_id for exchange_id in dict.fromkeys(exchanges) if exchange_id not in self.tracked_exchanges]
+
+        async with self._locked('add_subscriptions'):
+            # --- Новые пары на уже подключенных биржах ---
+            self.tracked_pairs.extend(added_symbols)
+            for exchange_id, exchange in self._exchanges.items():
+                started = [symbol for symbol in added_symbols if self._start_pair_subscriptions(exchange, symbol)]
+                if started:
+                    logger.info(f"Admin: Добавлены подписки на {started} для {exchange_id.upper()}.")
+                    self._subscriptions_changed[exchange_id].set()
+
+            # --- Новые биржи ---
+            self.tracked_exchanges.extend(added_exchanges)
+            for exchange_id in added_exchanges:
+                self._set_exchange_status(exchange_id, 'disconnected')
+
+        if self._running:
+            for exchange_id in added_exchanges:
+                self._start_exchange_task(exchange_id)
+            # Биржи, остановленные из-за отсутствия пар, перезапускаем, если появились новые пары
+            if added_symbols:
+                for exchange_id in self.tracked_exchanges:
+                    task = self._collector_tasks.get(exchange_id)
+                    if self._exchange_status.get(exchange_id) == 'no_pairs' and (task is None or task.done()):
+                        self._start_exchange_task(exchange_id)
+
+        logger.info(f"Admin: Добавлено бирж: {added_exchanges}, пар: {added_symbols}.")
+        return {"exchanges": added_exchanges, "symbols": added_symbols}
+
+    async def remove_subscriptions(self, exchanges: List[str] | None = None, symbols: List[str] | None = None) -> Dict[str, List[str]]:
+        """
+        Удаляет биржи и/или пары из отслеживаемых.
+        Для удаленных пар отменяются только их задачи подписки, потоки ccxt.pro закрываются
+        через unWatchOrderBook/unWatchTicker (если биржа их поддерживает) и очищаются их данные,
+        удаленные биржи останавливаются целиком. Остальные подписки продолжают работу.
+        Возвращает фактически удаленные биржи и пары.
+        """
+        removed_symbols = [symbol for symbol in dict.fromkeys(symbols or []) if symbol in self.tracked_pairs]
+        removed_exchanges = [exchange_id for exchange_id in dict.fromkeys(exchanges or []) if exchange_id in self.tracked_exchanges]
+
+        cancelled_tasks: List[asyncio.Task] = []
+        unwatch: List[Tuple[Any, str, str]] = [] # (биржа, тип потока, пара) для отписки после отмены задач
+        async with self._locked('remove_subscriptions'):
+            # --- Удаляемые пары ---
+            for symbol in removed_symbols:
+                self.tracked_pairs.remove(symbol)
+            for exchange_id, pair_tasks in self._pair_tasks.items():
+                for key in [key for key in pair_tasks if key[1] in removed_symbols]:
+                    task = pair_tasks.pop(key)
+                    task.cancel()
+                    cancelled_tasks.append(task)
+                    exchange = self._exchanges.get(exchange_id)
+                    if exchange is not None and exchange_id not in removed_exchanges:
+                        unwatch.append((exchange, *key))
+                for symbol in removed_symbols:
+                    self.market_store.remove_pair(exchange_id, symbol)
+                    self._freshness.discard(exchange_id, symbol)
+                if exchange_id in self._subscriptions_changed:
+                    self._subscriptions_changed[exchange_id].set()
+
+            # --- Удаляемые биржи ---
+            for exchange_id in removed_exchanges:
+                self.tracked_exchanges.remove(exchange_id)
+
+        # Задачи бирж отменяем вне лока: их finally-блоки сами захватывают _data_lock.
+        exchange_tasks = [self._collector_tasks.pop(exchange_id) for exchange_id in removed_exchanges if exchange_id in self._collector_tasks]
+        for task in exchange_tasks:
+            task.cancel()
+        await asyncio.gather(*cancelled_tasks, *exchange_tasks, return_exceptions=True)
+        # Отмена задачи не закрывает подписку ccxt.pro: без отписки биржа продолжает слать обновления пары
+        await asyncio.gather(*(self._unwatch_pair_stream(exchange, kind, symbol) for exchange, kind, symbol in unwatch))
+
+        async with self._locked('remove_subscriptions'):
+            for exchange_id in removed_exchanges:
+                self._set_exchange_status(exchange_id, None)
+                self.market_store.close_exchange(exchange_id)
+                self._freshness.discard_exchange(exchange_id)
+                self.spread_stats.discard_exchange(exchange_id)
+                self.lead_lag.discard_exchange(exchange_id)
+                self.latency.discard_exchange(exchange_id)
+
+        logger.info(f"Admin: Удалено бирж: {removed_exchanges}, пар: {removed_symbols}.")
+        return {"exchanges": removed_exchanges, "symbols": removed_symbols}
+
+
     # --- Приватные методы для внутренних задач ( watch_exchange, watch_order_book, watch_ticker ) ---
 
+    @staticmethod
+    def _uses_native_depth_feed(exchange) -> bool:
+        """Книга биржи идет через собственный diff-depth обработчик Binance, а не ccxt.pro watch_order_book."""
+        return USE_NATIVE_BINANCE_FEED and exchange.id == 'binance' and not getattr(exchange, 'simulated', False)
+
+    async def _unwatch_pair_stream(self, exchange, kind: str, symbol: str):
+        """
+        Закрывает подписку ccxt.pro на поток пары ('ob' или 'ticker') после отмены ее задачи.
+        Если биржа не поддерживает отписку, поток остается открытым до переподключения биржи.
+        """
+        exchange_id = exchange.id
+        if kind == 'ob' and self._uses_native_depth_feed(exchange):
+            return # Соединение diff-depth закрывается вместе с задачей
+        method = 'unWatchOrderBook' if kind == 'ob' else 'unWatchTicker'
+        if not exchange.has.get(method, False):
+            logger.info(f"WS: {exchange_id.upper()} не поддерживает {method}: поток {kind} для {symbol} "
+                        f"остается открытым до переподключения биржи (его обновления не обрабатываются).")
+            return
+        try:
+            unwatch = exchange.un_watch_order_book if kind == 'ob' else exchange.un_watch_ticker
+            await asyncio.wait_for(unwatch(symbol), WS_UNWATCH_TIMEOUT_SECONDS)
+            logger.debug(f"WS: {method} для {symbol}@{exchange_id.upper()} выполнен.")
+        except Exception as e:
+            logger.warning(f"WS: Ошибка {method} для {symbol}@{exchange_id.upper()}: {type(e).__name__}: {e}. "
+                           f"Поток остается открытым до переподключения биржи.")
+
+    def _restore_warm_start_snapshot(self, books: List[OrderBookRecord], opportunities: List[OpportunityRecord]):
+        """
+        Переносит книги ордеров и возможности warm-start снапшота (см. WarmStartCache.load_snapshot)
+        в market_store и latest_opportunities (только для отслеживаемых бирж и пар). Вызывается под _data_lock.
+        Книги помечены stale и заменяются живыми данными по мере прихода WS обновлений.
+        """
+        restored = 0
+        for book in books:
+            if book.exchange in self.tracked_exchanges and book.symbol in self.tracked_pairs:
+                exchange_idx = self.market_store.open_exchange(book.exchange)
+                self.market_store.set_order_book(exchange_idx, self.market_store.symbol_index(book.symbol), book)
+                # Возраст stale книги отсчитывается от момента загрузки, а биржевой timestamp
+                # остается старым: такие книги не сравниваются с живыми (см. MAX_BOOK_SKEW_MS).
+                self._freshness.touch(book.exchange, book.symbol, book.timestamp, stale=True)
+                restored += 1
+        self.latest_opportunities = [
+            opp for opp in opportunities
+            if opp.symbol in self.tracked_pairs and {opp.buy_exchange, opp.sell_exchange} <= set(self.tracked_exchanges)
+        ]
+        if restored or self.latest_opportunities:
+            logger.info(f"Warm-start: загружено {restored} stale книг и {len(self.latest_opportunities)} stale возможностей.")
+
+    async def _start_persistence(self, persistence: PersistenceWriter):
+        """Открывает БД для записи; при ошибке или остановке сервиса до открытия запись отключается."""
+        try:
+            await persistence.start()
+        except Exception as e:
+            logger.error(f"Не удалось запустить запись в БД ({type(persistence.backend).__name__}): {e}. Работаем без хранения.", exc_info=True)
+            self._persistence = None
+
+    def _start_exchange_task(self, exchange_id: str):
+        """Создает задачу _watch_exchange для биржи и регистрирует ее в _collector_tasks."""
+        self._collector_tasks[exchange_id] = asyncio.create_task(self._watch_exchange(exchange_id))
+        logger.debug(f"Создана задача _watch_exchange для биржи {exchange_id.upper()}")
+
+    @staticmethod
+    def _is_pair_supported(exchange, symbol: str) -> bool:
+        """Проверяет, что пара есть в загруженных рынках биржи и не помечена как неактивная."""
+        market = exchange.markets.get(symbol) if isinstance(exchange.markets, dict) else None
+        return market is not None and market.get('active') is not False
+
+    def _start_pair_subscriptions(self, exchange, symbol: str) -> bool:
+        """
+        Создает задачи подписки на ОБ и Тикер для пары на бирже (если их еще нет).
+        Вызывается под _data_lock. Возвращает False, если пара не поддерживается биржей.
+        """
+        exchange_id = exchange.id
+        # Проверяем, поддерживается ли биржа эту пару и активна ли она в загруженных рынках
+        if not self._is_pair_supported(exchange, symbol):
+            logger.warning(f"Пара {symbol} не поддерживается или неактивна на бирже {exchange_id.upper()}. Пропускаем подписку.")
+            return False
+
+        methods = exchange.has
+        pair_tasks = self._pair_tasks.setdefault(exchange_id, {})
+
+        # Подписываемся на ОБ для сканера арбитража (если поддерживается watchOrderBook)
+        if methods.get('watchOrderBook', False) and ('ob', symbol) not in pair_tasks:
+            if self._uses_native_depth_feed(exchange):
+                # Собственный diff-depth обработчик Binance вместо ccxt.pro watch_order_book
+                pair_tasks[('ob', symbol)] = asyncio.create_task(self._watch_binance_depth_for_pair(exchange, symbol))
+                logger.debug(f"Создана задача _watch_binance_depth_for_pair для {symbol}@{exchange_id.upper()}")
+            else:
+                pair_tasks[('ob', symbol)] = asyncio.create_task(self._watch_order_book_for_pair(exchange, symbol))
+                logger.debug(f"Создана задача _watch_order_book_for_pair для {symbol}@{exchange_id.upper()}")
+
+        # Подписываемся на Тикер (если поддерживается watchTicker)
+        # Тикеры могут быть полезны для MonitoredList, даже если для сканера нужны ОБ.
+        if methods.get('watchTicker', False) and ('ticker', symbol) not in pair_tasks:
+            pair_tasks[('ticker', symbol)] = asyncio.create_task(self._watch_ticker_for_pair(exchange, symbol))
+            logger.debug(f"Создана задача _watch_ticker_for_pair для {symbol}@{exchange_id.upper()}")
+
+        return True
+
+    async def _supervise_pair_tasks(self, exchange_id: str):
+        """
+        Ожидает задачи подписки биржи, учитывая, что их набор может меняться во время ожидания.
+        Пробрасывает первое исключение упавшей задачи (для переподключения всей биржи).
+        Возвращает управление, когда у биржи не осталось работающих задач подписки.
+        """
+        pair_tasks = self._pair_tasks[exchange_id]
+        changed = self._subscriptions_changed[exchange_id]
+
+        while True:
+            # Убираем завершенные задачи (BadSymbol, отмена через admin API) и проверяем их на ошибки
+            for key, task in list(pair_tasks.items()):
+                if not task.done():
+                    continue
+                del pair_tasks[key]
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+
+            if not pair_tasks:
+                return
+
+            changed.clear()
+            changed_waiter = asyncio.create_task(changed.wait())
+            try:
+                await asyncio.wait([*pair_tasks.values(), changed_waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed_waiter.cancel()
+
+
     async def _watch_exchange(self, exchange_id: str):
         """
         Подключается к конкретной бирже по WebSocket, управляет подписками на OB/Ticker.
         Обрабатывает ошибки подключения и переподключения для всей биржи.
         """
-        exchange = None # Объект биржи ccxtpro
+        exchange = None # Объект биржи ccxt.pro (или симулятора, см. exchange_factory.py)
         reconnect_delay = 1 # Начальная задержка перед переподключением (в секундах)
         MAX_RECONNECT_DELAY = 60 # Максимальная задержка перед переподключением (в секундах)
+        connect_attempts = 0 # Попытки подключения (все, кроме первой, считаются переподключениями)
 
         # Внешний цикл для обработки критических ошибок и переподключений всей биржи
         while self._running:
+            if connect_attempts:
+                self._m_reconnects.inc((exchange_id,))
+            connect_attempts += 1
             try:
                 logger.info(f"Attempting to connect to {exchange_id.upper()} WebSocket...")
-                # Обновляем статус подключения под локом
-                async with self._data_lock:
-                     self._exchange_status[exchange_id] = 'connecting'
+                # Обновляем статус подключения (copy-on-write, без лока)
+                self._set_exchange_status(exchange_id, 'connecting')
+
+                # Модули бирж загружаются при первом подключении, в потоке (см. ExchangeFactory.prepare)
+                await self._exchange_factory.prepare([exchange_id])
 
                 # --- Инициализация биржи ---
-                # Получаем класс биржи из ccxtpro по ее ID
-                exchange_class = getattr(ccxtpro, exchange_id)
-                # Создаем экземпляр биржи
+                # Создаем экземпляр биржи через фабрику (класс ccxt.pro по ID биржи или симулятор)
                 # TODO: Добавить API ключи и секреты сюда, если они нужны для WS (например, приватные подписки)
                 # или для REST запросов (load_markets, fetch_fees, fetch_deposit_withdraw_fees).
                 # Не храните ключи здесь в открытом виде! Используйте переменные окружения.
-                # exchange = exchange_class({
+                # exchange = self._exchange_factory.create(exchange_id, {
                 #     'apiKey': os.getenv(f'{exchange_id.upper()}_API_KEY'),
                 #     'secret': os.getenv(f'{exchange_id.upper()}_API_SECRET'),
                 #     # Добавьте другие параметры, если нужны (password для Kraken, uid для OKX, options и т.д.)
@@ -388,7 +896,7 @@ class MarketDataService:
                 #     'watchdog_tick': 10000, # Интервал проверки соединения для WS (ms)
                 # })
                 # Пока используем без ключей:
-                exchange = exchange_class({
+                exchange = self._exchange_factory.create(exchange_id, {
                     'enableRateLimit': True,
                     'timeout': 20000,
                     'watchdog_tick': 10000,
@@ -403,9 +911,8 @@ class MarketDataService:
                 # Проверяем наличие словаря методов и ключей в нем
                 if not isinstance(methods, dict):
                     logger.warning(f"Биржа {exchange_id.upper()} не предоставила список методов через ccxt.pro. Пропускаем.")
-                    async with self._data_lock:
-                         # Устанавливаем статус ошибки, если список методов не получен
-                         self._exchange_status[exchange_id] = 'error' # Общий статус ошибки
+                    # Устанавливаем статус ошибки, если список методов не получен
+                    self._set_exchange_status(exchange_id, 'error') # Общий статус ошибки
                     # Ждем перед следующей попыткой подключения к этой бирже
                     await asyncio.sleep(reconnect_delay)
                     reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY) # Экспоненциальный откат
@@ -417,9 +924,8 @@ class MarketDataService:
 
                 if not supports_ob_ws and not supports_ticker_ws:
                     logger.warning(f"Биржа {exchange_id.upper()} не поддерживает watchOrderBook и watchTicker по WebSocket через ccxt.pro. Пропускаем навсегда.")
-                    async with self._data_lock:
-                        # Устанавливаем специфический статус, если нет поддержки нужных WS методов
-                        self._exchange_status[exchange_id] = 'no_ws_support'
+                    # Устанавливаем специфический статус, если нет поддержки нужных WS методов
+                    self._set_exchange_status(exchange_id, 'no_ws_support')
                     break # Выходим из внешнего цикла, не пытаемся переподключиться
 
 
@@ -431,13 +937,25 @@ class MarketDataService:
                      # load_markets делает REST запрос. Он нужен для получения информации о парах (названия, точность, активность).
                      # Может занять время и упасть из-за сетевых проблем или rate limit.
                      # Rate limit для этого запроса управляется ccxtpro, если enableRateLimit=True.
-                     logger.info(f"Загрузка рынков для {exchange_id.upper()}...")
-                     await exchange.load_markets() # Загружаем информацию о всех парах на бирже
+                     # Если в warm-start кэше есть свежие рынки (в памяти или на диске), REST запрос не выполняется.
+                     # Рынки симулятора в кэш не попадают: ID бирж те же, что у реальных
+                     simulated = getattr(exchange, 'simulated', False)
+                     # Чтение кэша (JSON на мегабайты) и set_markets - в потоке, чтобы не блокировать event loop
+                     cached_markets = await asyncio.to_thread(self._warm_cache.load_markets, exchange_id) if not simulated else None
+                     if cached_markets is not None:
+                          await asyncio.to_thread(exchange.set_markets, cached_markets['markets'], cached_markets['currencies'] or None)
+                          logger.info(f"Рынки для {exchange_id.upper()} взяты из warm-start кэша.")
+                     else:
+                          logger.info(f"Загрузка рынков для {exchange_id.upper()}...")
+                          await exchange.load_markets() # Загружаем информацию о всех парах на бирже
+                          if isinstance(exchange.markets, dict) and not simulated:
+                               # Запись на диск выполняем в потоке, чтобы не блокировать event loop
+                               await asyncio.to_thread(self._warm_cache.save_markets, exchange_id, exchange.markets, exchange.currencies)
 
                      # Проверяем, что markets успешно загрузились
                      if exchange.markets is None or not isinstance(exchange.markets, dict):
                           logger.error(f"Ошибка: exchange.markets для {exchange_id.upper()} не загружены или имеют некорректный формат после load_markets. Пропускаем все пары для этой биржи.")
-                          async with self._data_lock: self._exchange_status[exchange_id] = 'error'
+                          self._set_exchange_status(exchange_id, 'error')
                           await asyncio.sleep(reconnect_delay)
                           reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
                           continue # Пытаемся переподключиться ко всей бирже
@@ -451,58 +969,49 @@ class MarketDataService:
                 except Exception as e:
                      # Ловим ошибки загрузки рынков (RequestTimeout, NetworkError, ExchangeError и т.д.)
                      logger.error(f"Ошибка загрузки рынков для {exchange_id.upper()}: {e}. Пропускаем все пары для этой биржи.", exc_info=True)
-                     async with self._data_lock: self._exchange_status[exchange_id] = 'error'
+                     self._set_exchange_status(exchange_id, 'error')
                      await asyncio.sleep(reconnect_delay)
                      reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
                      continue # Пытаемся переподключиться ко всей бирже
 
 
                 # --- Запускаем задачи подписки на отслеживаемые пары ---
-                tasks = [] # Список задач подписки для этой биржи
-                tracked_pairs_on_exchange = [] # Список пар, которые мы действительно будем отслеживать
-                failed_pairs = [] # Пары, для которых подписка не удалась (например, BadSymbol)
-
-                # Создаем запись для этой биржи в current_market_data под локом
+                # Открываем биржу в market_store под локом
                 # Данные для пар будут добавляться задачами подписки.
-                async with self._data_lock:
-                     self.current_market_data[exchange_id] = {}
+                async with self._locked('watch_exchange'):
+                     # Stale книги из warm-start снапшота не удаляем: их заменят живые данные.
+                     self.market_store.open_exchange(exchange_id)
                      # Устанавливаем статус 'connected' только после успешной загрузки рынков
-                     self._exchange_status[exchange_id] = 'connected'
-
-
-                for symbol in PAIRS_TO_TRACK_WS:
-                     # Проверяем, поддерживается ли биржа эту пару и активна ли она в загруженных рынках
-                     if symbol not in exchange.markets or (exchange.markets[symbol].get('active') is False and exchange.markets[symbol].get('active') is not None):
-                         logger.warning(f"Пара {symbol} не поддерживается или неактивна на бирже {exchange_id.upper()}. Пропускаем подписку.")
-                         continue
-
-                     tracked_pairs_on_exchange.append(symbol)
-
-                     # Подписываемся на ОБ для сканера арбитража (если поддерживается watchOrderBook)
-                     if supports_ob_ws:
-                        # Создаем отдельную задачу для подписки на ОБ для этой пары
-                        tasks.append(asyncio.create_task(self._watch_order_book_for_pair(exchange, symbol)))
-                        logger.debug(f"Создана задача _watch_order_book_for_pair для {symbol}@{exchange_id.upper()}")
-
-                     # Подписываемся на Тикер (если поддерживается watchTicker)
-                     # Тикеры могут быть полезны для MonitoredList, даже если для сканера нужны ОБ.
-                     if supports_ticker_ws:
-                        # Создаем отдельную задачу для подписки на Тикер для этой пары
-                        tasks.append(asyncio.create_task(self._watch_ticker_for_pair(exchange, symbol)))
-                        logger.debug(f"Создана задача _watch_ticker_for_pair для {symbol}@{exchange_id.upper()}")
-
+                     self._set_exchange_status(exchange_id, 'connected')
+                     timeline.event('first_exchange_connected')
+                     self._exchanges[exchange_id] = exchange
+                     self._pair_tasks[exchange_id] = {}
+                     self._subscriptions_changed[exchange_id] = asyncio.Event()
+
+                     tracked_pairs_on_exchange = [] # Список пар, которые мы действительно будем отслеживать
+                     for symbol in self.tracked_pairs:
+                          if self._start_pair_subscriptions(exchange, symbol):
+                              tracked_pairs_on_exchange.append(symbol)
+                          else:
+                              # Для неподдерживаемой пары живых данных не будет, stale данные удаляем
+                              self.market_store.remove_pair(exchange_id, symbol)
+                              self._freshness.discard(exchange_id, symbol)
+
+                tasks = self._pair_tasks[exchange_id] # Задачи подписки для этой биржи
 
                 if not tasks:
                      # Если после проверки всех пар не удалось создать ни одной задачи подписки
                      logger.warning(f"Нет активных подписок для биржи {exchange_id.upper()} по заданным парам ({len(tracked_pairs_on_exchange)} поддерживаемых). Пропускаем навсегда.")
-                     async with self._data_lock:
-                         # Устанавливаем специфический статус, если нет подписок на пары
-                         self._exchange_status[exchange_id] = 'no_pairs'
-                     # Очищаем запись биржи из current_market_data, т.к. нет активных подписок
-                     async with self._data_lock:
-                          if exchange_id in self.current_market_data:
-                               del self.current_market_data[exchange_id]
-                     break # Выходим из внешнего цикла, не пытаемся переподключиться
+                     # Устанавливаем специфический статус, если нет подписок на пары
+                     self._set_exchange_status(exchange_id, 'no_pairs')
+                     # Закрываем биржу в market_store, т.к. нет активных подписок
+                     async with self._locked('watch_exchange'):
+                          self.market_store.close_exchange(exchange_id)
+                          self._freshness.discard_exchange(exchange_id)
+                          self.spread_stats.discard_exchange(exchange_id)
+                          self.lead_lag.discard_exchange(exchange_id)
+                          self.latency.discard_exchange(exchange_id)
+                     break # Выходим из внешнего цикла (add_subscriptions перезапустит задачу при добавлении пар)
 
                 # Если задачи подписки были созданы:
                 logger.info(f"Запущены задачи подписки для {exchange_id.upper()}: {len(tasks)} подписок для {len(tracked_pairs_on_exchange)} пар.")
@@ -511,23 +1020,27 @@ class MarketDataService:
                 reconnect_delay = 1
 
                 # --- Ожидаем завершения задач подписки ---
-                # asyncio.gather ожидает завершения всех переданных ему задач.
-                # Если return_exceptions=False (по умолчанию), первое же необработанное исключение
-                # в любой из задач будет проброшено здесь, прерывая gather.
-                # Это то, что нам нужно: если задача подписки упала из-за ошибки (которую
-                # ccxt.pro watch цикл не смог обработать внутренне), мы считаем это
-                # критической ошибкой для этой биржи и пытаемся переподключиться ко всей бирже.
-                await asyncio.gather(*tasks, return_exceptions=False)
-
-                # Если gather завершился без исключений, это означает, что ВСЕ задачи подписки
+                # Набор задач может меняться во время работы (admin API), поэтому вместо
+                # asyncio.gather используем супервизор, который пробрасывает первое
+                # необработанное исключение любой задачи подписки. Это то, что нам нужно:
+                # если задача подписки упала из-за ошибки (которую ccxt.pro watch цикл
+                # не смог обработать внутренне), мы считаем это критической ошибкой
+                # для этой биржи и пытаемся переподключиться ко всей бирже.
+                await self._supervise_pair_tasks(exchange_id)
+
+                # Если супервизор завершился без исключений, это означает, что ВСЕ задачи подписки
                 # завершились без ошибок. В watch циклах такого быть не должно (они бесконечные),
-                # кроме случаев отмены (CancelledError) или BadSymbol (которые ловятся внутри watch_*_for_pair
-                # и приводят к выходу из конкретного watch цикла, но не всей задачи _watch_exchange).
+                # кроме случаев BadSymbol (которые ловятся внутри watch_*_for_pair) или
+                # снятия всех пар этой биржи через admin API.
+                if not any(self._is_pair_supported(exchange, symbol) for symbol in self.tracked_pairs):
+                     logger.info(f"Для {exchange_id.upper()} не осталось отслеживаемых пар. Задача биржи остановлена до добавления пар.")
+                     self._set_exchange_status(exchange_id, 'no_pairs')
+                     break
+
                 # Если мы дошли сюда, возможно, что-то пошло не так, и все watch циклы завершились.
                 logger.info(f"MarketDataService: Все подзадачи подписки для {exchange_id.upper()} завершены (или упали). Переподключение.")
-                # Если gather завершился, это считается ошибкой (кроме CancelledError, которая ловится выше)
                 # Устанавливаем статус ошибки для биржи и цикл while self._running: попытается переподключиться.
-                async with self._data_lock: self._exchange_status[exchange_id] = 'error'
+                self._set_exchange_status(exchange_id, 'error')
                 await asyncio.sleep(reconnect_delay)
                 reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
 
@@ -536,25 +1049,25 @@ class MarketDataService:
                  # Эта ошибка ловится здесь, если родительская задача (например, MarketDataService.stop) отменила эту задачу _watch_exchange
                  logger.info(f"Задача _watch_exchange для {exchange_id.upper()} отменена.")
                  # Устанавливаем статус отключения, если он не был уже установлен на специфическую ошибку
-                 async with self._data_lock:
-                     if self._exchange_status.get(exchange_id) not in ['auth_error', 'no_ws_support', 'no_pairs']:
-                         self._exchange_status[exchange_id] = 'disconnected'
+                 if self._exchange_status.get(exchange_id) not in ['auth_error', 'no_ws_support', 'no_pairs']:
+                     self._set_exchange_status(exchange_id, 'disconnected')
                  break # Выходим из внешнего while self._running: цикла при отмене
 
-            except (AuthenticationError) as e:
+            except ccxt_errors.AuthenticationError as e:
                  # Эта ошибка возникает, если API ключи некорректны или отсутствуют для аутентифицированных подписок.
                  # Считаем эту ошибку критической, не пытаемся переподключиться.
                  logger.error(f"Критическая ошибка аутентификации при подключении к {exchange_id.upper()} по WS: {e}. Пропускаем навсегда.", exc_info=True)
-                 async with self._data_lock: self._exchange_status[exchange_id] = 'auth_error' # Специфический статус ошибки
+                 self._set_exchange_status(exchange_id, 'auth_error') # Специфический статус ошибки
                  break # Выходим из внешнего цикла навсегда
 
             # Ловим различные типы ошибок соединения и протокола, которые ccxt.pro может пробросить
-            except (ExchangeError, NetworkError, BaseError, OperationRejected, RequestTimeout, NotSupported, ArgumentsRequired) as e:
+            except (ccxt_errors.ExchangeError, ccxt_errors.NetworkError, ccxt_errors.BaseError, ccxt_errors.OperationRejected,
+                    ccxt_errors.RequestTimeout, ccxt_errors.NotSupported, ccxt_errors.ArgumentsRequired) as e:
                  # Эти ошибки считаются временными проблемами или проблемами конфигурации (кроме NotSupported/ArgumentsRequired, которые могут быть постоянными)
                  # Пытаемся переподключиться после задержки.
                  error_type = type(e).__name__
                  logger.error(f"Ошибка типа {error_type} с {exchange_id.upper()} по WS: {e}. Попытка переподключения через {reconnect_delay}с.", exc_info=True)
-                 async with self._data_lock: self._exchange_status[exchange_id] = 'error' # Общий статус ошибки для временных проблем
+                 self._set_exchange_status(exchange_id, 'error') # Общий статус ошибки для временных проблем
                  # Переподключение происходит в следующей итерации внешнего while loop
                  await asyncio.sleep(reconnect_delay) # Ждем перед следующей попыткой
                  reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY) # Экспоненциальный откат
@@ -562,17 +1075,27 @@ class MarketDataService:
             except Exception as e:
                 # Ловим любые другие неожиданные ошибки, которые могут произойти во внешнем цикле _watch_exchange
                 logger.error(f"Неожиданная ошибка в _watch_exchange для {exchange_id.upper()}: {e}. Попытка переподключения через {reconnect_delay}с.", exc_info=True)
-                async with self._data_lock: self._exchange_status[exchange_id] = 'error'
+                self._set_exchange_status(exchange_id, 'error')
                 await asyncio.sleep(reconnect_delay)
                 reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
 
 
             finally:
-                # Этот блок выполняется при выходе из try (нормальное завершение gather)
+                # Этот блок выполняется при выходе из try (нормальное завершение супервизора)
                 # или при возникновении исключения, которое не поймано внутри watch_*_for_pair
                 # (т.е. большинство ошибок, кроме CancelledError и AuthError, которые ловятся выше).
                 # Также выполняется при выходе из while loop (BadSymbol, No WS Support, No Pairs, Auth Error, CancelledError).
 
+                # --- Отменяем оставшиеся задачи подписки этой биржи ---
+                # Они работают на объекте биржи, который сейчас будет закрыт.
+                pair_tasks = self._pair_tasks.pop(exchange_id, {})
+                for pair_task in pair_tasks.values():
+                     pair_task.cancel()
+                if pair_tasks:
+                     await asyncio.gather(*pair_tasks.values(), return_exceptions=True)
+                self._exchanges.pop(exchange_id, None)
+                self._subscriptions_changed.pop(exchange_id, None)
+
                 # --- Корректное закрытие соединения ccxt.pro ---
                 # Проверяем, был ли создан объект биржи и имеет ли он метод close.
                 if exchange and hasattr(exchange, 'close'):
@@ -588,7 +1111,10 @@ class MarketDataService:
                                        is_any_client_open = True
                                        break
 
-                         if is_any_client_open:
+                         # У симулятора нет WS клиентов, но close() снимает объект с учета в симуляторе
+                         if getattr(exchange, 'simulated', False):
+                            await exchange.close()
+                         elif is_any_client_open:
                             logger.info(f"Closing WebSocket connection for {exchange_id.upper()}...")
                             await exchange.close() # Асинхронное закрытие соединения
                             logger.info(f"WebSocket connection for {exchange_id.upper()} closed.")
@@ -601,7 +1127,7 @@ class MarketDataService:
 
                 # --- Очистка данных и обновление статуса в хранилище при завершении задачи ---
                 # Доступ к разделяемому состоянию под локом
-                async with self._data_lock:
+                async with self._locked('watch_exchange'):
                     current_status = self._exchange_status.get(exchange_id, 'unknown') # Получаем текущий статус
 
                     # Очищаем данные для этой биржи из хранилища при завершении задачи,
@@ -613,10 +1139,13 @@ class MarketDataService:
                     # произошло без исключения (что странно), то статус будет 'connected'.
                     # В любом случае, если статус не 'auth_error', 'no_ws_support', 'no_pairs',
                     # очищаем данные, чтобы не хранить устаревшие данные от отключенной биржи.
-                    if current_status not in ['auth_error', 'no_ws_support', 'no_pairs'] and exchange_id in self.current_market_data:
+                    if current_status not in ['auth_error', 'no_ws_support', 'no_pairs'] and self.market_store.is_open(exchange_id):
                         logger.debug(f"Очистка данных для {exchange_id.upper()} из хранилища в finally.")
-                        del self.current_market_data[exchange_id]
-                        #logger.debug(f"Размер current_market_data после очистки {exchange_id}: {len(self.current_market_data)}")
+                        self.market_store.close_exchange(exchange_id)
+                        self._freshness.discard_exchange(exchange_id)
+                        self.spread_stats.discard_exchange(exchange_id)
+                        self.lead_lag.discard_exchange(exchange_id)
+                        self.latency.discard_exchange(exchange_id)
 
                     # Обновляем статус на 'disconnected', если задача завершилась не по специфической ошибке
                     # и не по отмене. Если вышла из-за ошибки (и статус 'error'), оставляем 'error'.
@@ -624,7 +1153,7 @@ class MarketDataService:
                     # (если return_exceptions=False) - статус должен быть установлен на 'error' выше.
                     # Если gather завершился нормально (не должно быть), статус 'connected' -> ставим 'disconnected'.
                     if current_status == 'connected': # Если статус был 'connected' перед выходом
-                         self._exchange_status[exchange_id] = 'disconnected'
+                         self._set_exchange_status(exchange_id, 'disconnected')
                     # Если статус был 'connecting' и мы дошли сюда, вероятно, была ошибка подключения, которую поймали выше.
                     # Статус 'error' уже установлен.
 
@@ -644,12 +1173,24 @@ class MarketDataService:
     async def _watch_order_book_for_pair(self, exchange, symbol: str):
         """
         Подписывается на обновления книги ордеров для конкретной пары на бирже.
-        Получает данные, нормализует, сохраняет в self.current_market_data под локом.
+        Получает данные, нормализует, сохраняет в self.market_store под локом.
         """
         exchange_id = exchange.id
-        ob_data_key = f"{symbol}_ob" # Ключ для хранения в current_market_data
+        # Индексы биржи и пары в market_store (интернируются один раз на подписку)
+        exchange_idx = self.market_store.exchange_index(exchange_id)
+        symbol_idx = self.market_store.symbol_index(symbol)
         logger.debug(f"WS: Подписка на OB для {symbol}@{exchange_id.upper()}...")
 
+        # Шаг цены и лот рынка для fixed-point представления (берутся из уже загруженных exchange.markets)
+        increments = None
+        if USE_FIXED_POINT_ORDER_BOOKS:
+            increments = market_increments(exchange.markets.get(symbol, {}), exchange.precisionMode)
+            if increments is None:
+                logger.warning(f"WS OB: Для {symbol}@{exchange_id.upper()} нет фиксированного шага цены/лота. Используем float книгу.")
+
+        # Счетчик обновлений для выборочной валидации (1 из MODEL_VALIDATION_SAMPLE_RATE)
+        update_count = 0
+
         # Внутренний цикл async for от ccxt.pro сам обрабатывает большинство ошибок подписки и переподключения
         # Внешний цикл while self._running: позволяет задаче завершиться при остановке сервиса
         while self._running:
@@ -657,6 +1198,7 @@ class MarketDataService:
                  # watch_order_book возвращает асинхронный генератор, который выдает обновления книги ордеров.
                  # ccxt.pro заботится о поддержании соединения и переподключениях.
                  order_book_data = await exchange.watch_order_book(symbol, limit=WS_ORDER_BOOK_DEPTH)
+                 received_ms = time.time() * 1000
                  # order_book_data - это словарь, возвращаемый ccxt.pro parse_order_book
                  if order_book_data:
                      # Проверяем базовую структуру данных
@@ -664,39 +1206,41 @@ class MarketDataService:
                         isinstance(order_book_data.get('bids'), list) and \
                         isinstance(order_book_data.get('asks'), list):
 
-                         # Создаем экземпляр NormalizedOrderBook Pydantic модели
-                         # Дополнительная валидация данных уровней происходит при создании модели
+                         # Создаем внутреннюю запись книги без валидации уровней.
+                         # Полная валидация Pydantic моделью выполняется выборочно: 1 из MODEL_VALIDATION_SAMPLE_RATE обновлений.
                          try:
-                             normalized_ob_pydantic = NormalizedOrderBook(
-                                 exchange=exchange_id,
-                                 symbol=order_book_data.get('symbol', symbol), # Используем символ из данных, если есть
-                                 bids=order_book_data.get('bids', []), # Используем .get с пустым списком по умолчанию
-                                 asks=order_book_data.get('asks', []),
-                                 timestamp=order_book_data.get('timestamp'),
-                                 datetime=order_book_data.get('datetime'),
-                                 # Добавьте другие поля OB, если нужны в модели
-                             )
-
-                             # Получение блокировки для безопасной записи
-                             async with self._data_lock:
-                                 # Проверяем, что запись для этой биржи все еще существует в общем хранилище.
-                                 # Это предотвращает ошибки записи, если родительская задача (_watch_exchange)
-                                 # уже удалила запись биржи из-за критической ошибки или отключения.
-                                 if exchange_id in self.current_market_data:
-                                     # Сохраняем нормализованный OB под локом
-                                     self.current_market_data[exchange_id][ob_data_key] = normalized_ob_pydantic
-                                     logger.debug(f"WS OB: Обновление для {symbol}@{exchange_id.upper()}.")
+                             with self.loop_monitor.stage('normalize'):
+                                 if increments is not None:
+                                     # Целочисленное представление: цены в шагах цены, объемы в лотах рынка
+                                     normalized_ob_pydantic = to_fixed_point_order_book(exchange_id, symbol, order_book_data, *increments)
+                                 else:
+                                     normalized_ob_pydantic = normalize_ccxt_order_book(exchange_id, symbol, order_book_data)
+
+                                 if MODEL_VALIDATION_SAMPLE_RATE and update_count % MODEL_VALIDATION_SAMPLE_RATE == 0:
+                                     # Вызывает ValidationError для некорректных данных - обновление будет пропущено ниже
+                                     (normalized_ob_pydantic.to_normalized() if increments is not None else normalized_ob_pydantic).to_model()
+                                 update_count += 1
+
+                                 # Публикуем новую версию книги в market_store (copy-on-write, без лока).
+                                 # Хранилище отбрасывает запись, если родительская задача (_watch_exchange)
+                                 # уже закрыла биржу из-за критической ошибки или отключения.
+                                 if self._publish_order_book(exchange_idx, symbol_idx, normalized_ob_pydantic, int(received_ms)):
+                                     self.latency.record_book(exchange_id, symbol, normalized_ob_pydantic.timestamp, received_ms)
+                                     logger.debug("WS OB: Обновление для %s@%s.", symbol, exchange_id)
                                  # else:
-                                     # logger.debug(f"WS OB: Биржа {exchange_id.upper()} отсутствует в current_market_data. Пропускаем обновление для {symbol}.")
+                                     # logger.debug(f"WS OB: Биржа {exchange_id.upper()} закрыта в market_store. Пропускаем обновление для {symbol}.")
 
 
                          except Exception as validation_error:
-                             # Ошибка при создании Pydantic модели или при работе с _data_lock
-                             logger.warning(f"WS OB: Ошибка валидации/создания модели или записи для {symbol}@{exchange_id.upper()}: {validation_error}. Данные: {order_book_data}. Пропускаем обновление.")
+                             # Ошибка при нормализации, выборочной валидации или записи в хранилище
+                             # Саму книгу в лог не выводим: сотни уровней на каждую ошибку
+                             logger.warning("WS OB: Ошибка валидации/создания модели или записи для %s@%s: %s. Пропускаем обновление.",
+                                            symbol, exchange_id.upper(), validation_error)
                              # Продолжаем цикл async for, чтобы получить следующее обновление
 
                      else:
-                         logger.warning(f"WS OB: Получены некорректные данные (не dict с bids/asks) для {symbol}@{exchange_id.upper()}. Пропускаем обновление: {order_book_data}.")
+                         logger.warning("WS OB: Получены некорректные данные (не dict с bids/asks, тип %s) для %s@%s. Пропускаем обновление.",
+                                        type(order_book_data).__name__, symbol, exchange_id.upper())
                          # Продолжаем цикл async for
 
                 # else:
@@ -708,16 +1252,14 @@ class MarketDataService:
                  logger.info(f"WS: Задача _watch_order_book для {symbol}@{exchange_id.upper()} отменена.")
                  break # Выходим из async for и внешнего while loop
 
-            except BadSymbol:
+            except ccxt_errors.BadSymbol:
                  # Эта ошибка возникает, если запрошенная пара не поддерживается биржей для watchOrderBook подписки.
                  # Считаем это постоянной ошибкой для этой пары на этой бирже.
                  logger.warning(f"WS: Пара {symbol} не поддерживается биржей {exchange_id.upper()} для watchOrderBook. Отписка от этой пары.")
-                 # Удаляем любые существующие данные для этой пары под локом при отписке
-                 async with self._data_lock:
-                      if exchange_id in self.current_market_data:
-                          if ob_data_key in self.current_market_data[exchange_id]:
-                              del self.current_market_data[exchange_id][ob_data_key]
-                              logger.debug(f"Данные для {symbol}@{exchange_id.upper()} очищены после BadSymbol.")
+                 # Удаляем любые существующие данные для этой пары при отписке
+                 self.market_store.remove_pair(exchange_id, symbol, ticker=False)
+                 self._freshness.discard(exchange_id, symbol)
+                 logger.debug(f"Данные для {symbol}@{exchange_id.upper()} очищены после BadSymbol.")
                          # TODO: Опционально: Если для этой биржи больше нет данных по другим парам/тикеру после удаления этой пары,
                          # можно пометить биржу как не имеющую активных подписок или даже удалить ее запись целиком.
                          # Но безопаснее оставить это на ответственность родительской задачи _watch_exchange,
@@ -744,15 +1286,96 @@ class MarketDataService:
         logger.info(f"WS: Задача _watch_order_book для {symbol}@{exchange_id.upper()} завершена.")
 
 
+    async def _watch_binance_depth_for_pair(self, exchange, symbol: str):
+        """
+        Аналог _watch_order_book_for_pair на собственном diff-depth обработчике Binance (BinanceDepthFeed).
+        Книга публикуется в market_store напрямую из обработчика. Контракт с _watch_exchange тот же:
+        BadSymbol отписывает пару, остальные необработанные ошибки пробрасываются для переподключения биржи.
+        """
+        exchange_id = exchange.id
+        exchange_idx = self.market_store.exchange_index(exchange_id)
+        symbol_idx = self.market_store.symbol_index(symbol)
+        logger.debug(f"WS: Подписка на diff-depth для {symbol}@{exchange_id.upper()}...")
+
+        increments = None
+        if USE_FIXED_POINT_ORDER_BOOKS:
+            increments = market_increments(exchange.markets.get(symbol, {}), exchange.precisionMode)
+            if increments is None:
+                logger.warning(f"WS OB: Для {symbol}@{exchange_id.upper()} нет фиксированного шага цены/лота. Используем float книгу.")
+
+        update_count = 0
+
+        def publish(bids, asks, timestamp):
+            nonlocal update_count
+            # Обработчик вызывается сразу после разбора сообщения биржи: это и есть время получения
+            received_ms = time.time() * 1000
+            try:
+                with self.loop_monitor.stage('normalize'):
+                    if increments is not None:
+                        book = to_fixed_point_order_book(exchange_id, symbol, {'bids': bids, 'asks': asks, 'timestamp': timestamp}, *increments)
+                    else:
+                        # Уровни уже в виде новых списков кортежей от обработчика, повторное копирование не нужно
+                        book = OrderBookRecord(exchange=exchange_id, symbol=symbol, bids=bids, asks=asks, timestamp=timestamp)
+                    if MODEL_VALIDATION_SAMPLE_RATE and update_count % MODEL_VALIDATION_SAMPLE_RATE == 0:
+                        (book.to_normalized() if increments is not None else book).to_model()
+                    update_count += 1
+                    if self._publish_order_book(exchange_idx, symbol_idx, book, int(received_ms)):
+                        self.latency.record_book(exchange_id, symbol, timestamp, received_ms)
+            except Exception as validation_error:
+                logger.warning(f"WS OB: Ошибка валидации/создания модели или записи для {symbol}@{exchange_id.upper()}: {validation_error}. Пропускаем обновление.")
+
+        feed = BinanceDepthFeed(exchange, symbol, WS_ORDER_BOOK_DEPTH, publish)
+        try:
+            await feed.run()
+        except asyncio.CancelledError:
+            logger.info(f"WS: Задача diff-depth для {symbol}@{exchange_id.upper()} отменена "
+                        f"(событий: {feed.events_applied}, пересинхронизаций: {feed.resync_count}).")
+        except ccxt_errors.BadSymbol:
+            logger.warning(f"WS: Пара {symbol} не поддерживается биржей {exchange_id.upper()} для diff-depth. Отписка от этой пары.")
+            self.market_store.remove_pair(exchange_id, symbol, ticker=False)
+            self._freshness.discard(exchange_id, symbol)
+
+
+    def _publish_order_book(self, exchange_idx: int, symbol_idx: int, book, received_at_ms: int | None = None) -> bool:
+        """
+        Публикует книгу в market_store, отмечает ее свежесть и передает в запись потока.
+        Возвращает False, если биржа закрыта в хранилище (обновление отброшено).
+        """
+        if not self.market_store.set_order_book(exchange_idx, symbol_idx, book):
+            return False
+        self._freshness.touch(book.exchange, book.symbol, book.timestamp, received_at_ms)
+        self.spread_stats.update_book(book, received_at_ms / 1000 if received_at_ms is not None else None)
+        self._m_book_updates.inc((book.exchange, book.symbol))
+        if self._recorder is not None:
+            self._recorder.record_order_book(book, received_at_ms)
+        return True
+
+    def _publish_ticker(self, exchange_idx: int, symbol_idx: int, ticker: TickerRecord, received_at_ms: int | None = None) -> bool:
+        """Публикует тикер в market_store и передает в запись потока."""
+        if not self.market_store.set_ticker(exchange_idx, symbol_idx, ticker):
+            return False
+        if self._recorder is not None:
+            self._recorder.record_ticker(ticker, received_at_ms)
+        self.lead_lag.update_ticker(ticker, received_at_ms)
+        self._m_ticker_updates.inc((ticker.exchange, ticker.symbol))
+        if self._record_ticker_history:
+            self.ticker_history.append(ticker, received_at_ms or int(time.time() * 1000))
+        return True
+
     async def _watch_ticker_for_pair(self, exchange, symbol: str):
         """
         Подписывается на обновления тикера для конкретной пары на бирже через WebSocket.
-        Получает данные, нормализует, сохраняет в self.current_market_data под локом.
+        Получает данные, нормализует, сохраняет в self.market_store под локом.
         """
         exchange_id = exchange.id
-        ticker_data_key = symbol # Ключ для хранения в current_market_data (например, 'BTC/USDT')
+        # Индексы биржи и пары в market_store (интернируются один раз на подписку)
+        exchange_idx = self.market_store.exchange_index(exchange_id)
+        symbol_idx = self.market_store.symbol_index(symbol)
         logger.debug(f"WS: Подписка на Ticker для {symbol}@{exchange_id.upper()}...")
 
+        # Счетчик обновлений для выборочной валидации (1 из MODEL_VALIDATION_SAMPLE_RATE)
+        update_count = 0
+
         # Внешний цикл while self._running: для обработки отмены задачи сервиса
         # Внутренний async for от ccxt.pro сам обрабатывает большинство ошибок подписки и переподключения
         while self._running:
@@ -760,54 +1383,38 @@ class MarketDataService:
                  # watch_ticker возвращает асинхронный генератор, который выдает обновления тикера.
                  # ccxt.pro заботится о поддержании соединения и переподключениях.
                  ticker_data = await exchange.watch_ticker(symbol)
+                 received_ms = int(time.time() * 1000)
 
                  if ticker_data:
-                     # Проверяем, что основные числовые поля присутствуют и имеют правильный тип (или None)
-                     # Используем .get() для безопасного доступа к ключам
-                     bid = ticker_data.get('bid')
-                     ask = ticker_data.get('ask')
-                     last = ticker_data.get('last')
-
-                     # Проверяем, что bid, ask, last, если они есть, являются числами или None.
-                     # Это базовая валидация перед созданием модели.
-                     if (bid is None or isinstance(bid, (int, float))) and \
-                        (ask is None or isinstance(ask, (int, float))) and \
-                        (last is None or isinstance(last, (int, float))):
+                     # Нормализуем тикер во внутреннюю запись. Базовая проверка типов bid/ask/last
+                     # выполняется в normalize_ccxt_ticker (None, если поля некорректны).
+                     normalized_ticker = normalize_ccxt_ticker(exchange_id, symbol, ticker_data)
+
+                     if normalized_ticker is not None:
 
                         try:
-                            # Создаем экземпляр NormalizedTicker Pydantic модели
-                            normalized_ticker = NormalizedTicker(
-                                exchange=exchange_id,
-                                symbol=ticker_data.get('symbol', symbol), # Используем символ из данных, если есть
-                                bid=bid,
-                                ask=ask,
-                                last=last,
-                                timestamp=ticker_data.get('timestamp'), # timestamp в ms (опционально)
-                                datetime=ticker_data.get('datetime'), # дата/время ISO8601 строки (опционально)
-                                # Добавьте другие поля тикера, если нужны в модели
-                            )
-
-                            # Получение блокировки для безопасной записи
-                            async with self._data_lock:
-                                # Проверяем, что запись для этой биржи все еще существует в общем хранилище.
-                                # Это предотвращает ошибки записи, если родительская задача (_watch_exchange)
-                                # уже удалила запись биржи из-за критической ошибки или отключения.
-                                if exchange_id in self.current_market_data:
-                                    # Сохраняем нормализованный тикер в словарь для этой биржи под ключом символа
-                                    # Например: self.current_market_data['binance']['BTC/USDT'] = NormalizedTicker(...)
-                                    self.current_market_data[exchange_id][ticker_data_key] = normalized_ticker
-                                    logger.debug(f"WS Ticker: Обновление для {symbol}@{exchange_id.upper()}.")
-                                # else:
-                                     # logger.debug(f"WS Ticker: Биржа {exchange_id.upper()} отсутствует в current_market_data. Пропускаем обновление для {symbol}.")
+                            if MODEL_VALIDATION_SAMPLE_RATE and update_count % MODEL_VALIDATION_SAMPLE_RATE == 0:
+                                normalized_ticker.to_model() # Выборочная полная валидация Pydantic моделью
+                            update_count += 1
+
+                            # Публикуем новую версию тикера в market_store (copy-on-write, без лока).
+                            # Хранилище отбрасывает запись, если родительская задача (_watch_exchange)
+                            # уже закрыла биржу из-за критической ошибки или отключения.
+                            if self._publish_ticker(exchange_idx, symbol_idx, normalized_ticker, received_ms):
+                                logger.debug("WS Ticker: Обновление для %s@%s.", symbol, exchange_id)
+                            # else:
+                                 # logger.debug(f"WS Ticker: Биржа {exchange_id.upper()} закрыта в market_store. Пропускаем обновление для {symbol}.")
 
 
                         except Exception as validation_error:
-                            # Ошибка при создании Pydantic модели или при работе с _data_lock
-                            logger.warning(f"WS Ticker: Ошибка валидации/создания модели или записи для {symbol}@{exchange_id.upper()}: {validation_error}. Данные: {ticker_data}. Пропускаем обновление.")
+                            # Ошибка при выборочной валидации или записи в хранилище
+                            logger.warning("WS Ticker: Ошибка валидации/создания модели или записи для %s@%s: %s. Данные: %s. Пропускаем обновление.",
+                                           symbol, exchange_id.upper(), validation_error, ticker_data)
                             # Продолжаем цикл async for
 
                      else:
-                          logger.warning(f"WS Ticker: Получены некорректные числовые поля для {symbol}@{exchange_id.upper()}. Данные: {ticker_data}. Пропускаем обновление.")
+                          logger.warning("WS Ticker: Получены некорректные числовые поля для %s@%s. Данные: %s. Пропускаем обновление.",
+                                         symbol, exchange_id.upper(), ticker_data)
                           # Продолжаем цикл async for
 
                 # else:
@@ -819,16 +1426,13 @@ class MarketDataService:
                   logger.info(f"WS: Задача _watch_ticker для {symbol}@{exchange_id.upper()} отменена.")
                   break # Выходим из async for и внешнего while loop
 
-             except BadSymbol:
+             except ccxt_errors.BadSymbol:
                  # Эта ошибка возникает, если запрошенная пара не поддерживается биржей для watchTicker подписки.
                  # Считаем это постоянной ошибкой для этой пары на этой бирже.
                  logger.warning(f"WS: Пара {symbol} не поддерживается биржей {exchange_id.upper()} для watchTicker. Отписка от этой пары.")
-                 # Удаляем любые существующие данные для этой пары под локом при отписке
-                 async with self._data_lock:
-                     if exchange_id in self.current_market_data:
-                         if ticker_data_key in self.current_market_data[exchange_id]:
-                             del self.current_market_data[exchange_id][ticker_data_key]
-                             logger.debug(f"Данные для {symbol}@{exchange_id.upper()} очищены после BadSymbol.")
+                 # Удаляем любые существующие данные для этой пары при отписке
+                 self.market_store.remove_pair(exchange_id, symbol, order_book=False)
+                 logger.debug(f"Данные для {symbol}@{exchange_id.upper()} очищены после BadSymbol.")
                          # TODO: Опционально: Если для этой биржи больше нет данных по другим парам/ОБ после удаления этой пары,
                          # можно пометить биржу как не имеющую активных подписок или даже удалить ее запись целиком.
                          # Но безопаснее оставить это на ответственность родительской задачи _watch_exchange,
@@ -849,6 +1453,30 @@ class MarketDataService:
         logger.info(f"WS: Задача _watch_ticker для {symbol}@{exchange_id.upper()} завершена.")
 
 
+    def _collect_scan_input(self, now_ms: int | None = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, int]]]:
+        """
+        Готовит данные для сканера: исключает устаревшие книги (на момент now_ms, по умолчанию - сейчас)
+        и возвращает книги подключенных бирж по парам вместе с их timestamps для проверки расхождения.
+        """
+        # Сканер работает только с книгами ордеров.
+        # Учитываем только биржи со статусом, при котором мы ожидаем данные (подключена или в процессе подключения)
+        active_exchanges = [
+            exchange_id for exchange_id, status in self._exchange_status.items()
+            if status in ['connected', 'connecting']
+        ]
+        # Удаляем книги, которые не обновлялись дольше MAX_BOOK_AGE_SECONDS
+        expired_books = self._freshness.expire(now_ms)
+        for exchange_id, symbol in expired_books:
+            self.market_store.remove_pair(exchange_id, symbol, ticker=False)
+        if expired_books:
+            logger.warning(f"Сканер: исключены книги без обновлений дольше {self._freshness.max_age_seconds}с: "
+                           f"{[f'{symbol}@{exchange_id.upper()}' for exchange_id, symbol in expired_books]}")
+
+        market_snapshot = self.market_store.snapshot()
+        # Книги уже сгруппированы по парам: { symbol: { exchange_id: book } }
+        orderbooks_by_symbol = market_snapshot.books_by_symbol(active_exchanges)
+        return orderbooks_by_symbol, self._freshness.timestamps_by_symbol(orderbooks_by_symbol)
+
     async def _run_arbitrage_scanner(self):
         """
         Периодически запускает поиск арбитража на основе актуальных данных в памяти.
@@ -860,64 +1488,27 @@ class MarketDataService:
 
         # Счетчик пропусков сканирования из-за недостатка данных
         skip_count = 0
+        # Время последней записи top-of-book снапшотов в БД
+        last_book_sample_time = 0.0
 
         while self._running: # Цикл работы сканера, завершается при остановке сервиса
             start_time = time.time() # Время начала итерации сканера
 
             try:
-                # --- Получаем копию данных ОБ под защитой блокировки для безопасного чтения ---
-                # Сканер работает только с книгами ордеров.
-                async with self._data_lock:
-                     # Создаем словарь только с ОБ данными для сканера
-                     market_data_for_scanner: Dict[str, Dict[str, NormalizedOrderBook]] = {}
-                     # Итерируем по биржам в общем хранилище данных
-                     # logger.debug(f"Scanner: current_market_data keys: {list(self.current_market_data.keys())}") # Отладка
-                     for exchange_id, data_by_symbol in self.current_market_data.items():
-                         # Проверяем, что биржа имеет статус, при котором мы ожидаем данные (подключена или в процессе подключения)
-                         status = self._exchange_status.get(exchange_id, 'disconnected')
-                         if status not in ['connected', 'connecting']:
-                              # Пропускаем биржи, которые не подключены или в ошибке.
-                              # logger.debug(f"Scanner: Skipping {exchange_id} due to status: {status}") # Отладка
-                              continue
-
-                         if isinstance(data_by_symbol, dict):
-                             ob_data_for_exchange: Dict[str, NormalizedOrderBook] = {}
-                             # Итерируем по элементам для символа в данных биржи
-                             for symbol_key, data_item in data_by_symbol.items():
-                                 # Если ключ заканчивается на '_ob' И данные являются NormalizedOrderBook
-                                 if isinstance(symbol_key, str) and symbol_key.endswith('_ob') and isinstance(data_item, NormalizedOrderBook):
-                                     ob_data_for_exchange[symbol_key] = data_item
-                             # Добавляем биржу в снапшот для сканера, только если у нее есть хотя бы одна ОБ
-                             if ob_data_for_exchange:
-                                 market_data_for_scanner[exchange_id] = ob_data_for_exchange
+                # --- Берем версионный снапшот хранилища (O(1), без лока) ---
+                orderbooks_by_symbol, book_timestamps = self._collect_scan_input()
 
                 # ----------------------------------------------------
 
-                # Проверяем, достаточно ли данных для сканирования (минимум 2 биржи, у каждой есть OB хотя бы для одной пары)
-                # Улучшенная проверка: нужно минимум 2 биржи, и на этих 2+ биржах должна быть хотя бы ОДНА ОБЩАЯ пара
-                # с доступными ОБ.
-                has_enough_data = False
-                if len(market_data_for_scanner) >= 2:
-                     # Собираем все пары (убираем '_ob' суффикс), по которым есть ОБ на всех подключенных биржах в снапшоте
-                     all_ob_symbols: Dict[str, Set[str]] = {} # Словарь: {symbol: {exchange1_id, exchange2_id, ...}}
-                     for exchange_id, ob_data_by_symbol in market_data_for_scanner.items():
-                          for symbol_key in ob_data_by_symbol.keys():
-                              symbol = symbol_key[:-3] # Удаляем '_ob' суффикс
-                              if symbol not in all_ob_symbols:
-                                  all_ob_symbols[symbol] = set()
-                              all_ob_symbols[symbol].add(exchange_id)
-
-                     # Проверяем, есть ли хоть одна пара, которая есть на >= 2 биржах с ОБ
-                     for symbol, exchanges_set in all_ob_symbols.items():
-                          if len(exchanges_set) >= 2:
-                              has_enough_data = True
-                              # logger.debug(f"Scanner: Found enough data. Pair {symbol} on {exchanges_set}") # Отладка
-                              break # Нашли достаточно данных, выходим из цикла проверок пар
+                # Проверяем, достаточно ли данных для сканирования:
+                # хотя бы одна пара должна иметь ОБ на >= 2 подключенных биржах.
+                has_enough_data = any(len(books_by_exchange) >= 2 for books_by_exchange in orderbooks_by_symbol.values())
 
                 if not has_enough_data:
                      # Если данных недостаточно, пропускаем текущий цикл сканирования.
                      # logger.debug("Недостаточно данных для сканирования арбитража (менее 2 подключенных бирж с OB для общей пары).")
                      skip_count += 1
+                     self._m_scans_skipped.inc()
                      # Логируем предупреждение реже, чтобы не загромождать логи
                      if skip_count % 10 == 0: # Логируем каждое 10-е предупреждение
                          logger.info(f"Сканер пропущен {skip_count} раз из-за недостатка данных (менее 2 подключенных бирж с OB для общей пары).")
@@ -945,45 +1536,51 @@ class MarketDataService:
                 # Эта функция принимает только данные ОБ, порог прибыли и лимиты объема из конфига.
                 # Она возвращает список возможностей, уже отфильтрованных по Net прибыли >= MIN_PROFIT_PCT
                 # и отсортированных по Net прибыли по убыванию.
-                found_opportunities = find_arbitrage_opportunities_with_order_book(
-                    market_data_for_scanner, # Передаем только актуальный снапшот ОБ данных
-                    # MIN_PROFIT_PCT и DESIRED_TRADE_VOLUME_BASE берутся из src/config.py внутри scanner.py
-                )
+                with self.loop_monitor.stage('scan'):
+                    found_opportunities = find_arbitrage_opportunities_with_order_book(
+                        orderbooks_by_symbol, # Передаем только актуальный снапшот ОБ данных
+                        book_timestamps=book_timestamps,
+                        max_skew_ms=MAX_BOOK_SKEW_MS,
+                        # MIN_PROFIT_PCT и DESIRED_TRADE_VOLUME_BASE берутся из src/config.py внутри scanner.py
+                    )
 
                 # --- Обновляем self.latest_opportunities ---
                 # Перезаписываем список последними найденными возможностями.
                 # Этот список уже отфильтрован и отсортирован.
+                self.spread_stats.annotate(found_opportunities)
+                self.latency.annotate(found_opportunities, start_time * 1000, time.time() * 1000)
                 self.latest_opportunities = found_opportunities
+                # В историю и в БД попадают только новые и изменившиеся возможности (проверка изменений - в extend)
+                changed_opportunities = self.opportunity_history.extend(opp for opp in found_opportunities if not opp.stale)
+
+                # --- Передаем результаты в фоновую запись в БД (put_nowait, без ожидания I/O) ---
+                if self._persistence is not None:
+                    self._persistence.submit_opportunities(changed_opportunities)
+                    if start_time - last_book_sample_time >= PERSISTENCE_BOOK_SAMPLE_INTERVAL_SECONDS:
+                        last_book_sample_time = start_time
+                        self._persistence.submit_book_tops(
+                            book for books_by_exchange in orderbooks_by_symbol.values()
+                            for book in books_by_exchange.values() if not book.stale
+                        )
 
                 # --- Логирование результатов сканирования ---
                 end_time = time.time()
                 scan_duration = end_time - start_time
-                logger.info(f"\n--- Сканер (Net прибыль >= {MIN_PROFIT_PCT}%): Найдено {len(self.latest_opportunities)} возможностей (Время сканирования: {scan_duration:.4f} сек) ---")
-                logger.info(f"market_data_for_scanner snapshot: {list(market_data_for_scanner.keys())}")
-                if self.latest_opportunities:
-                    # Логируем первые несколько найденных возможностей с Net прибылью
-                    # Используем f-строки для форматирования вывода
-                    for i, opp in enumerate(self.latest_opportunities[:10]): # Логируем до 10 первых возможностей
-                         # Форматируем вывод для читаемости
-                         net_profit_display = f"{opp.net_profit_pct:.4f}%" if isinstance(opp.net_profit_pct, (int, float)) else 'N/A'
-                         net_quote_display = f"{opp.net_profit_quote:.2f} Quote" if isinstance(opp.net_profit_quote, (int, float)) else 'N/A'
-                         gross_profit_display = f"{opp.potential_profit_pct:.4f}%" if isinstance(opp.potential_profit_pct, (int, float)) else 'N/A'
-                         volume_display = f"{opp.executable_volume_base:.8f}" if isinstance(opp.executable_volume_base, (int, float)) else 'N/A'
-                         fees_display = f"{opp.fees_paid_quote:.4f} Quote" if isinstance(opp.fees_paid_quote, (int, float)) else 'N/A'
-                         buy_ex_display = opp.buy_exchange.upper() if opp.buy_exchange else 'N/A'
-                         sell_ex_display = opp.sell_exchange.upper() if opp.sell_exchange else 'N/A'
-                         symbol_display = opp.symbol if opp.symbol else 'N/A'
-
-                         logger.info(f"  {i+1}. {symbol_display:<10} BUY {buy_ex_display:<10} SELL {sell_ex_display:<10} "
-                                     f"Net: {net_profit_display} ({net_quote_display}) "
-                                     f"Gross: {gross_profit_display} "
-                                     f"Vol: {volume_display} "
-                                     f"Fees: {fees_display}"
-                                     f" ID: {opp.id}" # ID возможности для отладки
-                                    )
-                    logger.info("-----------------------------------------------------------------------------------------")
-                # else:
-                #      logger.info("--- Сканер не нашел возможностей с Net прибылью выше порога ---")
+                self._m_scan_duration.observe(scan_duration)
+                # Итог прохода - одна структурная запись; поля форматируются в фоновом потоке логирования.
+                # Подробности (пары снапшота, первые возможности) - только на уровне DEBUG: при выключенном
+                # уровне ничего не форматируется и не создается.
+                log_fields(logger, logging.INFO, "Сканер: проход завершен", found=len(found_opportunities),
+                           min_profit_pct=MIN_PROFIT_PCT, duration_ms=scan_duration * 1000, symbols=len(orderbooks_by_symbol))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("orderbooks_by_symbol snapshot: %s", {symbol: list(books) for symbol, books in orderbooks_by_symbol.items()})
+                    for i, opp in enumerate(found_opportunities[:10], 1):
+                        logger.debug("  %d. %-10s BUY %-10s SELL %-10s Net: %.4f%% (%.2f Quote) Gross: %.4f%% Vol: %.8f Fees: %.4f Quote ID: %s",
+                                     i, opp.symbol, opp.buy_exchange.upper(), opp.sell_exchange.upper(), opp.net_profit_pct,
+                                     opp.net_profit_quote, opp.potential_profit_pct, opp.executable_volume_base, opp.fees_paid_quote, opp.id)
+                # Первый проход с данными завершает холодный старт: выводим хронологию запуска (см. startup.py)
+                if timeline.event('first_scan'):
+                    timeline.log_summary("Холодный старт завершен")
 
 
                 # --- Уведомляем WS подписчиков ---
@@ -1020,17 +1617,63 @@ class MarketDataService:
         logger.info("Задача _run_arbitrage_scanner завершена.")
 
 
+    # --- Воспроизведение записанного потока (см. feed_replay.py) ---
+
+    def replay_order_book(self, book: OrderBookRecord, received_at_ms: int) -> bool:
+        """
+        Публикует книгу из записи потока так же, как это делает WS подписка.
+        Биржа открывается и помечается 'connected' при первом обновлении.
+        """
+        exchange_idx = self._open_replay_exchange(book.exchange)
+        return self._publish_order_book(exchange_idx, self.market_store.symbol_index(book.symbol), book, received_at_ms)
+
+    def replay_ticker(self, ticker: TickerRecord, received_at_ms: int) -> bool:
+        """Публикует тикер из записи потока (см. replay_order_book)."""
+        exchange_idx = self._open_replay_exchange(ticker.exchange)
+        return self._publish_ticker(exchange_idx, self.market_store.symbol_index(ticker.symbol), ticker, received_at_ms)
+
+    def scan_once(self, now_ms: int | None = None) -> List[OpportunityRecord]:
+        """
+        Один синхронный проход сканера по текущему состоянию (устаревание книг считается на момент now_ms).
+        Обновляет latest_opportunities. Используется воспроизведением для детерминированных прогонов:
+        сканирование привязано ко времени записи, а не к часам процесса.
+        """
+        orderbooks_by_symbol, book_timestamps = self._collect_scan_input(now_ms)
+        self.latest_opportunities = find_arbitrage_opportunities_with_order_book(
+            orderbooks_by_symbol, book_timestamps=book_timestamps, max_skew_ms=MAX_BOOK_SKEW_MS,
+        )
+        self.spread_stats.annotate(self.latest_opportunities)
+        self.opportunity_history.extend(opp for opp in self.latest_opportunities if not opp.stale)
+        return self.latest_opportunities
+
+    def _open_replay_exchange(self, exchange_id: str) -> int:
+        exchange_idx = self.market_store.open_exchange(exchange_id)
+        if self._exchange_status.get(exchange_id) != 'connected':
+            self._set_exchange_status(exchange_id, 'connected')
+        return exchange_idx
+
     # --- Метод для получения статуса бирж (для фронтенда) ---
     async def get_exchange_statuses(self) -> Dict[str, str]:
         """
         Возвращает словарь с текущими статусами подключения бирж.
-        Использует _data_lock для безопасного доступа к _exchange_status.
+        _exchange_status публикуется copy-on-write, поэтому лок не нужен.
         Этот метод асинхронный и вызывается из асинхронного REST эндпоинта.
         """
-        # Захватываем блокировку для безопасного доступа к _exchange_status
-        async with self._data_lock:
-             # Возвращаем копию словаря статусов, чтобы внешний код не мог его модифицировать напрямую.
-             return self._exchange_status.copy()
+        # Возвращаем копию словаря статусов, чтобы внешний код не мог его модифицировать напрямую.
+        return dict(self._exchange_status)
+
+    def _set_exchange_status(self, exchange_id: str, status: str | None):
+        """
+        Публикует новую версию словаря статусов (copy-on-write): опубликованный словарь
+        никогда не изменяется, поэтому читатели используют его без лока.
+        status=None удаляет биржу из статусов.
+        """
+        statuses = dict(self._exchange_status)
+        if status is None:
+            statuses.pop(exchange_id, None)
+        else:
+            statuses[exchange_id] = status
+        self._exchange_status = statuses
 
 # --- Конец класса MarketDataService ---
 
@@ -0,0 +1,269 @@
+from typing import Dict, List, NamedTuple, Optional, Iterable, Iterator, Tuple, Union
+
+from src.data_models import TickerRecord, OrderBookRecord
+from src.fixed_point import FixedPointOrderBook
+
+# Книга ордеров в хранилище: float запись или fixed-point представление
+OrderBook = Union[OrderBookRecord, FixedPointOrderBook]
+
+
+class SymbolRegistry:
+    """
+    Интернирует строковые идентификаторы (ID бирж или символы пар) в плотные целые индексы.
+    Индексы выдаются по порядку с 0 и никогда не переиспользуются, поэтому подходят
+    для индексации списков-таблиц.
+    """
+
+    def __init__(self):
+        self._index_by_name: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        """Возвращает индекс строки, регистрируя ее при первом обращении."""
+        index = self._index_by_name.get(name)
+        if index is None:
+            index = len(self._names)
+            self._index_by_name[name] = index
+            self._names.append(name)
+        return index
+
+    def get(self, name: str) -> Optional[int]:
+        """Возвращает индекс строки или None, если она не зарегистрирована."""
+        return self._index_by_name.get(name)
+
+    def name(self, index: int) -> str:
+        return self._names[index]
+
+    @property
+    def names(self) -> List[str]:
+        """Список имен по индексам (не модифицировать)."""
+        return self._names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class MarketSnapshot(NamedTuple):
+    """
+    Неизменяемая версия состояния хранилища.
+
+    Все таблицы - кортежи, записи в них после публикации не изменяются, поэтому
+    снапшот можно читать без блокировок и между await, не опасаясь частичных обновлений.
+    """
+    version: int
+    exchanges: Tuple[str, ...]                            # [exchange_idx] -> exchange_id
+    symbols: Tuple[str, ...]                              # [symbol_idx] -> symbol
+    books: Tuple[Tuple[Optional[OrderBook], ...], ...]    # [symbol_idx][exchange_idx]
+    tickers: Tuple[Tuple[Optional[TickerRecord], ...], ...]  # [exchange_idx][symbol_idx]
+    open: Tuple[bool, ...]                                # [exchange_idx]
+
+    def books_by_symbol(self, exchange_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, OrderBook]]:
+        """
+        Группировка книг для сканера: { symbol: { exchange_id: book } }.
+        exchange_ids ограничивает набор бирж (например, только подключенные).
+        В результат попадают только пары, у которых есть хотя бы одна книга.
+        """
+        exchange_names = self.exchanges
+        allowed = self._exchange_mask(exchange_ids)
+        grouped: Dict[str, Dict[str, OrderBook]] = {}
+        for symbol_idx, row in enumerate(self.books):
+            books = {exchange_names[exchange_idx]: book for exchange_idx, book in enumerate(row)
+                     if book is not None and allowed[exchange_idx]}
+            if books:
+                grouped[self.symbols[symbol_idx]] = books
+        return grouped
+
+    def tickers_by_exchange(self, exchange_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, TickerRecord]]:
+        """Группировка тикеров: { exchange_id: { symbol: ticker } } для открытых бирж из exchange_ids."""
+        symbol_names = self.symbols
+        allowed = self._exchange_mask(exchange_ids)
+        return {
+            self.exchanges[exchange_idx]: {symbol_names[symbol_idx]: ticker for symbol_idx, ticker in enumerate(row) if ticker is not None}
+            for exchange_idx, row in enumerate(self.tickers)
+            if allowed[exchange_idx] and self.open[exchange_idx]
+        }
+
+    def iter_order_books(self) -> Iterator[OrderBook]:
+        """Все книги ордеров снапшота."""
+        for row in self.books:
+            for book in row:
+                if book is not None:
+                    yield book
+
+    def _exchange_mask(self, exchange_ids: Optional[Iterable[str]]) -> List[bool]:
+        if exchange_ids is None:
+            return [True] * len(self.exchanges)
+        wanted = set(exchange_ids)
+        return [exchange_id in wanted for exchange_id in self.exchanges]
+
+
+_EMPTY_SNAPSHOT = MarketSnapshot(version=0, exchanges=(), symbols=(), books=(), tickers=(), open=())
+
+
+class MarketStore:
+    """
+    Хранилище последних рыночных данных с целочисленными индексами бирж и пар (copy-on-write).
+
+    Книги ордеров и тикеры лежат в отдельных таблицах:
+      - книги: по строкам пар, books[symbol_idx][exchange_idx] (так их читает сканер);
+      - тикеры: по строкам бирж, tickers[exchange_idx][symbol_idx] (так их отдает /api/v1/tickers).
+    Потребители получают готовую группировку без разбора строковых ключей и проверок типов.
+
+    Каждая запись публикует новый неизменяемый MarketSnapshot с увеличенной версией: копируется
+    только затронутая строка таблицы и кортеж строк (O(число бирж + число пар)), остальные строки
+    разделяются со старой версией. Читатели берут текущий снапшот (snapshot()) за O(1) без блокировок
+    и работают с ним, пока писатели публикуют новые версии. Запись выполняется синхронно (без await),
+    поэтому в пределах одного event loop писатели не требуют блокировки.
+
+    Запись принимается только для "открытых" бирж (open_exchange): это отсекает запоздалые
+    обновления отключенной биржи.
+    """
+
+    def __init__(self):
+        self.exchanges = SymbolRegistry()
+        self.symbols = SymbolRegistry()
+        self._snapshot: MarketSnapshot = _EMPTY_SNAPSHOT
+
+    def snapshot(self) -> MarketSnapshot:
+        """Текущая версия состояния (O(1), без копирования)."""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    # --- Регистрация ---
+
+    def exchange_index(self, exchange_id: str) -> int:
+        """Индекс биржи (регистрирует биржу и расширяет таблицы при необходимости)."""
+        index = self.exchanges.intern(exchange_id)
+        snapshot = self._snapshot
+        added = len(self.exchanges) - len(snapshot.exchanges)
+        if added > 0:
+            self._snapshot = snapshot._replace(
+                version=snapshot.version + 1,
+                exchanges=tuple(self.exchanges.names),
+                books=tuple(row + (None,) * added for row in snapshot.books),
+                tickers=snapshot.tickers + ((None,) * len(snapshot.symbols),) * added,
+                open=snapshot.open + (False,) * added,
+            )
+        return index
+
+    def symbol_index(self, symbol: str) -> int:
+        """Индекс пары (регистрирует пару и расширяет таблицы при необходимости)."""
+        index = self.symbols.intern(symbol)
+        snapshot = self._snapshot
+        added = len(self.symbols) - len(snapshot.symbols)
+        if added > 0:
+            self._snapshot = snapshot._replace(
+                version=snapshot.version + 1,
+                symbols=tuple(self.symbols.names),
+                books=snapshot.books + ((None,) * len(snapshot.exchanges),) * added,
+                tickers=tuple(row + (None,) * added for row in snapshot.tickers),
+            )
+        return index
+
+    # --- Состояние бирж ---
+
+    def open_exchange(self, exchange_id: str) -> int:
+        """Разрешает запись данных биржи. Уже сохраненные данные (например, из warm-start) не трогаются."""
+        index = self.exchange_index(exchange_id)
+        snapshot = self._snapshot
+        if not snapshot.open[index]:
+            self._snapshot = snapshot._replace(
+                version=snapshot.version + 1,
+                open=_replace_at(snapshot.open, index, True),
+            )
+        return index
+
+    def close_exchange(self, exchange_id: str):
+        """Запрещает запись данных биржи и удаляет все ее книги и тикеры."""
+        index = self.exchanges.get(exchange_id)
+        if index is None:
+            return
+        snapshot = self._snapshot
+        self._snapshot = snapshot._replace(
+            version=snapshot.version + 1,
+            books=tuple(_replace_at(row, index, None) if row[index] is not None else row for row in snapshot.books),
+            tickers=_replace_at(snapshot.tickers, index, (None,) * len(snapshot.symbols)),
+            open=_replace_at(snapshot.open, index, False),
+        )
+
+    def is_open(self, exchange_id: str) -> bool:
+        index = self.exchanges.get(exchange_id)
+        return index is not None and self._snapshot.open[index]
+
+    # --- Запись ---
+
+    def set_order_book(self, exchange_idx: int, symbol_idx: int, book: OrderBook) -> bool:
+        """Публикует книгу ордеров. Возвращает False, если биржа закрыта (обновление отброшено)."""
+        snapshot = self._snapshot
+        if not snapshot.open[exchange_idx]:
+            return False
+        books = snapshot.books
+        self._snapshot = snapshot._replace(
+            version=snapshot.version + 1,
+            books=_replace_at(books, symbol_idx, _replace_at(books[symbol_idx], exchange_idx, book)),
+        )
+        return True
+
+    def set_ticker(self, exchange_idx: int, symbol_idx: int, ticker: TickerRecord) -> bool:
+        """Публикует тикер. Возвращает False, если биржа закрыта (обновление отброшено)."""
+        snapshot = self._snapshot
+        if not snapshot.open[exchange_idx]:
+            return False
+        tickers = snapshot.tickers
+        self._snapshot = snapshot._replace(
+            version=snapshot.version + 1,
+            tickers=_replace_at(tickers, exchange_idx, _replace_at(tickers[exchange_idx], symbol_idx, ticker)),
+        )
+        return True
+
+    def remove_pair(self, exchange_id: str, symbol: str, order_book: bool = True, ticker: bool = True):
+        """Удаляет книгу и/или тикер пары на бирже (если они есть)."""
+        exchange_idx = self.exchanges.get(exchange_id)
+        symbol_idx = self.symbols.get(symbol)
+        if exchange_idx is None or symbol_idx is None:
+            return
+        snapshot = self._snapshot
+        books, tickers = snapshot.books, snapshot.tickers
+        if order_book and books[symbol_idx][exchange_idx] is not None:
+            books = _replace_at(books, symbol_idx, _replace_at(books[symbol_idx], exchange_idx, None))
+        if ticker and tickers[exchange_idx][symbol_idx] is not None:
+            tickers = _replace_at(tickers, exchange_idx, _replace_at(tickers[exchange_idx], symbol_idx, None))
+        if books is not snapshot.books or tickers is not snapshot.tickers:
+            self._snapshot = snapshot._replace(version=snapshot.version + 1, books=books, tickers=tickers)
+
+    def clear(self):
+        """Удаляет все данные и закрывает все биржи (индексы сохраняются)."""
+        snapshot = self._snapshot
+        exchanges_count, symbols_count = len(snapshot.exchanges), len(snapshot.symbols)
+        self._snapshot = snapshot._replace(
+            version=snapshot.version + 1,
+            books=((None,) * exchanges_count,) * symbols_count,
+            tickers=((None,) * symbols_count,) * exchanges_count,
+            open=(False,) * exchanges_count,
+        )
+
+    # --- Чтение (по текущему снапшоту) ---
+
+    def get_order_book(self, exchange_id: str, symbol: str) -> Optional[OrderBook]:
+        exchange_idx = self.exchanges.get(exchange_id)
+        symbol_idx = self.symbols.get(symbol)
+        if exchange_idx is None or symbol_idx is None:
+            return None
+        return self._snapshot.books[symbol_idx][exchange_idx]
+
+    def books_by_symbol(self, exchange_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, OrderBook]]:
+        return self._snapshot.books_by_symbol(exchange_ids)
+
+    def tickers_by_exchange(self, exchange_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, TickerRecord]]:
+        return self._snapshot.tickers_by_exchange(exchange_ids)
+
+    def iter_order_books(self) -> Iterator[OrderBook]:
+        return self._snapshot.iter_order_books()
+
+
+def _replace_at(row: tuple, index: int, value) -> tuple:
+    """Копия кортежа с замененным элементом."""
+    return row[:index] + (value,) + row[index + 1:]
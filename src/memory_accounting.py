@@ -0,0 +1,139 @@
+import gc
+import sys
+import time
+import tracemalloc
+import types
+from array import array
+from typing import Any, Dict, Optional
+
+# Типы без ссылок на другие объекты: их размер - только getsizeof
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, bool, complex, type(None), array)
+# Код и типы - общие для всего процесса, к компонентам не относятся
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+# Фреймы tracemalloc и импорта не относятся к компонентам сервиса
+_TRACEMALLOC_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+def deep_sizeof(obj: Any, seen: Optional[Dict[int, Any]] = None) -> int:
+    """
+    Размер объекта вместе со всем, на что он ссылается (контейнеры, __dict__, __slots__), в байтах.
+    Объекты, уже учтенные в seen, повторно не считаются: передавая один seen в несколько вызовов,
+    разделяемые данные (общие строки, уровни книг в соседних версиях снапшота) относятся к первому.
+    Классы, модули и функции не обходятся. seen хранит сами объекты, а не только id: временные
+    объекты (например, __dict__, созданный по запросу) иначе освобождаются, и их id получает другой объект.
+    """
+    if seen is None:
+        seen = {}
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen[id(current)] = current
+        if isinstance(current, _SKIPPED_TYPES):
+            continue
+        size += sys.getsizeof(current)
+        if isinstance(current, _ATOMIC_TYPES):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            instance_dict = getattr(current, '__dict__', None)
+            if instance_dict is not None:
+                stack.append(instance_dict)
+            for cls in type(current).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(current, name):
+                        stack.append(getattr(current, name))
+    return size
+
+
+def process_memory() -> Dict[str, Any]:
+    """RSS и пик RSS процесса в байтах (Linux: /proc/self/status; иначе - только пик из resource)."""
+    result: Dict[str, Any] = {'rss_bytes': None, 'peak_rss_bytes': None}
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    result['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    result['peak_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+            # ru_maxrss: килобайты в Linux, байты в macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result['peak_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            pass
+    result['gc_counts'] = list(gc.get_count())
+    return result
+
+
+class TracemallocSession:
+    """
+    Сравнение снапшотов tracemalloc между двумя моментами времени.
+
+    start() включает tracemalloc (если он не был включен) и запоминает базовый снапшот,
+    diff() снимает новый и возвращает места аллокаций с наибольшим ростом относительно базы;
+    reset=True делает новый снапшот базой для следующего сравнения. Пока tracemalloc включен,
+    аллокации заметно дороже, поэтому stop() выключает его, если его включила эта сессия.
+    """
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_time: Optional[float] = None
+        self._started_tracing = False
+
+    @property
+    def active(self) -> bool:
+        return self._baseline is not None
+
+    def start(self, frames: int = 1) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._started_tracing = True
+        self._baseline = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_IGNORED)
+        self._baseline_time = time.time()
+        return {'tracing': True, 'frames': tracemalloc.get_traceback_limit(), 'baseline_at': int(self._baseline_time * 1000)}
+
+    def diff(self, top: int = 20, group_by: str = 'lineno', reset: bool = False) -> Dict[str, Any]:
+        if self._baseline is None:
+            raise RuntimeError("tracemalloc сессия не запущена (сначала start)")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_IGNORED)
+        now = time.time()
+        stats = snapshot.compare_to(self._baseline, group_by)
+        result = {
+            'baseline_at': int(self._baseline_time * 1000),
+            'snapshot_at': int(now * 1000),
+            'total_size_diff_bytes': sum(stat.size_diff for stat in stats),
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'top': [
+                {
+                    'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    'size_diff_bytes': stat.size_diff,
+                    'size_bytes': stat.size,
+                    'count_diff': stat.count_diff,
+                    'count': stat.count,
+                }
+                for stat in stats[:top]
+            ],
+        }
+        if reset:
+            self._baseline, self._baseline_time = snapshot, now
+        return result
+
+    def stop(self):
+        self._baseline = None
+        self._baseline_time = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
@@ -0,0 +1,188 @@
+import math
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Границы интервалов гистограмм длительностей по умолчанию, секунд
+DEFAULT_DURATION_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Границы для задержек конвейера (от долей миллисекунды до секунд), секунд
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+class _Metric(ABC):
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[Tuple[str, Labels, Tuple[str, ...], float]]:
+        """(суффикс имени, значения меток, дополнительные пары метка=значение, значение)."""
+
+
+class Counter(_Metric):
+    """Монотонный счетчик; inc - одна операция со словарем по кортежу меток."""
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield '_total', labels, (), value
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. Значения задаются через set или вычисляются при выдаче функцией collect,
+    которая возвращает {метки: значение} - так состояние (длины очередей и т.п.) не нужно
+    обновлять на горячем пути.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Labels, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, labels: Labels = ()):
+        self._values[labels] = value
+
+    def samples(self):
+        values = self._collect() if self._collect is not None else self._values
+        for labels, value in values.items():
+            yield '', labels, (), value
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными границами. observe - bisect по границам и инкремент
+    одного интервала (накопительные суммы считаются только при выдаче).
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики интервалов (последний - +Inf), сумма значений]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [array('q', bytes(8 * (len(self.buckets) + 1))), 0.0]
+        # Интервал le включает свою границу: первый с границей >= value
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series is not None else 0
+
+    def quantile(self, q: float, labels: Labels = ()) -> Optional[float]:
+        """
+        Оценка квантиля по интервалам (как histogram_quantile в Prometheus): линейная
+        интерполяция внутри интервала; для интервала +Inf возвращается последняя граница.
+        """
+        series = self._series.get(labels)
+        if series is None:
+            return None
+        counts = series[0]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self):
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '_bucket', labels, ('le', bound), cumulative
+            yield '_sum', labels, (), total
+            yield '_count', labels, (), cumulative
+
+
+class MetricsRegistry:
+    """Набор метрик сервиса и их выдача в текстовом формате Prometheus (version 0.0.4)."""
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              collect: Optional[Callable[[], Dict[Labels, float]]] = None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, extra, value in metric.samples():
+                pairs = [f'{name}="{_escape_label(value_)}"' for name, value_ in zip(metric.labelnames, labels)]
+                if extra:
+                    pairs.append(f'{extra[0]}="{extra[1]}"')
+                label_text = '{' + ','.join(pairs) + '}' if pairs else ''
+                lines.append(f"{metric.name}{suffix}{label_text} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
@@ -0,0 +1,190 @@
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.data_models import OpportunityRecord
+from src.config import OPPORTUNITY_HISTORY_MAX_BYTES, SPREAD_STATS_WINDOWS_SECONDS
+from src.latency import STAGES
+
+# Поля, по которым повторное наблюдение возможности считается изменением (а не повтором)
+_CHANGE_FIELDS = ('executable_volume_base', 'buy_price', 'sell_price', 'net_profit_pct')
+
+
+class _SeqIndex:
+    """
+    Вторичный индекс: возрастающие номера записей кольцевого буфера для одного ключа.
+    Вытесненные из буфера номера отбрасываются с начала сдвигом offset (список уплотняется,
+    когда мертвая часть становится больше живой), поэтому поиск по времени - bisect.
+    """
+    __slots__ = ('seqs', 'offset')
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.offset = 0
+
+    def trim(self, min_seq: int):
+        seqs = self.seqs
+        offset = bisect_left(seqs, min_seq, lo=self.offset)
+        if offset > len(seqs) // 2:
+            del seqs[:offset]
+            offset = 0
+        self.offset = offset
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.offset
+
+
+class OpportunityHistory:
+    """
+    История найденных возможностей в памяти: кольцевой буфер фиксированной емкости,
+    рассчитанной по бюджету памяти max_bytes.
+
+    Записи добавляются в порядке времени, поэтому у буфера и у вторичных индексов
+    (по паре и по направлению buy_exchange -> sell_exchange) номера и timestamps возрастают:
+    запрос "с момента since" - это bisect по индексу и срез хвоста, без линейного прохода.
+
+    Сканер повторяет одну и ту же возможность каждый интервал; повтор с неизменными
+    объемом, ценами и прибылью не записывается, чтобы буфер хранил часы наблюдений, а не секунды.
+    Поэтому extend нужно вызывать с полным результатом каждого прохода (в том числе пустым):
+    возможность, пропавшая и появившаяся снова, записывается заново.
+    """
+
+    def __init__(self, max_bytes: int = OPPORTUNITY_HISTORY_MAX_BYTES):
+        self.capacity = max(1, max_bytes // _estimated_record_bytes())
+        self._records: List[Optional[OpportunityRecord]] = [None] * self.capacity
+        self._timestamps = array('q', bytes(8 * self.capacity))
+        self._next_seq = 0 # Номер следующей записи; в буфере лежат [next_seq - size, next_seq)
+        self._by_symbol: Dict[str, _SeqIndex] = {}
+        self._by_route: Dict[Tuple[str, str], _SeqIndex] = {}
+        self._last_state: Dict[str, tuple] = {} # id -> состояние в последнем проходе сканера
+
+    def __len__(self) -> int:
+        return min(self._next_seq, self.capacity)
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(0, self._next_seq - self.capacity)
+
+    def extend(self, opportunities: Iterable[OpportunityRecord]) -> List[OpportunityRecord]:
+        """
+        Добавляет возможности одного прохода сканера. Возвращает записанные - новые или изменившиеся
+        с прошлого прохода (их же передает в БД сервис, см. PersistenceWriter.submit_opportunities).
+        """
+        added: List[OpportunityRecord] = []
+        previous_state, current_state = self._last_state, {}
+        for opp in opportunities:
+            state = tuple(getattr(opp, name) for name in _CHANGE_FIELDS)
+            current_state[opp.id] = state
+            if previous_state.get(opp.id) == state:
+                continue
+            self._append(opp)
+            added.append(opp)
+        self._last_state = current_state
+        if added:
+            self._trim_indexes()
+        return added
+
+    def _append(self, opp: OpportunityRecord):
+        seq = self._next_seq
+        slot = seq % self.capacity
+        self._records[slot] = opp
+        # Время записи не убывает, даже если timestamp возможности меньше предыдущего
+        previous_ts = self._timestamps[(seq - 1) % self.capacity] if seq else opp.timestamp
+        self._timestamps[slot] = max(opp.timestamp, previous_ts)
+        self._next_seq = seq + 1
+        self._by_symbol.setdefault(opp.symbol, _SeqIndex()).seqs.append(seq)
+        self._by_route.setdefault((opp.buy_exchange, opp.sell_exchange), _SeqIndex()).seqs.append(seq)
+
+    def _trim_indexes(self):
+        if self._next_seq <= self.capacity:
+            return
+        oldest_seq = self.oldest_seq
+        for indexes in (self._by_symbol, self._by_route):
+            emptied = []
+            for key, index in indexes.items():
+                index.trim(oldest_seq)
+                if not len(index):
+                    emptied.append(key)
+            for key in emptied:
+                del indexes[key]
+
+    def query(self, symbol: Optional[str] = None, buy_exchange: Optional[str] = None,
+              sell_exchange: Optional[str] = None, since: Optional[int] = None,
+              limit: int = 100) -> List[OpportunityRecord]:
+        """
+        Возможности с timestamp >= since (мс), новые первыми, не больше limit.
+        Индекс направления используется, если заданы обе биржи; одна биржа проверяется по записям.
+        """
+        if limit <= 0:
+            return []
+        # Выбираем самый узкий индекс; второй фильтр проверяется на записях
+        candidates: List[_SeqIndex] = []
+        if symbol is not None:
+            candidates.append(self._by_symbol.get(symbol) or _SeqIndex())
+        if buy_exchange is not None and sell_exchange is not None:
+            candidates.append(self._by_route.get((buy_exchange, sell_exchange)) or _SeqIndex())
+        index = min(candidates, key=len) if candidates else None
+
+        oldest_seq = self.oldest_seq
+        if index is not None:
+            seqs, lo = index.seqs, index.offset
+            lo = bisect_left(seqs, oldest_seq, lo=lo)
+        else:
+            seqs, lo = range(oldest_seq, self._next_seq), 0
+        if since is not None:
+            lo = bisect_left(seqs, since, lo=lo, key=self._timestamp_of)
+
+        result: List[OpportunityRecord] = []
+        for position in range(len(seqs) - 1, lo - 1, -1):
+            opp = self._records[seqs[position] % self.capacity]
+            if symbol is not None and opp.symbol != symbol:
+                continue
+            if buy_exchange is not None and opp.buy_exchange != buy_exchange:
+                continue
+            if sell_exchange is not None and opp.sell_exchange != sell_exchange:
+                continue
+            result.append(opp)
+            if len(result) >= limit:
+                break
+        return result
+
+    def estimated_bytes(self) -> int:
+        """Оценка памяти буфера: записи по средней оценке плюс слоты буфера и массив timestamps."""
+        return len(self) * _estimated_record_bytes() + sys.getsizeof(self._records) + sys.getsizeof(self._timestamps)
+
+    def _timestamp_of(self, seq: int) -> int:
+        return self._timestamps[seq % self.capacity]
+
+    def clear(self):
+        self._records = [None] * self.capacity
+        self._next_seq = 0
+        self._by_symbol.clear()
+        self._by_route.clear()
+        self._last_state = {}
+
+
+def _estimated_record_bytes() -> int:
+    """
+    Оценка памяти на одну запись: объект, уникальные строка id и числа, словари аннотаций
+    spread_stats (по окну SPREAD_STATS_WINDOWS_SECONDS) и stage_latencies_ms, слоты буфера и индексов.
+    Ключи словарей аннотаций - общие строки, в оценку не входят.
+    """
+    sample = OpportunityRecord(
+        id='BTCUSDT-binance-kraken', symbol='BTC/USDT', buy_exchange='binance', sell_exchange='kraken',
+        executable_volume_base=0.1, buy_price=1.0, sell_price=1.0, potential_profit_pct=0.1,
+        fees_paid_quote=0.1, net_profit_pct=0.1, net_profit_quote=0.1, buy_network=None, sell_network=None,
+        timestamp=0,
+    )
+    float_size = sys.getsizeof(1.0)
+    floats = 7 * float_size
+    slots = 8 * 4 # буфер записей, timestamps, два индекса
+    # spread_stats: { окно: {mean, std, zscore, percentile_rank} } (см. SpreadStats.annotate)
+    window_stats = {'mean': 0.1, 'std': 0.1, 'zscore': 0.1, 'percentile_rank': 0.1}
+    spread_stats = {f"w{i}": None for i in range(len(SPREAD_STATS_WINDOWS_SECONDS))}
+    spread_stats_bytes = sys.getsizeof(spread_stats) + len(spread_stats) * (sys.getsizeof(window_stats) + 4 * float_size)
+    # stage_latencies_ms: { этап: мс } (см. LatencyTracer.annotate)
+    latencies = dict.fromkeys(STAGES, 0.1)
+    latencies_bytes = sys.getsizeof(latencies) + len(latencies) * float_size
+    return (sys.getsizeof(sample) + sys.getsizeof(sample.id) + sys.getsizeof(10 ** 12) + floats + slots
+            + spread_stats_bytes + latencies_bytes)
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+from src.data_models import OpportunityRecord
+from src.fixed_point import FixedPointOrderBook
+from src.config import (
+    PERSISTENCE_BACKEND, PERSISTENCE_SQLITE_PATH, PERSISTENCE_POSTGRES_DSN,
+    PERSISTENCE_QUEUE_MAX_ITEMS, PERSISTENCE_BATCH_SIZE, PERSISTENCE_FLUSH_INTERVAL_SECONDS,
+    PERSISTENCE_DROP_POLICY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Колонки таблиц (порядок совпадает с кортежами строк, которые формирует PersistenceWriter)
+OPPORTUNITY_COLUMNS = (
+    'id', 'symbol', 'buy_exchange', 'sell_exchange', 'executable_volume_base',
+    'buy_price', 'sell_price', 'potential_profit_pct', 'fees_paid_quote',
+    'net_profit_pct', 'net_profit_quote', 'timestamp', 'stale',
+)
+BOOK_TOP_COLUMNS = (
+    'exchange', 'symbol', 'timestamp', 'recorded_at',
+    'best_bid', 'best_bid_volume', 'best_ask', 'best_ask_volume',
+)
+
+OpportunityRow = Tuple[Any, ...]
+BookTopRow = Tuple[Any, ...]
+
+
+class SQLiteBackend:
+    """
+    Запись в SQLite (стандартная библиотека, без внешних зависимостей).
+    sqlite3 блокирующий, поэтому все операции выполняются в потоке (asyncio.to_thread).
+    Вызовы приходят только из одной задачи PersistenceWriter, поэтому одного соединения достаточно.
+    """
+
+    def __init__(self, path: str = PERSISTENCE_SQLITE_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL: читатели (аналитика, бэктесты) не блокируют запись сервиса
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS opportunities (
+                id TEXT, symbol TEXT, buy_exchange TEXT, sell_exchange TEXT,
+                executable_volume_base REAL, buy_price REAL, sell_price REAL,
+                potential_profit_pct REAL, fees_paid_quote REAL,
+                net_profit_pct REAL, net_profit_quote REAL,
+                timestamp INTEGER, stale INTEGER
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS opportunities_symbol_ts ON opportunities (symbol, timestamp)")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS book_tops (
+                exchange TEXT, symbol TEXT, timestamp INTEGER, recorded_at INTEGER,
+                best_bid REAL, best_bid_volume REAL, best_ask REAL, best_ask_volume REAL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS book_tops_symbol_ts ON book_tops (symbol, recorded_at)")
+        self._connection.commit()
+
+    async def write(self, opportunities: List[OpportunityRow], book_tops: List[BookTopRow]):
+        await asyncio.to_thread(self._write, opportunities, book_tops)
+
+    def _write(self, opportunities: List[OpportunityRow], book_tops: List[BookTopRow]):
+        with self._connection: # Одна транзакция на батч
+            if opportunities:
+                self._connection.executemany(
+                    f"INSERT INTO opportunities ({', '.join(OPPORTUNITY_COLUMNS)}) VALUES ({', '.join('?' * len(OPPORTUNITY_COLUMNS))})",
+                    opportunities)
+            if book_tops:
+                self._connection.executemany(
+                    f"INSERT INTO book_tops ({', '.join(BOOK_TOP_COLUMNS)}) VALUES ({', '.join('?' * len(BOOK_TOP_COLUMNS))})",
+                    book_tops)
+
+    async def close(self):
+        if self._connection is not None:
+            await asyncio.to_thread(self._connection.close)
+            self._connection = None
+
+
+class PostgresBackend:
+    """Запись в PostgreSQL через asyncpg: батчи загружаются командой COPY (copy_records_to_table)."""
+
+    def __init__(self, dsn: Optional[str] = PERSISTENCE_POSTGRES_DSN):
+        self.dsn = dsn
+        self._pool = None
+
+    async def open(self):
+        if not self.dsn:
+            raise ValueError("PERSISTENCE_POSTGRES_DSN (DATABASE_URL) не задан для PERSISTENCE_BACKEND='postgres'")
+        import asyncpg # Импорт только при использовании Postgres
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        async with self._pool.acquire() as connection:
+            await connection.execute("""
+                CREATE TABLE IF NOT EXISTS opportunities (
+                    id TEXT, symbol TEXT, buy_exchange TEXT, sell_exchange TEXT,
+                    executable_volume_base DOUBLE PRECISION, buy_price DOUBLE PRECISION, sell_price DOUBLE PRECISION,
+                    potential_profit_pct DOUBLE PRECISION, fees_paid_quote DOUBLE PRECISION,
+                    net_profit_pct DOUBLE PRECISION, net_profit_quote DOUBLE PRECISION,
+                    timestamp BIGINT, stale BOOLEAN
+                );
+                CREATE INDEX IF NOT EXISTS opportunities_symbol_ts ON opportunities (symbol, timestamp);
+                CREATE TABLE IF NOT EXISTS book_tops (
+                    exchange TEXT, symbol TEXT, timestamp BIGINT, recorded_at BIGINT,
+                    best_bid DOUBLE PRECISION, best_bid_volume DOUBLE PRECISION,
+                    best_ask DOUBLE PRECISION, best_ask_volume DOUBLE PRECISION
+                );
+                CREATE INDEX IF NOT EXISTS book_tops_symbol_ts ON book_tops (symbol, recorded_at);
+            """)
+
+    async def write(self, opportunities: List[OpportunityRow], book_tops: List[BookTopRow]):
+        async with self._pool.acquire() as connection:
+            async with connection.transaction():
+                if opportunities:
+                    await connection.copy_records_to_table('opportunities', records=opportunities, columns=OPPORTUNITY_COLUMNS)
+                if book_tops:
+                    await connection.copy_records_to_table('book_tops', records=book_tops, columns=BOOK_TOP_COLUMNS)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def create_backend(name: str = PERSISTENCE_BACKEND):
+    """Создает бэкенд по имени из конфигурации. 'none' - хранение отключено (None)."""
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'postgres':
+        return PostgresBackend()
+    if name == 'none':
+        return None
+    raise ValueError(f"Неизвестный PERSISTENCE_BACKEND: {name}")
+
+
+class PersistenceWriter:
+    """
+    Фоновая запись возможностей и выборочных top-of-book снапшотов.
+
+    submit_* не ждут и не выполняют I/O: строки кладутся в ограниченную очередь (put_nowait),
+    поэтому цикл сканера не получает дополнительной задержки. При переполнении очереди
+    применяется PERSISTENCE_DROP_POLICY: 'drop_oldest' вытесняет самую старую строку,
+    'drop_newest' отбрасывает новую. Отброшенные строки считаются в dropped.
+
+    Фоновая задача собирает строки в батчи до batch_size или до flush_interval_seconds
+    и записывает их одним вызовом бэкенда (executemany для SQLite, COPY для Postgres).
+    """
+
+    def __init__(self, backend,
+                 max_queue_items: int = PERSISTENCE_QUEUE_MAX_ITEMS,
+                 batch_size: int = PERSISTENCE_BATCH_SIZE,
+                 flush_interval_seconds: float = PERSISTENCE_FLUSH_INTERVAL_SECONDS,
+                 drop_policy: str = PERSISTENCE_DROP_POLICY):
+        if drop_policy not in ('drop_oldest', 'drop_newest'):
+            raise ValueError(f"Неизвестная политика переполнения: {drop_policy}")
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.drop_policy = drop_policy
+        # Элементы очереди: ('opportunity' | 'book_top', строка)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_items)
+        self._task: Optional[asyncio.Task] = None
+        # Батч, который сейчас пишется, и строки, собранные фоновой задачей до ее отмены
+        self._inflight_write: Optional[asyncio.Future] = None
+        self._collected: List[Tuple[str, Tuple[Any, ...]]] = []
+        # Счетчики для логов и диагностики
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    async def start(self):
+        await self.backend.open()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Persistence: запись в {type(self.backend).__name__} запущена.")
+
+    async def stop(self, timeout: float = 5.0):
+        """Останавливает фоновую задачу, дописывая накопленные строки (не дольше timeout)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Запись батча защищена от отмены (shield): дожидаемся ее, чтобы не писать из двух потоков
+        if self._inflight_write is not None:
+            await asyncio.gather(self._inflight_write, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._flush_remaining(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Persistence: не успели дописать {self._queue.qsize()} строк при остановке.")
+        await self.backend.close()
+        logger.info(f"Persistence: остановлено. Записано строк: {self.written}, отброшено: {self.dropped}.")
+
+    # --- Прием данных (не блокирует вызывающий код) ---
+
+    def submit_opportunities(self, opportunities: Iterable[OpportunityRecord]):
+        for opp in opportunities:
+            self._put(('opportunity', (
+                opp.id, opp.symbol, opp.buy_exchange, opp.sell_exchange, opp.executable_volume_base,
+                opp.buy_price, opp.sell_price, opp.potential_profit_pct, opp.fees_paid_quote,
+                opp.net_profit_pct, opp.net_profit_quote, opp.timestamp, opp.stale,
+            )))
+
+    def submit_book_tops(self, books: Iterable[Any]):
+        """Сохраняет лучшие уровни книг (OrderBookRecord или FixedPointOrderBook)."""
+        recorded_at = int(time.time() * 1000)
+        for book in books:
+            if isinstance(book, FixedPointOrderBook):
+                # Лучшие уровни напрямую из целочисленных массивов, без float копии всей книги
+                if not book.bid_prices or not book.ask_prices:
+                    continue
+                tick, lot = float(book.price_tick), float(book.amount_lot)
+                best_bid, best_bid_volume = book.bid_prices[0] * tick, book.bid_sizes[0] * lot
+                best_ask, best_ask_volume = book.ask_prices[0] * tick, book.ask_sizes[0] * lot
+            else:
+                if not book.bids or not book.asks:
+                    continue
+                best_bid, best_bid_volume = book.bids[0]
+                best_ask, best_ask_volume = book.asks[0]
+            self._put(('book_top', (
+                book.exchange, book.symbol, book.timestamp, recorded_at,
+                best_bid, best_bid_volume, best_ask, best_ask_volume,
+            )))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        if self.drop_policy == 'drop_oldest':
+            self._queue.get_nowait()
+            self._queue.put_nowait(item)
+
+    # --- Фоновая запись ---
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collected = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._collected = []
+            self._inflight_write = asyncio.ensure_future(self._write_batch(batch))
+            await asyncio.shield(self._inflight_write)
+
+    async def _flush_remaining(self):
+        if self._collected:
+            batch, self._collected = self._collected, []
+            await self._write_batch(batch)
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[Tuple[str, Tuple[Any, ...]]]):
+        opportunities = [row for kind, row in batch if kind == 'opportunity']
+        book_tops = [row for kind, row in batch if kind == 'book_top']
+        try:
+            await self.backend.write(opportunities, book_tops)
+            self.written += len(batch)
+        except Exception as e:
+            # Ошибка БД не должна останавливать сервис: батч теряется, запись продолжается
+            self.failed_batches += 1
+            logger.error(f"Persistence: ошибка записи батча ({len(batch)} строк): {e}", exc_info=True)
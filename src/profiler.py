@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from src.config import PROFILER_DEFAULT_INTERVAL_MS
+
+# Режимы: 'wall' - каждый поток учитывается в каждой выборке (ожидание I/O тоже видно),
+# 'cpu' - выборка потока взвешивается процессорным временем, которое он потратил с прошлой выборки
+MODES = ('wall', 'cpu')
+# Функции ожидания: в CPU режиме выборки потоков, стоящих в них, пропускаются
+# (_worker - простаивающий поток ThreadPoolExecutor: ожидание задачи идет в C коде очереди)
+_IDLE_FUNCTIONS = frozenset({'select', 'poll', 'epoll', 'wait', 'sleep', 'acquire', '_worker'})
+
+# Одновременно работает только один профилировщик: две выборки удвоили бы накладные расходы
+_running_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+def _thread_cpu_clock() -> Optional[Callable[[int], float]]:
+    """Функция 'CPU время потока по его ident' (Linux/BSD), или None, если ОС ее не дает."""
+    if not hasattr(time, 'pthread_getcpuclockid'):
+        return None
+
+    def cpu_time(thread_id: int) -> float:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    try:
+        cpu_time(threading.get_ident())
+    except (OSError, OverflowError):
+        return None
+    return cpu_time
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик всех потоков процесса через sys._current_frames().
+
+    Поток профилировщика раз в interval_ms снимает стеки остальных потоков и считает одинаковые
+    стеки. Код сервиса не инструментируется, поэтому профиль снимается с работающего процесса,
+    а накладные расходы - только сама выборка: подписи кадров кэшируются по code object,
+    и на выборку приходится один проход по кадрам каждого потока под GIL.
+    Результат - формат collapsed stacks (строка 'поток;кадр;...;кадр количество'), который
+    принимают flamegraph.pl, speedscope и inferno. В CPU режиме учитываются только потоки, не ждущие
+    в момент выборки; количество - микросекунды CPU потока с прошлой выборки (или число выборок,
+    если ОС не дает счетчиков CPU времени потоков).
+    """
+
+    def __init__(self, mode: str = 'wall', interval_ms: float = PROFILER_DEFAULT_INTERVAL_MS):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode} (доступны: {', '.join(MODES)})")
+        if interval_ms <= 0:
+            raise ValueError("Интервал выборки должен быть положительным")
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._labels: Dict[object, str] = {}
+        self._cpu_time = _thread_cpu_clock() if mode == 'cpu' else None
+        self._last_cpu: Dict[int, float] = {}
+
+    def run(self, duration: float) -> str:
+        """Снимает профиль в течение duration секунд (блокирует вызывающий поток) и возвращает collapsed stacks."""
+        if not _running_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Профилирование уже выполняется")
+        try:
+            own_id = threading.get_ident()
+            deadline = time.perf_counter() + duration
+            next_sample = time.perf_counter()
+            while True:
+                self._sample(own_id)
+                next_sample += self.interval
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if next_sample > now:
+                    time.sleep(next_sample - now)
+                else:
+                    next_sample = now # Не догоняем пропущенные выборки пачкой
+        finally:
+            _running_lock.release()
+        return self.collapsed()
+
+    def _sample(self, own_id: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        labels, cpu_time, last_cpu = self._labels, self._cpu_time, self._last_cpu
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            weight = 1
+            if self.mode == 'cpu':
+                if cpu_time is not None:
+                    try:
+                        now_cpu = cpu_time(thread_id)
+                    except OSError:
+                        continue # Поток завершился между перечислением и запросом времени
+                    previous = last_cpu.get(thread_id)
+                    last_cpu[thread_id] = now_cpu
+                    weight = int((now_cpu - previous) * 1_000_000) if previous is not None else 0
+                # Поток, который сейчас ждет (select, lock), не на CPU: время, потраченное им между
+                # выборками в других местах, этому стеку не приписываем
+                if weight <= 0 or frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                parts.append(label)
+                frame = frame.f_back
+            parts.append(f"thread:{names.get(thread_id, thread_id)}")
+            parts.reverse()
+            self.stacks[';'.join(parts)] += weight
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _frame_label(code) -> str:
+    # Имя функции и файл с родительским каталогом (src/scanner.py, ccxt/base/...): короче полного пути,
+    # но различимо; номер строки - начало функции, чтобы строки одной функции сливались в один кадр
+    directory, filename = os.path.split(code.co_filename)
+    # (';' - разделитель кадров в формате collapsed stacks)
+    return f"{code.co_name} ({os.path.basename(directory)}/{filename}:{code.co_firstlineno})".replace(';', ':')
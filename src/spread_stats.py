@@ -0,0 +1,236 @@
+import math
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.data_models import OpportunityRecord
+from src.fixed_point import FixedPointOrderBook
+from src.config import (
+    SPREAD_STATS_WINDOWS_SECONDS, SPREAD_HISTOGRAM_RANGE_PCT, SPREAD_HISTOGRAM_BIN_PCT, MAX_BOOK_AGE_SECONDS,
+)
+
+# Перцентили, которые отдаются в API вместе со средним и отклонением
+REPORTED_PERCENTILES = (5, 50, 95)
+# Показатель forward decay, после которого веса гистограммы перенормируются (exp(600) еще в пределах float)
+_MAX_DECAY_EXPONENT = 600.0
+
+
+class _DecayingWindow:
+    """
+    Статистики спреда с экспоненциальным забыванием по времени (постоянная времени tau секунд).
+
+    Среднее и дисперсия - взвешенный Welford, где веса прошлых наблюдений уменьшаются
+    в exp(-dt / tau) раз: обновление O(1) при любом темпе данных.
+    Перцентили - гистограмма фиксированных интервалов с forward decay: новое наблюдение
+    добавляется с весом exp((t - t0) / tau) вместо умножения всех интервалов на множитель,
+    поэтому добавление тоже O(1); гистограмма перенормируется, когда веса становятся слишком большими.
+    """
+    __slots__ = ('tau', 'weight', 'mean', 'm2', 'last_time', 'bins', 'landmark', 'bins_weight')
+
+    def __init__(self, tau: float, bins_count: int):
+        self.tau = tau
+        self.weight = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last_time: Optional[float] = None
+        self.bins = array('d', bytes(8 * bins_count))
+        self.landmark: Optional[float] = None
+        self.bins_weight = 0.0
+
+    def update(self, value: float, now: float, bin_index: int):
+        if self.last_time is not None:
+            decay = math.exp(-max(0.0, now - self.last_time) / self.tau)
+            self.weight *= decay
+            self.m2 *= decay
+        self.last_time = now
+        self.weight += 1.0
+        delta = value - self.mean
+        self.mean += delta / self.weight
+        self.m2 += delta * (value - self.mean)
+
+        if self.landmark is None:
+            self.landmark = now
+        exponent = (now - self.landmark) / self.tau
+        if exponent > _MAX_DECAY_EXPONENT:
+            scale = math.exp(-exponent)
+            bins = self.bins
+            for i in range(len(bins)):
+                bins[i] *= scale
+            self.bins_weight *= scale
+            self.landmark, exponent = now, 0.0
+        sample_weight = math.exp(exponent)
+        self.bins[bin_index] += sample_weight
+        self.bins_weight += sample_weight
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.weight if self.weight > 0 else 0.0
+
+
+class _RouteStats:
+    __slots__ = ('last_value', 'last_time', 'windows')
+
+    def __init__(self, windows: List[_DecayingWindow]):
+        self.last_value = 0.0
+        self.last_time = 0.0
+        self.windows = windows
+
+
+class SpreadStats:
+    """
+    Онлайн статистики спреда лучших цен для каждого направления (symbol, buy_exchange, sell_exchange).
+
+    Спред направления - (лучший bid биржи продажи - лучший ask биржи покупки) / ask * 100, %.
+    При изменении лучших цен книги биржи E обновляются только направления с участием E
+    (по одному в каждую сторону на каждую другую биржу с актуальной книгой), каждое за O(1).
+    Для каждого окна из windows_seconds хранятся среднее, дисперсия и гистограмма перцентилей.
+    """
+
+    def __init__(self,
+                 windows_seconds: Iterable[float] = SPREAD_STATS_WINDOWS_SECONDS,
+                 histogram_range_pct: float = SPREAD_HISTOGRAM_RANGE_PCT,
+                 histogram_bin_pct: float = SPREAD_HISTOGRAM_BIN_PCT,
+                 max_top_age_seconds: float = MAX_BOOK_AGE_SECONDS):
+        self.windows_seconds = tuple(windows_seconds)
+        self.window_labels = tuple(_window_label(seconds) for seconds in self.windows_seconds)
+        self.histogram_range_pct = histogram_range_pct
+        self.histogram_bin_pct = histogram_bin_pct
+        # Интервалы [-range, +range) шириной bin_pct и по одному для значений за пределами диапазона
+        self._inner_bins = int(round(2 * histogram_range_pct / histogram_bin_pct))
+        self.max_top_age_seconds = max_top_age_seconds
+        # symbol -> {exchange_id: (bid, ask, время обновления)}
+        self._tops: Dict[str, Dict[str, Tuple[float, float, float]]] = {}
+        self._routes: Dict[Tuple[str, str, str], _RouteStats] = {}
+
+    def update_book(self, book, now: Optional[float] = None):
+        """Учитывает новую книгу (OrderBookRecord или FixedPointOrderBook), если изменились лучшие цены."""
+        top = _top_of_book(book)
+        if top is None:
+            return
+        now = time.time() if now is None else now
+        bid, ask = top
+        tops = self._tops.setdefault(book.symbol, {})
+        previous = tops.get(book.exchange)
+        tops[book.exchange] = (bid, ask, now)
+        if previous is not None and previous[0] == bid and previous[1] == ask:
+            return
+        for other_exchange, (other_bid, other_ask, updated_at) in tops.items():
+            if other_exchange == book.exchange or now - updated_at > self.max_top_age_seconds:
+                continue
+            self._update_route(book.symbol, book.exchange, other_exchange, (other_bid - ask) / ask * 100, now)
+            self._update_route(book.symbol, other_exchange, book.exchange, (bid - other_ask) / other_ask * 100, now)
+
+    def discard_exchange(self, exchange_id: str):
+        """Забывает лучшие цены биржи (при отключении); накопленная статистика направлений сохраняется."""
+        for tops in self._tops.values():
+            tops.pop(exchange_id, None)
+
+    def _update_route(self, symbol: str, buy_exchange: str, sell_exchange: str, spread_pct: float, now: float):
+        key = (symbol, buy_exchange, sell_exchange)
+        route = self._routes.get(key)
+        if route is None:
+            bins_count = self._inner_bins + 2
+            route = self._routes[key] = _RouteStats([_DecayingWindow(seconds, bins_count) for seconds in self.windows_seconds])
+        route.last_value = spread_pct
+        route.last_time = now
+        bin_index = self._bin_index(spread_pct)
+        for window in route.windows:
+            window.update(spread_pct, now, bin_index)
+
+    def _bin_index(self, value: float) -> int:
+        if value < -self.histogram_range_pct:
+            return 0
+        if value >= self.histogram_range_pct:
+            return self._inner_bins + 1
+        return 1 + min(self._inner_bins - 1, int((value + self.histogram_range_pct) / self.histogram_bin_pct))
+
+    def _bin_value(self, index: int) -> float:
+        """Середина интервала (для крайних интервалов - граница диапазона)."""
+        if index == 0:
+            return -self.histogram_range_pct
+        if index == self._inner_bins + 1:
+            return self.histogram_range_pct
+        return -self.histogram_range_pct + (index - 0.5) * self.histogram_bin_pct
+
+    # --- Чтение ---
+
+    def route_stats(self, symbol: str, buy_exchange: str, sell_exchange: str) -> Optional[Dict[str, Any]]:
+        route = self._routes.get((symbol, buy_exchange, sell_exchange))
+        if route is None:
+            return None
+        return {
+            'symbol': symbol,
+            'buy_exchange': buy_exchange,
+            'sell_exchange': sell_exchange,
+            'spread_pct': route.last_value,
+            'updated_at': int(route.last_time * 1000),
+            'windows': {label: self._window_stats(window, route.last_value)
+                        for label, window in zip(self.window_labels, route.windows)},
+        }
+
+    def query(self, symbol: Optional[str] = None, buy_exchange: Optional[str] = None,
+              sell_exchange: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            self.route_stats(*key) for key in self._routes
+            if (symbol is None or key[0] == symbol) and (buy_exchange is None or key[1] == buy_exchange)
+            and (sell_exchange is None or key[2] == sell_exchange)
+        ]
+
+    def annotate(self, opportunities: Iterable[OpportunityRecord]):
+        """Добавляет к возможностям z-score и перцентиль текущего спреда их направления по каждому окну."""
+        for opp in opportunities:
+            route = self._routes.get((opp.symbol, opp.buy_exchange, opp.sell_exchange))
+            if route is None:
+                continue
+            opp.spread_stats = {
+                label: self._window_stats(window, route.last_value, brief=True)
+                for label, window in zip(self.window_labels, route.windows)
+            }
+
+    def _window_stats(self, window: _DecayingWindow, value: float, brief: bool = False) -> Dict[str, Any]:
+        std = math.sqrt(window.variance)
+        zscore = (value - window.mean) / std if std > 1e-12 else 0.0
+        stats = {'mean': window.mean, 'std': std, 'zscore': zscore, 'percentile_rank': self._percentile_rank(window, value)}
+        if not brief:
+            stats.update({f"p{pct}": self._percentile(window, pct) for pct in REPORTED_PERCENTILES})
+        return stats
+
+    def _percentile(self, window: _DecayingWindow, pct: float) -> Optional[float]:
+        if window.bins_weight <= 0:
+            return None
+        target = window.bins_weight * pct / 100
+        cumulative = 0.0
+        for index, weight in enumerate(window.bins):
+            cumulative += weight
+            if cumulative >= target:
+                return self._bin_value(index)
+        return self._bin_value(len(window.bins) - 1)
+
+    def _percentile_rank(self, window: _DecayingWindow, value: float) -> Optional[float]:
+        """Доля наблюдений окна (в %) ниже значения; интервал значения учитывается наполовину."""
+        if window.bins_weight <= 0:
+            return None
+        bin_index = self._bin_index(value)
+        below = sum(window.bins[:bin_index]) + window.bins[bin_index] / 2
+        return below / window.bins_weight * 100
+
+
+def _top_of_book(book) -> Optional[Tuple[float, float]]:
+    if isinstance(book, FixedPointOrderBook):
+        if not book.bid_prices or not book.ask_prices:
+            return None
+        tick = float(book.price_tick)
+        bid, ask = book.bid_prices[0] * tick, book.ask_prices[0] * tick
+    else:
+        if not book.bids or not book.asks:
+            return None
+        bid, ask = book.bids[0][0], book.asks[0][0]
+    return (bid, ask) if ask > 0 else None
+
+
+def _window_label(seconds: float) -> str:
+    if seconds % 3600 == 0:
+        return f"{int(seconds // 3600)}h"
+    if seconds % 60 == 0:
+        return f"{int(seconds // 60)}m"
+    return f"{seconds:g}s"
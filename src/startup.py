@@ -0,0 +1,114 @@
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _process_started_monotonic() -> Optional[float]:
+    """Момент запуска процесса по часам time.monotonic (Linux, /proc). None, если недоступно."""
+    try:
+        with open('/proc/self/stat') as stat_file:
+            stat = stat_file.read()
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except OSError:
+        return None
+    # Поле 22 (starttime) в тактах с загрузки системы; поля считаются после имени процесса в скобках
+    start_ticks = int(stat.rsplit(')', 1)[1].split()[19])
+    return time.monotonic() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+
+class StartupTimeline:
+    """
+    Хронология холодного старта процесса.
+
+    phase(name) закрывает последовательный этап (импорт, настройка приложения): длительность
+    отсчитывается от предыдущего этапа. event(name) отмечает однократное событие (подключена
+    первая биржа, первый проход сканера) временем от запуска процесса. Время до создания
+    хронологии (запуск интерпретатора и uvicorn) - этап 'interpreter', если доступен /proc.
+    """
+
+    def __init__(self):
+        self.created = time.monotonic()
+        process_started = _process_started_monotonic()
+        self.origin = process_started if process_started is not None and process_started <= self.created else self.created
+        self._last_phase = self.created
+        self.phases: List[Tuple[str, float]] = [] # (этап, длительность в мс)
+        if self.origin < self.created:
+            self.phases.append(('interpreter', (self.created - self.origin) * 1000))
+        self.events: Dict[str, float] = {} # событие -> мс от запуска процесса
+        self.lazy_imports: Dict[str, float] = {} # модуль -> длительность отложенного импорта в мс
+
+    def phase(self, name: str):
+        now = time.monotonic()
+        self.phases.append((name, (now - self._last_phase) * 1000))
+        self._last_phase = now
+
+    def event(self, name: str) -> bool:
+        """Отмечает событие; True только при первой отметке."""
+        if name in self.events:
+            return False
+        self.events[name] = (time.monotonic() - self.origin) * 1000
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'uptime_ms': round((time.monotonic() - self.origin) * 1000, 1),
+            'phases_ms': {name: round(duration, 1) for name, duration in self.phases},
+            'events_ms': {name: round(at, 1) for name, at in self.events.items()},
+            'lazy_imports_ms': {name: round(duration, 1) for name, duration in self.lazy_imports.items()},
+        }
+
+    def log_summary(self, title: str):
+        phases = ', '.join(f"{name} {duration:.0f}" for name, duration in self.phases)
+        events = ', '.join(f"{name} {at:.0f}" for name, at in self.events.items())
+        imports = ', '.join(f"{name} {duration:.0f}" for name, duration in self.lazy_imports.items())
+        logger.info(f"{title}: этапы (мс) [{phases}]; события от запуска (мс) [{events or '-'}]; "
+                    f"отложенные импорты (мс) [{imports or '-'}]")
+
+
+# Хронология процесса: создается при первом импорте модуля (в начале main.py)
+timeline = StartupTimeline()
+
+
+def import_module_timed(name: str):
+    """importlib.import_module с записью длительности первого импорта в timeline.lazy_imports."""
+    already_loaded = name in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    if not already_loaded and name not in timeline.lazy_imports:
+        duration_ms = (time.perf_counter() - started) * 1000
+        timeline.lazy_imports[name] = duration_ms
+        logger.info(f"Отложенный импорт {name}: {duration_ms:.0f} мс (поток {threading.current_thread().name}).")
+    return module
+
+
+async def preload_module(name: str):
+    """Импортирует модуль в отдельном потоке: event loop продолжает обслуживать запросы."""
+    return await asyncio.to_thread(import_module_timed, name)
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к атрибуту.
+
+    Для ccxt: импорт любого подмодуля (в том числе ccxt.base.errors) выполняет ccxt/__init__.py,
+    а он загружает классы всех бирж. Выражения в except вычисляются только при исключении,
+    поэтому `except ccxt_errors.NetworkError` не требует ccxt при импорте модуля.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        module = self._module
+        if module is None:
+            module = self._module = import_module_timed(self._name)
+        return getattr(module, attribute)
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from src.data_models import TickerRecord
+from src.config import TICKER_HISTORY_DIR, TICKER_HISTORY_CAPACITY
+
+logger = logging.getLogger(__name__)
+
+# Заголовок файла: magic, версия формата, емкость (записей), всего записано (счетчик растет, запись идет по кругу)
+_HEADER = struct.Struct('<4sIQQ')
+_HEADER_SIZE = 64
+_MAGIC = b'TKH1'
+_VERSION = 1
+# Колонки фиксированной ширины (8 байт): timestamp мс (int64), bid, ask, last (float64, NaN - нет значения)
+_COLUMNS: Tuple[Tuple[str, str], ...] = (('timestamp', 'q'), ('bid', 'd'), ('ask', 'd'), ('last', 'd'))
+_SUFFIX = '.tkh'
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9._-]+$')
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+
+
+class TickerSeries:
+    """
+    История тикеров одной пары на одной бирже в memory-mapped файле.
+
+    Файл - заголовок и четыре колонки по capacity значений (timestamp, bid, ask, last);
+    запись идет по кругу, после заполнения перезаписываются самые старые значения.
+    Колонки читаются через memoryview поверх mmap: поиск диапазона - bisect по колонке
+    timestamp, прореживание читает только выбранные точки, история в память процесса не загружается.
+    Timestamps не убывают: запись со временем меньше предыдущей получает время предыдущей.
+    """
+
+    def __init__(self, path: str, capacity: int = TICKER_HISTORY_CAPACITY):
+        self.path = path
+        exists = os.path.exists(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, version, capacity, self._count = _HEADER.unpack_from(self._file.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                self._file.close()
+                raise ValueError(f"{path}: неизвестный формат истории тикеров")
+        else:
+            self._count = 0
+            # Файл создается разреженным: место на диске занимают только записанные страницы
+            self._file.truncate(_HEADER_SIZE + len(_COLUMNS) * 8 * capacity)
+        self.capacity = capacity
+        self._mmap = mmap.mmap(self._file.fileno(), _HEADER_SIZE + len(_COLUMNS) * 8 * capacity)
+        if not exists:
+            self._write_header()
+        view = memoryview(self._mmap)
+        self._columns = [
+            view[_HEADER_SIZE + i * 8 * capacity:_HEADER_SIZE + (i + 1) * 8 * capacity].cast(fmt)
+            for i, (_, fmt) in enumerate(_COLUMNS)
+        ]
+        self._timestamps = self._columns[0]
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def append(self, timestamp: int, bid: Optional[float], ask: Optional[float], last: Optional[float]):
+        slot = self._count % self.capacity
+        if self._count:
+            timestamp = max(timestamp, self._timestamps[(self._count - 1) % self.capacity])
+        timestamps, bids, asks, lasts = self._columns
+        timestamps[slot] = timestamp
+        bids[slot] = math.nan if bid is None else bid
+        asks[slot] = math.nan if ask is None else ask
+        lasts[slot] = math.nan if last is None else last
+        self._count += 1
+        self._write_header()
+
+    def read(self, since: Optional[int] = None, until: Optional[int] = None, max_points: int = 500) -> Dict[str, List]:
+        """
+        Записи с since <= timestamp <= until в колоночном виде {timestamp: [...], bid: [...], ...}.
+        Если записей больше max_points, диапазон делится на max_points равных интервалов времени
+        и из каждого берется последняя запись (состояние на конец интервала).
+        """
+        size = len(self)
+        start_slot = (self._count - size) % self.capacity
+        capacity, timestamps = self.capacity, self._timestamps
+
+        def timestamp_at(i: int) -> int:
+            return timestamps[(start_slot + i) % capacity]
+
+        lo = bisect_left(range(size), since, key=timestamp_at) if since is not None else 0
+        hi = bisect_right(range(size), until, key=timestamp_at) if until is not None else size
+        if hi - lo <= max_points:
+            positions = range(lo, hi)
+        else:
+            first, last = timestamp_at(lo), timestamp_at(hi - 1)
+            width = (last - first) / max_points
+            positions = []
+            for bucket in range(1, max_points + 1):
+                bucket_end = last if bucket == max_points else first + bucket * width
+                position = bisect_right(range(lo, hi), bucket_end, key=timestamp_at) - 1 + lo
+                if position >= lo and (not positions or position != positions[-1]):
+                    positions.append(position)
+
+        result: Dict[str, List] = {name: [] for name, _ in _COLUMNS}
+        for (name, _), column in zip(_COLUMNS, self._columns):
+            values = result[name]
+            for position in positions:
+                value = column[(start_slot + position) % capacity]
+                values.append(None if value != value else value) # NaN -> None
+        return result
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, _VERSION, self.capacity, self._count)
+
+    def close(self):
+        for column in self._columns:
+            column.release()
+        self._columns = []
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+
+
+class TickerHistoryStore:
+    """
+    Истории тикеров по (биржа, пара): один файл TickerSeries на пару в каталоге directory.
+    Файлы открываются при первой записи или чтении и остаются открытыми до close().
+    """
+
+    def __init__(self, directory: str = TICKER_HISTORY_DIR, capacity: int = TICKER_HISTORY_CAPACITY):
+        self.directory = directory
+        self.capacity = capacity
+        self._series: Dict[Tuple[str, str], TickerSeries] = {}
+        # Пары, для которых не удалось открыть файл истории: предупреждение один раз, дальше пропуск
+        self._unavailable: set = set()
+
+    def append(self, ticker: TickerRecord, received_at_ms: int):
+        key = (ticker.exchange, ticker.symbol)
+        series = self._series.get(key)
+        if series is None:
+            if key in self._unavailable:
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                series = self._open(ticker.exchange, ticker.symbol)
+            except (OSError, ValueError) as e:
+                self._unavailable.add(key)
+                logger.warning(f"История тикеров {ticker.symbol}@{ticker.exchange.upper()} не записывается: {e}")
+                return
+        series.append(ticker.timestamp or received_at_ms, ticker.bid, ticker.ask, ticker.last)
+
+    def read(self, exchange_id: str, symbol: str, since: Optional[int] = None, until: Optional[int] = None,
+             max_points: int = 500) -> Optional[Dict[str, List]]:
+        """История пары в колоночном виде или None, если для пары нет записей."""
+        series = self._series.get((exchange_id, symbol))
+        if series is None:
+            path = self._path(exchange_id, symbol)
+            if path is None or not os.path.exists(path):
+                return None
+            series = self._open(exchange_id, symbol)
+        return series.read(since, until, max_points)
+
+    def mapped_bytes(self) -> int:
+        """Размер отображенных в память файлов (страницы page cache ОС, а не куча процесса)."""
+        return sum(len(series._mmap) for series in self._series.values())
+
+    def _open(self, exchange_id: str, symbol: str) -> TickerSeries:
+        path = self._path(exchange_id, symbol)
+        if path is None:
+            raise ValueError(f"Недопустимое имя истории тикеров: {exchange_id} {symbol}")
+        series = TickerSeries(path, self.capacity)
+        self._series[(exchange_id, symbol)] = series
+        logger.info(f"История тикеров {symbol}@{exchange_id.upper()}: {path} ({len(series)} записей)")
+        return series
+
+    def _path(self, exchange_id: str, symbol: str) -> Optional[str]:
+        # Имя файла из ID биржи и пары: только безопасные символы, без выхода из каталога.
+        # Прочие символы пары (':' у деривативов ccxt, например BTC/USDT:USDT) заменяются на '_',
+        # а к имени добавляется короткий хэш пары, чтобы разные пары не попали в один файл.
+        if not _SAFE_NAME.match(exchange_id) or '..' in exchange_id:
+            return None
+        symbol_name = symbol.replace('/', '-')
+        if not _SAFE_NAME.match(symbol_name) or '..' in symbol_name:
+            digest = hashlib.sha1(symbol.encode('utf-8')).hexdigest()[:8]
+            symbol_name = f"{_UNSAFE_CHARS.sub('_', symbol_name).replace('..', '_')}-{digest}"
+        return os.path.join(self.directory, f"{exchange_id}__{symbol_name}{_SUFFIX}")
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
+        self._series = {}
@@ -1,16 +1,60 @@
-from typing import Dict, Any, List, Tuple
-from src.data_models import NormalizedTicker, NormalizedOrderBook
+import functools
+import logging
+from typing import Dict, Any, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from src.data_models import OrderBookRecord, TickerRecord
+from src.fixed_point import FixedPointOrderBook
+from fractions import Fraction
 import math
 from src.config import EXCHANGE_TAKER_FEES_PCT, MIN_PROFIT_PCT # Импортируем комиссии и порог
 
-# ... (normalize_ccxt_ticker и normalize_ccxt_order_book остаются без изменений) ...
+logger = logging.getLogger(__name__)
+
+# --- Нормализация данных ccxt.pro во внутренние записи (без Pydantic валидации) ---
+
+def normalize_ccxt_order_book(exchange_id: str, symbol: str, raw_order_book: Dict[str, Any]) -> OrderBookRecord:
+    """
+    Нормализует книгу ордеров от ccxt.pro в OrderBookRecord.
+    Уровни копируются в кортежи: ccxt.pro изменяет свои списки уровней на месте при следующих обновлениях.
+    Полная проверка уровней выполняется выборочно (OrderBookRecord.to_model()).
+    """
+    return OrderBookRecord(
+        exchange=exchange_id,
+        symbol=raw_order_book.get('symbol', symbol), # Используем символ из данных, если есть
+        bids=[(level[0], level[1]) for level in raw_order_book['bids']],
+        asks=[(level[0], level[1]) for level in raw_order_book['asks']],
+        timestamp=raw_order_book.get('timestamp'),
+        datetime=raw_order_book.get('datetime'),
+    )
+
+
+def normalize_ccxt_ticker(exchange_id: str, symbol: str, raw_ticker: Dict[str, Any]) -> TickerRecord | None:
+    """
+    Нормализует тикер от ccxt.pro в TickerRecord.
+    Возвращает None, если bid/ask отсутствуют или не являются числами (как отклонила бы NormalizedTicker).
+    """
+    bid = raw_ticker.get('bid')
+    ask = raw_ticker.get('ask')
+    last = raw_ticker.get('last')
+    if not isinstance(bid, (int, float)) or not isinstance(ask, (int, float)) or \
+       (last is not None and not isinstance(last, (int, float))):
+        return None
+    return TickerRecord(
+        exchange=exchange_id,
+        symbol=raw_ticker.get('symbol', symbol),
+        bid=bid,
+        ask=ask,
+        last=last,
+        timestamp=raw_ticker.get('timestamp'), # timestamp в ms (опционально)
+        datetime=raw_ticker.get('datetime'), # дата/время ISO8601 строки (опционально)
+    )
+
 
 
 # Модифицируем существующую функцию calculate_executed_price, чтобы она просто
 # считала среднюю цену для *данного* объема. Она пригодится внутри новой функции.
 # Сделаем ее внутренним вспомогательным методом, или оставим как есть, она уже это делает.
 # Оставим как есть, но будем использовать ее из новой функции.
-def calculate_executed_price(order_book: NormalizedOrderBook, volume: float, side: str) -> Tuple[float, float]:
+def calculate_executed_price(order_book: OrderBookRecord, volume: float, side: str) -> Tuple[float, float]:
     """
     Рассчитывает средневзвешенную исполненную цену и реализуемый объем для заданного объема сделки
     (в базовой валюте), используя данные книги ордеров. Возвращает (price, volume).
@@ -50,10 +94,267 @@ def calculate_executed_price(order_book: NormalizedOrderBook, volume: float, sid
     return executed_price, volume_executed
 
 
+# --- Проход по стаканам для расчета объема и прибыли ---
+# Разделен на шаги, общие для сканера (find_executable_arbitrage_volume_and_profit*) и бэктеста
+# (src/backtest.py): порядок уровней, объемы шагов и выбор лучшего объема задаются только здесь.
+# Шаг прохода: (объем шага, цена покупки, цена продажи).
+
+# Лучшая точка float прохода: (объем, стоимость покупки, выручка продажи, комиссии, Net прибыль %)
+FloatProfitPoint = Tuple[float, float, float, float, float]
+
+
+def iter_level_steps(asks: Sequence[Tuple[float, float]], bids: Sequence[Tuple[float, float]]) -> Iterator[Tuple[float, float, float]]:
+    """
+    Шаги совместного прохода по asks биржи покупки и bids биржи продажи, без ограничения объема.
+    Объем шага - меньший из объемов текущих уровней; исчерпанный уровень (или оба) сменяется следующим.
+    Остаток не исчерпанного уровня не переносится: на следующем шаге уровень берется с полным объемом.
+    """
+    buy_level_idx = 0 # Идем по asks (покупаем)
+    sell_level_idx = 0 # Идем по bids (продаем)
+    while buy_level_idx < len(asks) and sell_level_idx < len(bids):
+        buy_price, buy_volume = asks[buy_level_idx]
+        sell_price, sell_volume = bids[sell_level_idx]
+        step = min(buy_volume, sell_volume)
+        if step <= 1e-9:
+            # Пустой уровень: двигаем индекс того уровня, чей объем был минимальным
+            if buy_volume <= sell_volume:
+                buy_level_idx += 1
+            else:
+                sell_level_idx += 1
+            continue
+        yield step, buy_price, sell_price
+        # Двигаем индекс уровня, чей объем был исчерпан на этом шаге (если оба - оба)
+        if math.isclose(step, buy_volume, rel_tol=1e-9):
+            buy_level_idx += 1
+        if math.isclose(step, sell_volume, rel_tol=1e-9):
+            sell_level_idx += 1
+
+
+def clip_level_steps(steps: Iterable[Tuple[float, float, float]], max_volume: float) -> Iterator[Tuple[float, float, float]]:
+    """Ограничивает проход объемом max_volume: последний шаг урезается до остатка лимита."""
+    volume = 0.0
+    for step, buy_price, sell_price in steps:
+        remaining = max_volume - volume
+        if remaining <= 1e-9:
+            return # Достигнут лимит объема
+        if step > remaining:
+            step = remaining
+        volume += step
+        yield step, buy_price, sell_price
+
+
+def best_net_profit_point(steps: Iterable[Tuple[float, float, float]], buy_fee_pct: float, sell_fee_pct: float,
+                          min_profit_pct: float) -> Optional[FloatProfitPoint]:
+    """
+    Накопленный объем с максимальной Net прибылью (%) не ниже min_profit_pct.
+    Проход останавливается, как только Net прибыль накопленного объема падает ниже порога
+    (цены дальше только хуже). При равной прибыли остается меньший объем. None - подходящего объема нет.
+    Комиссии - процент от общей стоимости покупки и от общей выручки продажи.
+    """
+    buy_fee = buy_fee_pct / 100.0
+    sell_fee = sell_fee_pct / 100.0
+    volume = cost = revenue = 0.0
+    best: Optional[FloatProfitPoint] = None
+    best_net_profit_pct = -100.0
+    for step, buy_price, sell_price in steps:
+        volume += step
+        cost += step * buy_price
+        revenue += step * sell_price
+        fees = cost * buy_fee + revenue * sell_fee
+        net_profit_pct = ((revenue - fees) - cost) / cost * 100 if cost > 1e-9 else -100.0
+        if net_profit_pct < min_profit_pct:
+            break
+        if net_profit_pct > best_net_profit_pct:
+            best_net_profit_pct = net_profit_pct
+            best = (volume, cost, revenue, fees, net_profit_pct)
+    return best
+
+
+def float_opportunity_metrics(best: FloatProfitPoint) -> Tuple[float, float, float, float, float, float, float, float]:
+    """Результат в формате find_executable_arbitrage_volume_and_profit по лучшей точке прохода."""
+    volume, cost, revenue, fees, net_profit_pct = best
+    # Средние исполненные цены и Gross прибыль (%) для выбранного объема
+    buy_executed_price = cost / volume
+    sell_executed_price = revenue / volume
+    gross_profit_pct = ((sell_executed_price / buy_executed_price) - 1) * 100 if buy_executed_price > 1e-9 else -100.0
+    return volume, buy_executed_price, sell_executed_price, gross_profit_pct, net_profit_pct, fees, cost, revenue
+
+
+class FixedPairUnits(NamedTuple):
+    """Общие единицы цены и объема пары fixed-point книг (см. fixed_pair_units)."""
+    price_unit: Fraction
+    buy_price_mult: int
+    sell_price_mult: int
+    volume_unit: Fraction
+    buy_lot_mult: int
+    sell_lot_mult: int
+    common_lot: int # Шаг объема, кратный лотам обеих бирж (в единицах volume_unit)
+
+
+class FixedFeeTerms(NamedTuple):
+    """Комиссии и порог прибыли как точные дроби с общим знаменателем (см. fixed_fee_terms)."""
+    buy_fee: Fraction
+    sell_fee: Fraction
+    fee_denominator: int
+    sell_keep: int # Net прибыль * fee_denominator = revenue * sell_keep - cost * buy_pay
+    buy_pay: int
+    min_profit_num: int
+    min_profit_den: int
+
+
+# Лучшая точка fixed-point прохода: (объем, стоимость, выручка) в общих единицах и числитель Net прибыли
+FixedProfitPoint = Tuple[int, int, int, int]
+
+
+def fixed_pair_units(buy_price_tick: Fraction, buy_amount_lot: Fraction,
+                     sell_price_tick: Fraction, sell_amount_lot: Fraction) -> FixedPairUnits:
+    """Цены обеих книг - в общей единице цены (НОД шагов цены), объемы - в общей единице объема (НОД лотов)."""
+    price_unit = _fraction_gcd(buy_price_tick, sell_price_tick)
+    volume_unit = _fraction_gcd(buy_amount_lot, sell_amount_lot)
+    buy_lot_mult = int(buy_amount_lot / volume_unit)
+    sell_lot_mult = int(sell_amount_lot / volume_unit)
+    return FixedPairUnits(
+        price_unit=price_unit,
+        buy_price_mult=int(buy_price_tick / price_unit),
+        sell_price_mult=int(sell_price_tick / price_unit),
+        volume_unit=volume_unit,
+        buy_lot_mult=buy_lot_mult,
+        sell_lot_mult=sell_lot_mult,
+        common_lot=math.lcm(buy_lot_mult, sell_lot_mult),
+    )
+
+
+def fixed_volume_units(max_volume_base: float, units: FixedPairUnits) -> int:
+    """Лимит объема в единицах volume_unit, округленный вниз до common_lot."""
+    max_volume_units = int(Fraction(str(max_volume_base)) / units.volume_unit)
+    return max_volume_units - max_volume_units % units.common_lot
+
+
+@functools.lru_cache(maxsize=1024)
+def fixed_fee_terms(buy_fee_pct: float, sell_fee_pct: float, min_profit_pct: float) -> FixedFeeTerms:
+    """Комиссии и порог прибыли в виде точных дробей над общим знаменателем (кэшируется: аргументов немного)."""
+    buy_fee = Fraction(str(buy_fee_pct)) / 100
+    sell_fee = Fraction(str(sell_fee_pct)) / 100
+    min_profit = Fraction(str(min_profit_pct)) / 100
+    fee_denominator = math.lcm(buy_fee.denominator, sell_fee.denominator)
+    buy_fee_num = buy_fee.numerator * (fee_denominator // buy_fee.denominator)
+    sell_fee_num = sell_fee.numerator * (fee_denominator // sell_fee.denominator)
+    return FixedFeeTerms(
+        buy_fee=buy_fee,
+        sell_fee=sell_fee,
+        fee_denominator=fee_denominator,
+        sell_keep=fee_denominator - sell_fee_num,
+        buy_pay=fee_denominator + buy_fee_num,
+        min_profit_num=min_profit.numerator * fee_denominator,
+        min_profit_den=min_profit.denominator,
+    )
+
+
+def iter_fixed_level_steps(buy_ob: FixedPointOrderBook, sell_ob: FixedPointOrderBook,
+                           units: FixedPairUnits) -> Iterator[Tuple[int, int, int]]:
+    """
+    Шаги совместного прохода по fixed-point книгам в общих единицах (объем, цена покупки, цена продажи).
+    Объем шага округляется вниз до common_lot; остаток уровня переносится на следующий шаг,
+    а остаток меньше common_lot (на обеих биржах его исполнить нельзя) пропускается вместе с уровнем.
+    """
+    ask_prices, ask_sizes = buy_ob.ask_prices, buy_ob.ask_sizes
+    bid_prices, bid_sizes = sell_ob.bid_prices, sell_ob.bid_sizes
+    ask_count, bid_count = len(ask_prices), len(bid_prices)
+    if not ask_count or not bid_count:
+        return
+    buy_price_mult, sell_price_mult = units.buy_price_mult, units.sell_price_mult
+    buy_lot_mult, sell_lot_mult, common_lot = units.buy_lot_mult, units.sell_lot_mult, units.common_lot
+
+    buy_level_idx = 0
+    sell_level_idx = 0
+    buy_remaining = ask_sizes[0] * buy_lot_mult # Остаток текущего ask уровня в единицах объема
+    sell_remaining = bid_sizes[0] * sell_lot_mult # Остаток текущего bid уровня в единицах объема
+    while True:
+        step = min(buy_remaining, sell_remaining)
+        step -= step % common_lot
+        if step:
+            yield step, ask_prices[buy_level_idx] * buy_price_mult, bid_prices[sell_level_idx] * sell_price_mult
+            buy_remaining -= step
+            sell_remaining -= step
+            buy_exhausted, sell_exhausted = buy_remaining == 0, sell_remaining == 0
+        else:
+            buy_exhausted = buy_remaining <= sell_remaining
+            sell_exhausted = not buy_exhausted
+        if buy_exhausted:
+            buy_level_idx += 1
+            if buy_level_idx >= ask_count:
+                return
+            buy_remaining = ask_sizes[buy_level_idx] * buy_lot_mult
+        if sell_exhausted:
+            sell_level_idx += 1
+            if sell_level_idx >= bid_count:
+                return
+            sell_remaining = bid_sizes[sell_level_idx] * sell_lot_mult
+
+
+def clip_fixed_level_steps(steps: Iterable[Tuple[int, int, int]], max_volume_units: int) -> Iterator[Tuple[int, int, int]]:
+    """Ограничивает fixed-point проход объемом max_volume_units (кратен common_lot, как и объемы шагов)."""
+    volume = 0
+    for step, buy_price, sell_price in steps:
+        remaining = max_volume_units - volume
+        if step > remaining:
+            step = remaining
+        volume += step
+        yield step, buy_price, sell_price
+        if volume >= max_volume_units:
+            return
+
+
+def best_fixed_net_profit_point(steps: Iterable[Tuple[int, int, int]], terms: FixedFeeTerms) -> Optional[FixedProfitPoint]:
+    """
+    То же, что best_net_profit_point, в целых числах: прибыль сравнивается перекрестным умножением
+    без деления и допусков. None - подходящего объема нет.
+    """
+    sell_keep, buy_pay = terms.sell_keep, terms.buy_pay
+    min_profit_num, min_profit_den = terms.min_profit_num, terms.min_profit_den
+    volume = cost = revenue = 0 # cost/revenue в единицах price_unit * volume_unit
+    best_volume = best_cost = best_revenue = best_net_num = 0
+    for step, buy_price, sell_price in steps:
+        cost += step * buy_price
+        revenue += step * sell_price
+        volume += step
+        net_num = revenue * sell_keep - cost * buy_pay
+        # Проверка net_profit_pct >= min_profit_pct: net_num / (cost * fee_denominator) >= min_profit
+        if net_num * min_profit_den < min_profit_num * cost:
+            break # Прибыль упала ниже порога, дальше цены только хуже
+        # Лучшая прибыль в процентах: net_num / cost > best_net_num / best_cost
+        if best_volume == 0 or net_num * best_cost > best_net_num * cost:
+            best_volume, best_cost, best_revenue, best_net_num = volume, cost, revenue, net_num
+    if best_volume == 0:
+        return None
+    return best_volume, best_cost, best_revenue, best_net_num
+
+
+def fixed_opportunity_metrics(best: FixedProfitPoint, units: FixedPairUnits,
+                              terms: FixedFeeTerms) -> Tuple[float, float, float, float, float, float, float, float]:
+    """Результат в формате find_executable_arbitrage_volume_and_profit; перевод во float - только здесь."""
+    best_volume, best_cost, best_revenue, best_net_num = best
+    price_unit = units.price_unit
+    quote_unit = price_unit * units.volume_unit
+    cost_total_quote = best_cost * quote_unit
+    revenue_total_quote = best_revenue * quote_unit
+    fees_paid_quote = cost_total_quote * terms.buy_fee + revenue_total_quote * terms.sell_fee
+    return (
+        float(best_volume * units.volume_unit),
+        float(Fraction(best_cost, best_volume) * price_unit),
+        float(Fraction(best_revenue, best_volume) * price_unit),
+        float((Fraction(best_revenue, best_cost) - 1) * 100),
+        float(Fraction(best_net_num * 100, best_cost * terms.fee_denominator)),
+        float(fees_paid_quote),
+        float(cost_total_quote),
+        float(revenue_total_quote),
+    )
+
+
 # НОВАЯ ФУНКЦИЯ ДЛЯ РАСЧЕТА ОПТИМАЛЬНОГО ОБЪЕМА И ПРИБЫЛИ С КОМИССИЯМИ
 def find_executable_arbitrage_volume_and_profit(
-    buy_ob: NormalizedOrderBook, # OB для покупки (asks)
-    sell_ob: NormalizedOrderBook, # OB для продажи (bids)
+    buy_ob: OrderBookRecord, # OB для покупки (asks)
+    sell_ob: OrderBookRecord, # OB для продажи (bids)
     buy_exchange_id: str,
     sell_exchange_id: str,
     min_profit_pct: float, # Минимальная требуемая чистая прибыль в процентах
@@ -102,178 +403,80 @@ def find_executable_arbitrage_volume_and_profit(
     # Не можем рассчитать прибыль без комиссий для обеих сторон
     # TODO: Обработать случай, когда одной комиссии нет? Сейчас просто пропускаем
     if buy_taker_fee_pct is None or sell_taker_fee_pct is None:
-        print(f"Warning: Commission not found for {buy_exchange_id} or {sell_exchange_id}. Cannot calculate Net Profit.")
+        logger.warning(f"Комиссия не найдена для {buy_exchange_id} или {sell_exchange_id}. Net прибыль не рассчитывается.")
         return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
 
-    # Комиссии в виде множителей: 1 - %/100
-    buy_fee_multiplier = 1 - (buy_taker_fee_pct / 100.0)
-    sell_fee_multiplier = 1 - (sell_taker_fee_pct / 100.0)
+    # Проход по уровням и выбор объема - общие с бэктестом (src/backtest.py), чтобы подобранные
+    # там параметры давали тот же результат, что и живой сканер
+    steps = clip_level_steps(iter_level_steps(buy_ob.asks, sell_ob.bids), max_volume_base_limit)
+    best = best_net_profit_point(steps, buy_taker_fee_pct, sell_taker_fee_pct, min_profit_pct)
+    if best is None:
+        # Нет подходящей возможности: Net прибыль ниже порога или не удалось набрать объем
+        return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+    return float_opportunity_metrics(best)
 
-    # Индексы для итерации по уровням OB
-    buy_level_idx = 0 # Идем по asks (покупаем)
-    sell_level_idx = 0 # Идем по bids (продаем)
 
-    # Накопленные метрики по мере прохождения по стаканам
-    current_volume_base = 0.0
-    current_cost_quote = 0.0 # Общая стоимость покупки в цитируемой валюте
-    current_revenue_quote = 0.0 # Общая выручка от продажи в цитируемой валюте
-
-    # Метрики лучшей найденной возможности (с максимальным Net Profit %)
-    best_executable_volume_base = 0.0
-    best_buy_executed_price = 0.0
-    best_sell_executed_price = 0.0
-    best_gross_profit_pct = 0.0
-    best_net_profit_pct = -100.0 # Начинаем с очень низкого значения
-    best_fees_paid_quote = 0.0
-    best_cost_total_quote = 0.0
-    best_revenue_total_quote = 0.0
-
-
-    # Итерируемся по уровням стаканов, пока есть ликвидность на ОБЕИХ сторонах
-    # и пока не превышен лимит максимального объема
-    while (buy_level_idx < len(buy_ob.asks) and
-           sell_level_idx < len(sell_ob.bids) and
-           current_volume_base < max_volume_base_limit): # Учитываем лимит объема
-
-        # Текущие уровни из стаканов
-        # bids отсортированы по убыванию (лучшая цена первая)
-        # asks отсортированы по возрастанию (лучшая цена первая)
-        # При покупке мы берем Ask, при продаже мы берем Bid.
-        # Арбитраж возможен, если лучшая цена продажи (Bid) > лучшей цены покупки (Ask) (до комиссий)
-        # Иначе (sell_price <= buy_price), Gross прибыль будет <= 0
-        # А Net прибыль (после комиссий) будет еще меньше.
-        # Проверим это условие здесь, прежде чем что-либо считать
-        current_buy_price_at_level = buy_ob.asks[buy_level_idx][0]
-        current_sell_price_at_level = sell_ob.bids[sell_level_idx][0]
-
-        # Оптимизация: если на текущих лучших уровнях цена продажи <= цене покупки,
-        # то на последующих уровнях (ухудшающихся) спред будет только уменьшаться (или становиться более отрицательным).
-        # Поэтому можно прекратить расчет для этого направления арбитража (Buy A -> Sell B).
-        # Это проверка Gross спреда. Спред после комиссий (sell_price * sell_fee_multiplier > buy_price / buy_fee_multiplier)
-        # является более точным критерием, но проверка gross спреда отсечет большинство неинтересных случаев быстро.
-        # Однако, для алгоритма "нахождения оптимального объема", который может включать несколько уровней,
-        # нужно пройти чуть глубже. Давайте проверим, падает ли Net прибыль ниже порога.
-        # Будем двигаться по самому "узкому" стакану по объему.
-        # Определяем объем, который можно взять на *текущих* уровнях
-        buy_volume_at_level = buy_ob.asks[buy_level_idx][1]
-        sell_volume_at_level = sell_ob.bids[sell_level_idx][1]
-
-        # Объем, который можно прогнать на текущем шаге, ограничен ликвидностью текущих уровней
-        # и оставшимся лимитом максимального объема.
-        volume_to_process_step = min(buy_volume_at_level, sell_volume_at_level, max_volume_base_limit - current_volume_base)
-
-        # Если объем на текущем шаге меньше или равен нулю (с учетом погрешности), переходим к следующим уровням
-        if volume_to_process_step <= 1e-9:
-             # Если buy_volume_at_level <= sell_volume_at_level, значит исчерпан buy_level_idx, двигаем его.
-             # Если sell_volume_at_level < buy_volume_at_level, значит исчерпан sell_level_idx, двигаем его.
-             # Если оба <= 1e-9 (один из них был 0), двигаем оба.
-             # Если volume_to_process_step == max_volume_base_limit - current_volume_base, значит достигнут лимит, выходим.
-             # Упрощенно: двигаем индекс того уровня, чей объем был минимальным.
-             if math.isclose(volume_to_process_step, max_volume_base_limit - current_volume_base, rel_tol=1e-9):
-                  break # Достигнут лимит объема
-             elif buy_volume_at_level <= sell_volume_at_level: # Двигаем buy_level_idx, если buy_level был узким местом
-                 buy_level_idx += 1
-                 continue # Переходим к следующей итерации цикла
-             else: # Двигаем sell_level_idx
-                 sell_level_idx += 1
-                 continue # Переходим к следующей итерации цикла
-
-
-        # Цены на текущих уровнях для шага
-        price_buy_step = buy_ob.asks[buy_level_idx][0]
-        price_sell_step = sell_ob.bids[sell_level_idx][0]
-
-        # Рассчитываем стоимость и выручку для объема шага
-        cost_step_quote = volume_to_process_step * price_buy_step
-        revenue_step_quote = volume_to_process_step * price_sell_step
-
-        # Накапливаем общую стоимость, выручку и объем
-        current_cost_quote += cost_step_quote
-        current_revenue_quote += revenue_step_quote
-        current_volume_base += volume_to_process_step
-
-        # Рассчитываем средние исполненные цены для ТЕКУЩЕГО НАКОПЛЕННОГО объема
-        # (средневзвешенные цены до текущего шага включительно)
-        current_buy_executed_price = current_cost_quote / current_volume_base if current_volume_base > 1e-9 else 0.0
-        current_sell_executed_price = current_revenue_quote / current_volume_base if current_volume_base > 1e-9 else 0.0
-
-        # Рассчитываем Gross прибыль (%) для ТЕКУЩЕГО НАКОПЛЕННОГО объема
-        current_gross_profit_pct = ((current_sell_executed_price / current_buy_executed_price) - 1) * 100 if current_buy_executed_price > 1e-9 else -100.0
-
-        # Рассчитываем Net прибыль (%) с учетом тейкерских комиссий для ТЕКУЩЕГО НАКОПЛЕННОГО объема
-        # Комиссия при покупке: buy_taker_fee_pct % от current_cost_quote
-        # Комиссия при продаже: sell_taker_fee_pct % от current_revenue_quote (или от current_revenue_quote * sell_fee_multiplier?)
-        # Обычно комиссия берется от суммы сделки. При покупке за Quote, комиссия берется от Quote. При продаже Base за Quote, комиссия берется от полученного Quote.
-        # Упрощенно: комиссии - это процент от общей стоимости покупки и от общей выручки продажи.
-        fees_buy_quote = current_cost_quote * (buy_taker_fee_pct / 100.0)
-        fees_sell_quote = current_revenue_quote * (sell_taker_fee_pct / 100.0) # Или от (current_revenue_quote - fees_buy_quote)? Упрощаем.
-        total_fees_quote = fees_buy_quote + fees_sell_quote
-
-
-        # Чистая выручка (в Quote) после всех комиссий
-        net_revenue_quote = current_revenue_quote - total_fees_quote
-
-        # Чистая прибыль (в Quote)
-        current_net_profit_quote = net_revenue_quote - current_cost_quote
-
-        # Чистая прибыль (%)
-        # Рассчитываем как (Чистая выручка - Стоимость) / Стоимость * 100
-        current_net_profit_pct = (current_net_profit_quote / current_cost_quote) * 100 if current_cost_quote > 1e-9 else -100.0
-
-        # --- Проверяем, является ли текущая Net прибыль лучшей найденной до сих пор ---
-        # Ищем точку, где Net прибыль максимальна ИЛИ где она впервые падает ниже min_profit_pct
-        # Если текущая Net прибыль выше лучшей найденной ИЛИ текущая Net прибыль > min_profit_pct
-        # (даже если она ниже предыдущей, но все еще выше порога, мы можем хотеть обновить best?)
-        # Давайте найдем *максимальную* Net прибыль, которая >= min_profit_pct.
-        # Если текущая Net прибыль >= min_profit_pct, обновляем best, если она выше предыдущего best_net_profit_pct
-        # ИЛИ если это первая найденная возможность >= min_profit_pct.
-        if current_net_profit_pct >= min_profit_pct:
-             if current_net_profit_pct > best_net_profit_pct:
-                 best_executable_volume_base = current_volume_base
-                 best_buy_executed_price = current_buy_executed_price
-                 best_sell_executed_price = current_sell_executed_price
-                 best_gross_profit_pct = current_gross_profit_pct
-                 best_net_profit_pct = current_net_profit_pct
-                 best_fees_paid_quote = total_fees_quote
-                 best_cost_total_quote = current_cost_quote
-                 best_revenue_total_quote = current_revenue_quote
-                 # print(f"Found better Net Profit: {best_net_profit_pct:.4f}% at Vol: {best_executable_volume_base:.8f}") # Отладка
-        else:
-             # Если текущая Net прибыль упала ниже порога, дальше двигаться нет смысла
-             # (цены будут только ухудшаться). Завершаем итерацию.
-             # print(f"Net Profit dropped below threshold {min_profit_pct}% at Vol: {current_volume_base:.8f}. Stopping.") # Отладка
-             break # Выходим из цикла
-
-        # Уменьшаем объем на текущих уровнях на volume_to_process_step
-        # buy_ob.asks[buy_level_idx] = (price_buy_step, buy_volume_at_level - volume_to_process_step) # Нельзя менять исходные данные
-        # sell_ob.bids[sell_level_idx] = (price_sell_step, sell_volume_at_level - volume_to_process_step)
-
-        # Двигаем индекс уровня, чей объем был исчерпан на этом шаге
-        if math.isclose(volume_to_process_step, buy_volume_at_level, rel_tol=1e-9):
-            buy_level_idx += 1 # Исчерпан ask
-        if math.isclose(volume_to_process_step, sell_volume_at_level, rel_tol=1e-9):
-             # Важно: если оба объема были равны, двигаем оба индекса
-             sell_level_idx += 1 # Исчерпан bid
-
-
-    # Возвращаем метрики лучшей возможности, найденной в процессе итерации,
-    # при условии, что ее Net прибыль >= min_profit_pct
-    if best_net_profit_pct >= min_profit_pct and best_executable_volume_base > 1e-9:
-        # print(f"Returning best opportunity: Net Profit {best_net_profit_pct:.4f}% at Vol {best_executable_volume_base:.8f}") # Отладка
-        return (
-            best_executable_volume_base,
-            best_buy_executed_price,
-            best_sell_executed_price,
-            best_gross_profit_pct,
-            best_net_profit_pct,
-            best_fees_paid_quote,
-            best_cost_total_quote, # Можем вернуть и эти для полноты, если нужны
-            best_revenue_total_quote
-        )
-    else:
-        # print(f"No opportunity found with Net Profit >= {min_profit_pct}%.") # Отладка
-        # Если лучшая прибыль ниже порога или не удалось набрать объем, возвращаем нули
-        return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0 # Нет подходящей возможности
+def _fraction_gcd(a: Fraction, b: Fraction) -> Fraction:
+    """Наибольший общий делитель двух положительных дробей (наибольшая единица, кратная которой обе дроби)."""
+    return Fraction(math.gcd(a.numerator * b.denominator, b.numerator * a.denominator), a.denominator * b.denominator)
+
+
+# Единицы пары, лимит объема и дроби комиссий зависят только от рынков, комиссий и параметров сканера,
+# поэтому считаются один раз на комбинацию, а не при каждом сканировании (НОД/НОК и Fraction дороги)
+@functools.lru_cache(maxsize=4096)
+def _fixed_scan_constants(buy_price_tick: Fraction, buy_amount_lot: Fraction,
+                          sell_price_tick: Fraction, sell_amount_lot: Fraction,
+                          buy_fee_pct: float, sell_fee_pct: float, min_profit_pct: float,
+                          max_volume_base: float) -> Tuple[FixedPairUnits, int, FixedFeeTerms]:
+    units = fixed_pair_units(buy_price_tick, buy_amount_lot, sell_price_tick, sell_amount_lot)
+    return units, fixed_volume_units(max_volume_base, units), fixed_fee_terms(buy_fee_pct, sell_fee_pct, min_profit_pct)
+
+
+# ВЕРСИЯ find_executable_arbitrage_volume_and_profit ДЛЯ FIXED-POINT КНИГ
+def find_executable_arbitrage_volume_and_profit_fixed(
+    buy_ob: FixedPointOrderBook, # OB для покупки (asks)
+    sell_ob: FixedPointOrderBook, # OB для продажи (bids)
+    buy_exchange_id: str,
+    sell_exchange_id: str,
+    min_profit_pct: float,
+    max_volume_base_limit: float
+) -> Tuple[float, float, float, float, float, float, float, float]:
+    """
+    То же, что find_executable_arbitrage_volume_and_profit, но для FixedPointOrderBook.
+
+    Все вычисления в цикле по уровням выполняются в целых числах:
+      - цены обеих книг приводятся к общей единице цены (НОД шагов цены бирж);
+      - объемы - к общей единице объема (НОД лотов бирж), а объем каждого шага
+        округляется вниз до НОК лотов, т.е. исполним на обеих биржах;
+      - комиссии и порог прибыли переводятся в точные дроби, сравнение прибыли
+        выполняется перекрестным умножением без деления и допусков.
+    Частично использованный уровень учитывается точно (остаток уровня переносится на следующий шаг).
+    Перевод во float выполняется только для возвращаемого результата.
+
+    Returns:
+        Кортеж в том же формате, что и find_executable_arbitrage_volume_and_profit.
+    """
+    no_opportunity = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    if not buy_ob or not buy_ob.ask_prices or not sell_ob or not sell_ob.bid_prices:
+        return no_opportunity
+
+    buy_taker_fee_pct = EXCHANGE_TAKER_FEES_PCT.get(buy_exchange_id, None)
+    sell_taker_fee_pct = EXCHANGE_TAKER_FEES_PCT.get(sell_exchange_id, None)
+    if buy_taker_fee_pct is None or sell_taker_fee_pct is None:
+        logger.warning(f"Комиссия не найдена для {buy_exchange_id} или {sell_exchange_id}. Net прибыль не рассчитывается.")
+        return no_opportunity
+
+    units, max_volume_units, terms = _fixed_scan_constants(
+        buy_ob.price_tick, buy_ob.amount_lot, sell_ob.price_tick, sell_ob.amount_lot,
+        buy_taker_fee_pct, sell_taker_fee_pct, min_profit_pct, max_volume_base_limit)
+    if max_volume_units <= 0:
+        return no_opportunity
+
+    steps = clip_fixed_level_steps(iter_fixed_level_steps(buy_ob, sell_ob, units), max_volume_units)
+    best = best_fixed_net_profit_point(steps, terms)
+    if best is None:
+        return no_opportunity
+    return fixed_opportunity_metrics(best, units, terms)
 
 
 # TODO: Реализовать учет комиссий за вывод/перевод в этой функции,
@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import logging
+from dataclasses import asdict
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Union
+
+from src.data_models import OrderBookRecord, OpportunityRecord
+from src.fixed_point import FixedPointOrderBook
+from src.config import (
+    WARM_START_CACHE_DIR, MARKETS_CACHE_TTL_SECONDS, WARM_START_SNAPSHOT_MAX_AGE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Имя файла снапшота книг ордеров и возможностей внутри каталога кэша
+SNAPSHOT_FILE_NAME = 'snapshot.json'
+
+
+class WarmStartCache:
+    """
+    Кэш для быстрого (warm) старта MarketDataService.
+
+    Хранит на диске:
+      - метаданные рынков каждой биржи (результат load_markets) с TTL;
+      - снапшот последних книг ордеров и latest_opportunities, сделанный при остановке сервиса.
+
+    Рынки дополнительно держатся в памяти процесса, поэтому переподключения
+    _watch_exchange не повторяют REST запрос load_markets, пока кэш не устарел.
+    """
+
+    def __init__(self,
+                 cache_dir: str = WARM_START_CACHE_DIR,
+                 markets_ttl_seconds: float = MARKETS_CACHE_TTL_SECONDS,
+                 snapshot_max_age_seconds: float = WARM_START_SNAPSHOT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.markets_ttl_seconds = markets_ttl_seconds
+        self.snapshot_max_age_seconds = snapshot_max_age_seconds
+        # Кэш рынков в памяти: { exchange_id: (saved_at, {'markets': ..., 'currencies': ...}) }
+        self._markets_in_memory: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    # --- Метаданные рынков ---
+
+    def _markets_path(self, exchange_id: str) -> str:
+        return os.path.join(self.cache_dir, f"markets_{exchange_id}.json")
+
+    def load_markets(self, exchange_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает {'markets': ..., 'currencies': ...} для биржи, если кэш (в памяти или на диске)
+        не старше markets_ttl_seconds. Иначе None.
+        """
+        now = time.time()
+        cached = self._markets_in_memory.get(exchange_id)
+        if cached is None:
+            try:
+                with open(self._markets_path(exchange_id), 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+                cached = (payload['saved_at'], payload['data'])
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать кэш рынков для {exchange_id.upper()}: {e}. Кэш игнорируется.")
+                return None
+            self._markets_in_memory[exchange_id] = cached
+
+        saved_at, data = cached
+        if now - saved_at > self.markets_ttl_seconds:
+            logger.info(f"Кэш рынков для {exchange_id.upper()} устарел ({now - saved_at:.0f}с). Требуется load_markets.")
+            return None
+        return data
+
+    def save_markets(self, exchange_id: str, markets: Dict[str, Any], currencies: Dict[str, Any] | None):
+        """
+        Сохраняет метаданные рынков биржи в память и на диск.
+        Рынки сохраняются целиком, вместе с сырыми ответами бирж ('info'): методы ccxt
+        (например, парсеры binance, okx, htx) читают market['info'], и после warm start
+        они должны работать так же, как после load_markets.
+        """
+        data = {'markets': markets, 'currencies': currencies or {}}
+        saved_at = time.time()
+        self._markets_in_memory[exchange_id] = (saved_at, data)
+        self._write_json(self._markets_path(exchange_id), {'saved_at': saved_at, 'data': data})
+
+    # --- Снапшот книг и возможностей ---
+
+    def save_snapshot(self,
+                      order_books: Iterable[Union[OrderBookRecord, FixedPointOrderBook]],
+                      opportunities: List[OpportunityRecord]):
+        """Сохраняет книги ордеров из market_store и последние возможности на диск."""
+        books = [
+            asdict(book.to_normalized() if isinstance(book, FixedPointOrderBook) else book)
+            for book in order_books
+        ]
+        payload = {
+            'saved_at': time.time(),
+            'books': books,
+            'opportunities': [asdict(opp) for opp in opportunities],
+        }
+        self._write_json(os.path.join(self.cache_dir, SNAPSHOT_FILE_NAME), payload)
+        logger.info(f"Warm-start снапшот сохранен: {len(books)} книг, {len(opportunities)} возможностей.")
+
+    def load_snapshot(self) -> Tuple[List[OrderBookRecord], List[OpportunityRecord]]:
+        """
+        Загружает снапшот, если он не старше snapshot_max_age_seconds.
+        Все книги и возможности помечаются как stale.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, SNAPSHOT_FILE_NAME), 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return [], []
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать warm-start снапшот: {e}. Старт без снапшота.")
+            return [], []
+
+        age = time.time() - payload.get('saved_at', 0)
+        if age > self.snapshot_max_age_seconds:
+            logger.info(f"Warm-start снапшот слишком старый ({age:.0f}с). Старт без снапшота.")
+            return [], []
+
+        try:
+            books = [OrderBookRecord(**{**book, 'stale': True}) for book in payload.get('books', [])]
+            opportunities = [OpportunityRecord(**{**opp, 'stale': True}) for opp in payload.get('opportunities', [])]
+        except TypeError as e:
+            # Снапшот от версии с другим набором полей
+            logger.warning(f"Warm-start снапшот несовместим с текущей версией: {e}. Старт без снапшота.")
+            return [], []
+        return books, opportunities
+
+    # --- Вспомогательные методы ---
+
+    def _write_json(self, path: str, payload: Dict[str, Any]):
+        """Атомарно записывает JSON (через временный файл), чтобы не оставить битый кэш при падении."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, separators=(',', ':'), default=str)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка записи warm-start кэша {path}: {e}", exc_info=True)
@@ -1,4 +1,5 @@
 from fastapi import WebSocket, WebSocketDisconnect, APIRouter, Request # Импортируем APIRouter и Request
+import asyncio
 import json
 import traceback
 
@@ -7,7 +8,7 @@ import traceback
 from src.market_data_service import MarketDataService # Импортируем КЛАСС
 
 # Импортируем модель возможности (для сериализации)
-from src.market_data_service import ArbitrageOpportunity # Импортируем модель
+from src.data_models import ArbitrageOpportunity # Импортируем модель
 
 
 # --- Создаем APIRouter ---
@@ -58,16 +59,18 @@ async def websocket_endpoint_final(websocket: WebSocket):
         while True:
              # Ждем сообщения из очереди (это блокирующая операция для этой корутины)
              # Она разблокируется, когда в очередь будет что-то положено (_notify_ws_subscribers)
-             message = await client_queue.get()
+             item = await client_queue.get()
 
              # Проверяем сигнал остановки (если мы будем его использовать, например, None)
-             if message is None:
+             if item is None:
                   # Получен сигнал остановки, выходим из цикла
                   print(f"WS: Получен сигнал остановки для клиента {websocket.client.host}:{websocket.client.port}.")
                   break
 
-             # Отправляем сообщение (JSON строку) клиенту по WebSocket
+             # Отправляем сообщение (JSON строку) клиенту по WebSocket и учитываем задержку от постановки в очередь
+             message, enqueued_ms = item
              await websocket.send_text(message)
+             service.latency.observe_send(enqueued_ms)
              # print(f"WS: Отправлено сообщение клиенту {websocket.client.host}:{websocket.client.port}.")
 
 